@@ -0,0 +1,230 @@
+import argparse
+import asyncio
+import logging
+import os
+from datetime import date, datetime, time, timedelta, timezone
+from pathlib import Path
+from typing import Callable, Dict, Optional
+from zoneinfo import ZoneInfo
+
+from dotenv import load_dotenv
+from pymongo import DeleteMany, ReplaceOne
+
+from archive import archived_before
+from branches import DEFAULT_BRANCH_ID
+
+
+logger = logging.getLogger(__name__)
+
+GROUP_BY = ("day", "hour", "dish", "category", "table")
+UNCATEGORIZED = "Uncategorized"
+BUCKET_FORMAT = "%Y-%m-%dT%H"
+
+
+def _field(key: str) -> str:
+    # Map keys become field names, which may not contain "." or "$"
+    return key.replace(".", "．").replace("$", "＄")
+
+
+def _key(field: str) -> str:
+    return field.replace("．", ".").replace("＄", "$")
+
+
+class SalesRollups:
+    """One branch's hourly sales totals in `db.sales_rollups`, one document per local hour.
+
+    Checkout records each order with a single `$inc` on its hour's document:
+    order count, revenue and items, plus per-dish, per-category and
+    per-table maps. Reports read at most 24 documents per day instead of
+    scanning `orders`. `rebuild()` recomputes whole days from `orders` with an
+    aggregation pipeline, for backfill or to correct drift from failed
+    increments; run it for days that are closed, since increments that land
+    during a rebuild of the same day are overwritten, and not yet archived.
+    """
+
+    def __init__(self, db, category_of: Callable[[str], Optional[str]], tz: str = "UTC",
+                 branch_id: str = DEFAULT_BRANCH_ID):
+        self.db = db
+        self.branch_id = branch_id
+        self.category_of = category_of
+        self.tz_name = tz
+        self.tz = ZoneInfo(tz)
+
+    def _bucket(self, timestamp: datetime) -> dict:
+        local = timestamp.astimezone(self.tz).replace(minute=0, second=0, microsecond=0)
+        return {
+            "_id": f"{self.branch_id}:{local.strftime(BUCKET_FORMAT)}",
+            "branch_id": self.branch_id,
+            "day": local.date().isoformat(),
+            "hour": local.hour,
+            "start": local.astimezone(timezone.utc),
+        }
+
+    def _category(self, dish_id: str) -> str:
+        return self.category_of(dish_id) or UNCATEGORIZED
+
+    async def record(self, order: dict):
+        bucket = self._bucket(order["timestamp"])
+        table = _field(str(order["table_number"]))
+        inc: Dict[str, float] = {
+            "orders": 1,
+            "revenue": order["total"],
+            "items": sum(item["quantity"] for item in order["items"]),
+            f"tables.{table}.orders": 1,
+            f"tables.{table}.revenue": order["total"],
+        }
+        names = {}
+        for item in order["items"]:
+            dish = _field(item["dish_id"])
+            category = _field(self._category(item["dish_id"]))
+            revenue = item["dish_price"] * item["quantity"]
+            for prefix in (f"dishes.{dish}", f"categories.{category}"):
+                inc[f"{prefix}.quantity"] = inc.get(f"{prefix}.quantity", 0) + item["quantity"]
+                inc[f"{prefix}.revenue"] = inc.get(f"{prefix}.revenue", 0) + revenue
+            names[f"dishes.{dish}.name"] = item["dish_name"]
+        try:
+            await self.db.sales_rollups.update_one(
+                {"_id": bucket["_id"]},
+                {"$inc": inc, "$set": names, "$setOnInsert": {k: v for k, v in bucket.items() if k != "_id"}},
+                upsert=True,
+            )
+        except Exception:
+            # Checkout has already succeeded; a rebuild of the day corrects the totals
+            logger.exception("Sales rollup update failed for order %s", order["id"])
+
+    def _range(self, start: date, end: date) -> dict:
+        prefix = f"{self.branch_id}:"
+        return {"$gte": f"{prefix}{start.isoformat()}T00", "$lte": f"{prefix}{end.isoformat()}T23"}
+
+    async def report(self, start: date, end: date, group_by: str = "day") -> dict:
+        docs = await self.db.sales_rollups.find({"_id": self._range(start, end)}).sort("_id", 1).to_list(None)
+        groups: Dict = {}
+        for doc in docs:
+            if group_by in ("day", "hour"):
+                group = groups.setdefault(doc[group_by], {"orders": 0, "revenue": 0.0, "items": 0})
+                group["orders"] += doc["orders"]
+                group["revenue"] += doc["revenue"]
+                group["items"] += doc["items"]
+                continue
+            source = {"dish": "dishes", "category": "categories", "table": "tables"}[group_by]
+            for field, values in doc.get(source, {}).items():
+                key = int(_key(field)) if group_by == "table" else _key(field)
+                group = groups.setdefault(key, {})
+                for metric, value in values.items():
+                    if metric == "name":
+                        group[metric] = value
+                    else:
+                        group[metric] = group.get(metric, 0) + value
+
+        rows = [{"key": key, **{k: round(v, 2) if k == "revenue" else v for k, v in group.items()}}
+                for key, group in groups.items()]
+        if group_by in ("day", "hour"):
+            rows.sort(key=lambda row: row["key"])
+        else:
+            rows.sort(key=lambda row: -row["revenue"])
+        return {
+            "start": start.isoformat(),
+            "end": end.isoformat(),
+            "group_by": group_by,
+            "orders": sum(doc["orders"] for doc in docs),
+            "revenue": round(sum(doc["revenue"] for doc in docs), 2),
+            "items": sum(doc["items"] for doc in docs),
+            "groups": rows,
+        }
+
+    async def rebuild(self, start: date, end: date) -> int:
+        """Recompute the rollups for local days `start`..`end` from `orders`; returns buckets written."""
+        lower = datetime.combine(start, time(), self.tz).astimezone(timezone.utc)
+        upper = datetime.combine(end + timedelta(days=1), time(), self.tz).astimezone(timezone.utc)
+        archived = await archived_before(self.db)
+        if archived is not None and lower < archived:
+            # Those orders are no longer in `orders`; a rebuild would drop their totals
+            raise ValueError(f"Orders before {archived.isoformat()} are archived and cannot be rebuilt")
+        match = {"$match": {"branch_id": self.branch_id, "timestamp": {"$gte": lower, "$lt": upper}}}
+        bucket = {"$dateToString": {"format": BUCKET_FORMAT, "date": "$timestamp", "timezone": self.tz_name}}
+
+        buckets: Dict[str, dict] = {}
+
+        def rollup(key: str) -> dict:
+            doc = buckets.get(key)
+            if doc is None:
+                local = datetime.strptime(key, BUCKET_FORMAT).replace(tzinfo=self.tz)
+                doc = buckets[key] = {
+                    **self._bucket(local), "orders": 0, "revenue": 0.0, "items": 0,
+                    "dishes": {}, "categories": {}, "tables": {},
+                }
+            return doc
+
+        by_table = self.db.orders.aggregate([
+            match,
+            {"$group": {
+                "_id": {"bucket": bucket, "table": "$table_number"},
+                "orders": {"$sum": 1},
+                "revenue": {"$sum": "$total"},
+            }},
+        ])
+        async for row in by_table:
+            doc = rollup(row["_id"]["bucket"])
+            doc["orders"] += row["orders"]
+            doc["revenue"] += row["revenue"]
+            doc["tables"][_field(str(row["_id"]["table"]))] = {"orders": row["orders"], "revenue": row["revenue"]}
+
+        by_dish = self.db.orders.aggregate([
+            match,
+            {"$unwind": "$items"},
+            {"$group": {
+                "_id": {"bucket": bucket, "dish": "$items.dish_id"},
+                "name": {"$last": "$items.dish_name"},
+                "quantity": {"$sum": "$items.quantity"},
+                "revenue": {"$sum": {"$multiply": ["$items.dish_price", "$items.quantity"]}},
+            }},
+        ])
+        async for row in by_dish:
+            doc = rollup(row["_id"]["bucket"])
+            doc["items"] += row["quantity"]
+            dish_id = row["_id"]["dish"]
+            doc["dishes"][_field(dish_id)] = {"name": row["name"], "quantity": row["quantity"], "revenue": row["revenue"]}
+            category = doc["categories"].setdefault(_field(self._category(dish_id)), {"quantity": 0, "revenue": 0.0})
+            category["quantity"] += row["quantity"]
+            category["revenue"] += row["revenue"]
+
+        keys = [doc["_id"] for doc in buckets.values()]
+        operations = [DeleteMany({"_id": {**self._range(start, end), "$nin": keys}})]
+        operations += [ReplaceOne({"_id": doc["_id"]}, doc, upsert=True) for doc in buckets.values()]
+        await self.db.sales_rollups.bulk_write(operations, ordered=False)
+        return len(buckets)
+
+
+async def main(args):
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    load_dotenv(Path(__file__).parent / '.env')
+
+    client = AsyncIOMotorClient(os.environ['MONGO_URL'], tz_aware=True)
+    db = client[os.environ['DB_NAME']]
+    try:
+        dishes = await db.dishes.find({"branch_id": args.branch}, {"_id": 0, "id": 1, "category": 1}).to_list(None)
+        categories = {dish["id"]: dish["category"] for dish in dishes}
+        tz = args.tz or os.environ.get('ANALYTICS_TZ', os.environ.get('ORDER_NUMBER_TZ', 'UTC'))
+        rollups = SalesRollups(db, categories.get, tz=tz, branch_id=args.branch)
+
+        until = args.until or datetime.now(ZoneInfo(tz)).date() - timedelta(days=1)
+        day = args.since
+        while day <= until:
+            # One pipeline run per day keeps each aggregation small
+            written = await rollups.rebuild(day, day)
+            logger.info("Rebuilt %s for %s: %d hourly buckets", day.isoformat(), args.branch, written)
+            day += timedelta(days=1)
+        print(f"✓ Sales rollups rebuilt from {args.since.isoformat()} to {until.isoformat()}")
+    finally:
+        client.close()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Rebuild hourly sales rollups from the orders collection.")
+    parser.add_argument("--since", type=date.fromisoformat, required=True, help="first local day to rebuild (YYYY-MM-DD)")
+    parser.add_argument("--until", type=date.fromisoformat, help="last local day to rebuild (default: yesterday)")
+    parser.add_argument("--tz", help="reporting time zone (default: ANALYTICS_TZ, ORDER_NUMBER_TZ or UTC)")
+    parser.add_argument("--branch", default=DEFAULT_BRANCH_ID, help=f"branch to rebuild (default: {DEFAULT_BRANCH_ID})")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,165 @@
+import argparse
+import asyncio
+import logging
+import os
+import zlib
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import AsyncIterator, Dict, List, Optional
+
+import bson
+from bson.codec_options import CodecOptions
+from dotenv import load_dotenv
+from pymongo import ReplaceOne
+
+from branches import DEFAULT_BRANCH_ID
+from kitchen import ACTIVE_STATUSES
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BLOCK_SIZE = 500
+DEFAULT_RETENTION_DAYS = 90
+# Everything older than this (in db.counters) has left the hot collections
+ARCHIVE_WATERMARK_ID = "orders_archived_before"
+
+_CODEC_OPTIONS = CodecOptions(tz_aware=True)
+
+
+def _pack(docs: List[dict]) -> bytes:
+    return zlib.compress(b"".join(bson.encode(doc) for doc in docs))
+
+
+def _unpack(data: bytes) -> List[dict]:
+    return bson.decode_all(zlib.decompress(data), _CODEC_OPTIONS)
+
+
+async def archived_before(db) -> Optional[datetime]:
+    doc = await db.counters.find_one({"_id": ARCHIVE_WATERMARK_ID})
+    return doc["value"] if doc else None
+
+
+class OrderArchive:
+    """Cold storage for orders and notifications past the hot retention window.
+
+    `archive(before)` moves served orders older than `before` out of
+    `db.orders` in blocks of `block_size`. Each block is one
+    `db.order_archive` document holding the orders as zlib-compressed BSON
+    (dates and all), indexed on `(kind, start)` for range reads, and
+    `db.archived_orders` maps each order id to its block. Notifications
+    are moved the same way, without the id map. Blocks are written before
+    the hot rows are deleted, and a block's id comes from its first
+    document, so an interrupted run can simply be repeated.
+
+    `find_order()` is what `get_order` falls back to. Decoded blocks are
+    kept in a small LRU since orders placed together are looked up together.
+    """
+
+    def __init__(self, db, block_size: int = DEFAULT_BLOCK_SIZE, cache_blocks: int = 16):
+        self.db = db
+        self.block_size = block_size
+        self.cache_blocks = cache_blocks
+        self._blocks: OrderedDict = OrderedDict()
+
+    async def _move(self, collection, kind: str, query: dict, index: bool) -> int:
+        moved = 0
+        while True:
+            cursor = collection.find(query, {"_id": 0}).sort([("timestamp", 1), ("id", 1)]).limit(self.block_size)
+            docs = await cursor.to_list(None)
+            if not docs:
+                return moved
+            first, last = docs[0], docs[-1]
+            block_id = f"{kind}:{first['timestamp'].isoformat()}:{first['id']}"
+            await self.db.order_archive.replace_one({"_id": block_id}, {
+                "kind": kind,
+                "start": first["timestamp"],
+                "end": last["timestamp"],
+                "count": len(docs),
+                "data": _pack(docs),
+            }, upsert=True)
+            if index:
+                await self.db.archived_orders.bulk_write(
+                    [ReplaceOne({"_id": doc["id"]}, {"block": block_id}, upsert=True) for doc in docs],
+                    ordered=False,
+                )
+            await collection.delete_many({"id": {"$in": [doc["id"] for doc in docs]}})
+            moved += len(docs)
+            logger.info("Archived %d %s up to %s", len(docs), kind, last["timestamp"].isoformat())
+
+    async def archive(self, before: datetime) -> Dict[str, int]:
+        """Move orders and notifications older than `before` to the archive; returns counts moved.
+
+        Orders still moving through the kitchen, or with an unfinished
+        checkout, stay hot whatever their age. Orders from before the
+        kitchen workflow are marked served by the migrations in indexes.py,
+        so they are archived like any other.
+        """
+        orders = await self._move(self.db.orders, "orders", {
+            "timestamp": {"$lt": before},
+            "status": {"$nin": list(ACTIVE_STATUSES)},
+            "checkout_pending": {"$exists": False},
+        }, index=True)
+        notifications = await self._move(self.db.notifications, "notifications", {
+            "timestamp": {"$lt": before},
+        }, index=False)
+        await self.db.counters.update_one({"_id": ARCHIVE_WATERMARK_ID}, {"$max": {"value": before}}, upsert=True)
+        return {"orders": orders, "notifications": notifications}
+
+    async def _block(self, block_id: str) -> List[dict]:
+        docs = self._blocks.get(block_id)
+        if docs is not None:
+            self._blocks.move_to_end(block_id)
+            return docs
+        block = await self.db.order_archive.find_one({"_id": block_id}, {"data": 1})
+        docs = _unpack(block["data"]) if block else []
+        self._blocks[block_id] = docs
+        if len(self._blocks) > self.cache_blocks:
+            self._blocks.popitem(last=False)
+        return docs
+
+    async def orders_between(self, branch_id: str, start: datetime, end: datetime) -> AsyncIterator[dict]:
+        """A branch's archived orders with `start <= timestamp < end`, oldest first, one block in memory at a time."""
+        blocks = self.db.order_archive.find(
+            {"kind": "orders", "start": {"$lt": end}, "end": {"$gte": start}}, {"data": 1}
+        ).sort("start", 1).batch_size(1)
+        async for block in blocks:
+            for doc in _unpack(block["data"]):
+                # Orders archived before branches existed have no branch_id
+                if doc.get("branch_id", DEFAULT_BRANCH_ID) == branch_id and start <= doc["timestamp"] < end:
+                    yield doc
+
+    async def find_order(self, order_id: str) -> Optional[dict]:
+        entry = await self.db.archived_orders.find_one({"_id": order_id})
+        if entry is None:
+            return None
+        return next((doc for doc in await self._block(entry["block"]) if doc["id"] == order_id), None)
+
+
+async def main(args):
+    from motor.motor_asyncio import AsyncIOMotorClient
+    from unread_counter import UnreadCounter
+
+    load_dotenv(Path(__file__).parent / '.env')
+
+    client = AsyncIOMotorClient(os.environ['MONGO_URL'], tz_aware=True)
+    db = client[os.environ['DB_NAME']]
+    try:
+        days = args.older_than_days or int(os.environ.get('ORDER_RETENTION_DAYS', DEFAULT_RETENTION_DAYS))
+        before = datetime.now(timezone.utc) - timedelta(days=days)
+        moved = await OrderArchive(db, block_size=args.block_size).archive(before)
+        # Archived notifications no longer count as unread
+        await UnreadCounter(db).reconcile()
+        print(f"✓ Archived {moved['orders']} orders and {moved['notifications']} notifications "
+              f"older than {before.isoformat()}")
+    finally:
+        client.close()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Move old orders and notifications into the compressed archive.")
+    parser.add_argument("--older-than-days", type=int, default=None,
+                        help=f"hot retention in days (default: ORDER_RETENTION_DAYS or {DEFAULT_RETENTION_DAYS})")
+    parser.add_argument("--block-size", type=int, default=DEFAULT_BLOCK_SIZE, help="documents per archive block")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,107 @@
+"""Cold start of an API worker: importing `server`, then warming up until ready.
+
+Every run is a fresh interpreter, as when a worker is added at peak. Reports
+the median time to import `server` and the median time from there until the
+app's lifespan has finished warming up (connect, ping, indexes, menu) on the
+chosen engine. Exits non-zero when the median import time exceeds the
+budget, so a heavy module-level import shows up in CI rather than in
+production scaling; --breakdown lists what the import spends its time on.
+
+    python benchmarks/cold_start.py --runs 15 --budget-ms 800
+    python benchmarks/cold_start.py --breakdown
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+
+# Median import time allowed on a development machine; FastAPI and pymongo
+# account for most of it
+DEFAULT_BUDGET_MS = 800
+
+CHILD = """
+import asyncio, json, time
+started = time.perf_counter()
+import server
+imported = time.perf_counter()
+
+async def warm_up():
+    app = server.create_app()
+    async with app.router.lifespan_context(app):
+        return time.perf_counter()
+
+ready = asyncio.run(warm_up())
+print(json.dumps({"import_ms": (imported - started) * 1000, "ready_ms": (ready - imported) * 1000}))
+"""
+
+
+def child_env(engine: str) -> dict:
+    return {**os.environ, "STORAGE_ENGINE": engine}
+
+
+def measure(engine: str) -> dict:
+    result = subprocess.run(
+        [sys.executable, "-c", CHILD], cwd=ROOT_DIR, env=child_env(engine),
+        capture_output=True, text=True, check=True,
+    )
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def breakdown(engine: str, top: int) -> list:
+    """(cumulative ms, module) for the modules `server` imports directly, slowest first."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import server"], cwd=ROOT_DIR, env=child_env(engine),
+        capture_output=True, text=True, check=True,
+    )
+    # A module's imports are listed before it, one level deeper
+    modules = []
+    for line in result.stderr.splitlines():
+        _, cumulative, name = line.split("|")
+        if not cumulative.strip().isdigit():
+            continue
+        depth = (len(name) - len(name.lstrip())) // 2
+        if depth == 0:
+            if name.strip() == "server":
+                return sorted(modules, reverse=True)[:top]
+            modules = []
+        elif depth == 1:
+            modules.append((int(cumulative) / 1000, name.strip()))
+    return []
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=10, help="fresh interpreters to start")
+    parser.add_argument("--engine", default="memory", choices=("memory", "mongo"),
+                        help="storage engine to warm up against (mongo needs MONGO_URL)")
+    parser.add_argument("--budget-ms", type=float, default=DEFAULT_BUDGET_MS, help="allowed median import time")
+    parser.add_argument("--breakdown", action="store_true", help="list the slowest imports of server")
+    args = parser.parse_args()
+
+    # The first run also compiles bytecode for the repo's own modules
+    measure(args.engine)
+    runs = [measure(args.engine) for _ in range(args.runs)]
+    import_ms = statistics.median(run["import_ms"] for run in runs)
+    ready_ms = statistics.median(run["ready_ms"] for run in runs)
+    print(f"Cold start over {args.runs} runs ({args.engine} engine)")
+    print(f"  import server    p50 {import_ms:7.1f} ms   max {max(run['import_ms'] for run in runs):7.1f} ms")
+    print(f"  warm-up to ready p50 {ready_ms:7.1f} ms   max {max(run['ready_ms'] for run in runs):7.1f} ms")
+
+    if args.breakdown:
+        print("\nSlowest direct imports of server (cumulative)")
+        for ms, module in breakdown(args.engine, 10):
+            print(f"  {module:28} {ms:7.1f} ms")
+
+    if import_ms > args.budget_ms:
+        print(f"\nImport time {import_ms:.1f} ms is over the {args.budget_ms:.0f} ms budget")
+        sys.exit(1)
+    print(f"\nWithin the {args.budget_ms:.0f} ms import budget")
+
+
+if __name__ == "__main__":
+    main()
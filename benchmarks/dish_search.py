@@ -0,0 +1,91 @@
+"""Dish search latency on a large synthetic catalog.
+
+Builds the search index over --dishes generated dishes, then replays
+search-as-you-type sequences (every prefix of each query) and reports
+p50/p99 per keystroke, cold (first time a prefix is seen) and warm.
+
+    python benchmarks/dish_search.py --dishes 30000
+"""
+import argparse
+import random
+import statistics
+import sys
+import time
+import uuid
+from pathlib import Path
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT_DIR))
+
+from dish_search import DishIndex  # noqa: E402
+
+WORDS = (
+    "masala chai espresso cappuccino latte americano mocha green lemon iced tea club veg grilled paneer "
+    "chocolate chip oatmeal butter double margherita pepperoni veggie farmhouse classic cheese chicken "
+    "burger pizza sandwich cookies spicy smoky creamy crispy toasted garlic herb honey caramel hazelnut"
+).split()
+CATEGORIES = ("Coffee", "Tea", "Sandwich", "Cookies", "Pizza", "Burger")
+QUERIES = ("paneer sandwich", "choco", "capucino", "spicy chicken burger", "margerita", "iced lemon tea", "haz")
+
+
+def make_dishes(count: int, rng: random.Random) -> list:
+    return [{
+        "id": str(uuid.UUID(int=rng.getrandbits(128))),
+        "name": " ".join(rng.sample(WORDS, 3)).title() + f" {i}",
+        "description": " ".join(rng.choices(WORDS, k=8)),
+        "price": float(rng.choice((20, 30, 50, 70, 100, 120))),
+        "category": rng.choice(CATEGORIES),
+        "image_url": "",
+        "is_popular": rng.random() < 0.05,
+    } for i in range(count)]
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(pct / 100 * len(ordered)))]
+
+
+def keystrokes(index: DishIndex, **filters) -> list:
+    latencies = []
+    for query in QUERIES:
+        for end in range(1, len(query) + 1):
+            started = time.perf_counter()
+            index.search(query[:end], limit=20, **filters)
+            latencies.append(time.perf_counter() - started)
+    return latencies
+
+
+def report(label: str, latencies: list):
+    print(f"{label:34} p50 {statistics.median(latencies) * 1e6:8.1f}us  p99 {percentile(latencies, 99) * 1e6:8.1f}us"
+          f"  max {max(latencies) * 1e6:8.1f}us")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--dishes", type=int, default=30000)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    dishes = make_dishes(args.dishes, rng)
+    index = DishIndex()
+    started = time.perf_counter()
+    index.sync(dishes)
+    print(f"Indexed {len(index)} dishes in {time.perf_counter() - started:.2f}s")
+
+    added = dishes + make_dishes(1, rng)
+    started = time.perf_counter()
+    index.sync(added)
+    print(f"Incremental sync of one new dish: {(time.perf_counter() - started) * 1000:.1f}ms")
+
+    report("keystrokes, cold", keystrokes(index))
+    report("keystrokes, warm", keystrokes(index))
+    report("warm + price/popular filters", keystrokes(index, min_price=50, max_price=100, popular=False))
+    index.search("", sort="price_asc")
+    started = time.perf_counter()
+    index.search("", sort="price_asc", offset=100, limit=20)
+    print(f"Browse by price, page 6:           {(time.perf_counter() - started) * 1e6:8.1f}us")
+
+
+if __name__ == "__main__":
+    main()
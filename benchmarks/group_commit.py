@@ -0,0 +1,146 @@
+"""Checkout write throughput with and without group commit.
+
+Drives the API's own commit step (`server._commit_checkout`) for --orders
+checkouts from --concurrency concurrent requests: once directly (order
+insert with its pending marker, notification, unread counter, cart clear,
+marker removal; or one transaction where the deployment supports them) and
+once through the GroupCommitter, which shares those writes between the
+requests of a batch. Each checkout clears a real cart row. Reports orders
+per second, p50/p99 commit latency and database round trips per order.
+
+`--engine memory` needs no services. With `--engine mongo` it uses a
+scratch database (`<DB_NAME>_bench` unless --db is given) in MONGO_URL,
+dropped afterwards.
+
+    python benchmarks/group_commit.py --engine memory --orders 5000 --concurrency 200
+    python benchmarks/group_commit.py --engine mongo --orders 5000 --concurrency 200
+
+Memory engine, 5000 orders, 200 concurrent, 5 ms flush, batches of 200
+(median of three runs):
+
+    direct        2.1k orders/s   p50 79 ms   p99 343 ms   5.0 round trips/order
+    group commit  2.1k orders/s   p50 88 ms   p99 185 ms   0.03 round trips/order
+
+The memory engine has no network latency and does the same work either
+way, so throughput is level there and the latencies are mostly the 200
+requests queueing for the one event loop; what group commit removes is the
+round trips, each of which is a network hop (and a pool connection) on
+MongoDB.
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import time
+from pathlib import Path
+
+from dotenv import load_dotenv
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT_DIR))
+
+
+def commands_issued(server) -> int:
+    # Every database command, from either engine, is recorded by the metrics listener
+    return sum(count for _, _, count in server.metrics.commands._series.values())
+
+
+def make_checkout(server, i: int):
+    session_id = f"bench-{i}"
+    dish = {"dish_id": "dish_cappuccino", "dish_name": "Cappuccino", "dish_price": 50.0, "quantity": 2}
+    cart_row = server.CartItem(session_id=session_id, dish_image="", **dish).model_dump()
+    order = server.Order(
+        order_number=f"BENCH{i:07d}",
+        session_id=session_id,
+        table_number=i % 40 + 1,
+        items=[dish],
+        total=100.0,
+    ).model_dump()
+    return cart_row, order, server._order_notification(order).model_dump()
+
+
+async def run(server, orders: int, concurrency: int) -> dict:
+    db = server.db
+    for collection in (db.orders, db.notifications, db.cart):
+        await collection.delete_many({})
+    checkouts = [make_checkout(server, i) for i in range(orders)]
+    await db.cart.insert_many([cart_row for cart_row, _, _ in checkouts])
+
+    latencies = []
+    pending = iter(checkouts)
+
+    async def worker():
+        for cart_row, order, notification in pending:
+            started = time.perf_counter()
+            await server._commit_checkout(order, notification, [cart_row["id"]])
+            latencies.append(time.perf_counter() - started)
+
+    commands = commands_issued(server)
+    started = time.perf_counter()
+    await asyncio.gather(*[worker() for _ in range(concurrency)])
+    # The direct path removes the pending markers in the background; they count too
+    await asyncio.gather(*list(server._background_tasks))
+    elapsed = time.perf_counter() - started
+    commands = commands_issued(server) - commands
+
+    assert await db.orders.count_documents({}) == orders
+    assert await db.cart.count_documents({}) == 0
+    latencies.sort()
+    return {
+        "orders": orders,
+        "seconds": round(elapsed, 3),
+        "orders_per_second": round(orders / elapsed, 1),
+        "p50_ms": round(statistics.median(latencies) * 1000, 2),
+        "p99_ms": round(latencies[int(len(latencies) * 0.99) - 1] * 1000, 2),
+        "round_trips_per_order": round(commands / orders, 2),
+    }
+
+
+async def main(args):
+    load_dotenv(ROOT_DIR / '.env')
+    os.environ["STORAGE_ENGINE"] = args.engine
+    if args.engine == "mongo":
+        os.environ["DB_NAME"] = args.db or os.environ['DB_NAME'] + "_bench"
+    os.environ["MONGO_MAX_POOL_SIZE"] = str(args.pool_size)
+    import server
+    from order_ingest import GroupCommitter
+
+    server.connect_database()
+    results = {"engine": args.engine, "concurrency": args.concurrency}
+    try:
+        # Indexes, unread counter and transaction detection, as a worker would
+        await server.warm_up()
+        results["transactions"] = server.use_transactions
+        results["direct"] = await run(server, args.orders, args.concurrency)
+
+        server.order_ingest = GroupCommitter(
+            server.db, max_queue=args.concurrency * 2, flush_interval=args.flush_ms / 1000,
+            max_batch=args.batch_size, unread_counter=server.unread_counter,
+        )
+        server.order_ingest.start()
+        results["group_commit"] = await run(server, args.orders, args.concurrency)
+        results["group_commit"]["batches"] = server.order_ingest.batches
+    finally:
+        if args.engine == "mongo":
+            await server.client.drop_database(server.db.name)
+        await server.close_database()
+
+    print(json.dumps(results, indent=2))
+    if args.output:
+        Path(args.output).write_text(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--engine", default="memory", choices=("memory", "mongo"),
+                        help="storage engine (mongo needs MONGO_URL and DB_NAME)")
+    parser.add_argument("--orders", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=200)
+    parser.add_argument("--flush-ms", type=float, default=5)
+    parser.add_argument("--batch-size", type=int, default=200)
+    parser.add_argument("--pool-size", type=int, default=100)
+    parser.add_argument("--db", help="scratch database name for --engine mongo (dropped afterwards)")
+    parser.add_argument("--output", help="also write the results to this JSON file")
+    asyncio.run(main(parser.parse_args()))
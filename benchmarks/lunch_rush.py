@@ -0,0 +1,289 @@
+"""Lunch-rush load test for the Cafetaria API.
+
+Simulates N tables browsing the menu, building carts and checking out while
+dashboards poll the notification endpoints, then reports throughput and
+p50/p95/p99 latency per route plus database round trips per request.
+
+In-process (default) the real FastAPI app is driven through httpx's ASGI
+transport, using whichever STORAGE_ENGINE is configured (`--engine memory`
+needs no services). With `--url` it targets a running uvicorn instead; DB
+round trips are then not available.
+
+    python benchmarks/lunch_rush.py --engine memory --tables 200
+    python benchmarks/lunch_rush.py --url http://localhost:8000 --tables 50
+    python benchmarks/lunch_rush.py --compare benchmarks/results/baseline.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import statistics
+import sys
+import time
+import uuid
+from collections import defaultdict
+from contextlib import asynccontextmanager
+from datetime import datetime, timezone
+from pathlib import Path
+
+import httpx
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+RESULTS_DIR = Path(__file__).resolve().parent / "results"
+
+CATALOG = {
+    "Coffee": 50, "Tea": 20, "Sandwich": 50, "Pizza": 100, "Burger": 70, "Cookies": 30,
+}
+
+
+class CommandCounter:
+    """Counts database round trips for the in-process app."""
+
+    def __init__(self, db):
+        self.db = db
+        self.started = 0
+        if hasattr(db, "operations"):
+            self.total = lambda: sum(db.operations.values())
+        else:
+            from pymongo import monitoring
+
+            counter = self
+
+            class Listener(monitoring.CommandListener):
+                def started(self, event):
+                    counter.started += 1
+
+                def succeeded(self, event):
+                    pass
+
+                def failed(self, event):
+                    pass
+
+            monitoring.register(Listener())
+            self.total = lambda: self.started
+
+
+class Recorder:
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+
+    async def call(self, client: httpx.AsyncClient, route: str, method: str, url: str, **kwargs):
+        started = time.perf_counter()
+        try:
+            response = await client.request(method, url, **kwargs)
+        except httpx.HTTPError:
+            self.errors[route] += 1
+            return None
+        self.latencies[route].append(time.perf_counter() - started)
+        if response.status_code >= 400 and response.status_code != 404:
+            self.errors[route] += 1
+        return response
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * len(ordered) + 0.5)) - 1)]
+
+
+async def ensure_catalog(client: httpx.AsyncClient, dishes_per_category: int):
+    dishes = (await client.get("/api/dishes")).json()
+    if dishes:
+        return dishes
+    for order, (category, price) in enumerate(CATALOG.items(), start=1):
+        await client.post("/api/categories", json={"name": category, "image_url": "", "order": order})
+        for i in range(dishes_per_category):
+            await client.post("/api/dishes", json={
+                "name": f"{category} {i + 1}",
+                "description": f"House {category.lower()} number {i + 1}",
+                "price": price,
+                "category": category,
+                "image_url": "",
+                "is_popular": i == 0,
+            })
+    return (await client.get("/api/dishes")).json()
+
+
+async def table(client, recorder: Recorder, dishes, table_number: int, rng: random.Random, think: float):
+    session_id = f"bench-{uuid.uuid4()}"
+    await recorder.call(client, "GET /api/categories", "GET", "/api/categories")
+    await recorder.call(client, "GET /api/dishes/popular", "GET", "/api/dishes/popular")
+    await recorder.call(client, "GET /api/dishes", "GET", "/api/dishes")
+    for dish in rng.sample(dishes, k=min(len(dishes), rng.randint(2, 5))):
+        for _ in range(rng.randint(1, 3)):
+            await recorder.call(client, "POST /api/cart/add", "POST", "/api/cart/add",
+                                json={"session_id": session_id, "dish_id": dish["id"]})
+            await asyncio.sleep(think * rng.random())
+    await recorder.call(client, "GET /api/cart/{session_id}", "GET", f"/api/cart/{session_id}")
+    await recorder.call(client, "POST /api/orders", "POST", "/api/orders",
+                        json={"session_id": session_id, "table_number": table_number})
+    await recorder.call(client, "GET /api/orders/history/{session_id}", "GET", f"/api/orders/history/{session_id}")
+
+
+async def dashboard(client, recorder: Recorder, interval: float, stop: asyncio.Event):
+    while not stop.is_set():
+        await recorder.call(client, "GET /api/notifications/unread/count", "GET", "/api/notifications/unread/count")
+        await recorder.call(client, "GET /api/notifications", "GET", "/api/notifications")
+        try:
+            await asyncio.wait_for(stop.wait(), interval)
+        except asyncio.TimeoutError:
+            pass
+
+
+async def profile_round_trips(client, counter: CommandCounter, dishes) -> dict:
+    """Run each route once, serially, and record the DB round trips it caused."""
+    session_id = f"profile-{uuid.uuid4()}"
+    dish = dishes[0]
+    steps = [
+        ("GET /api/categories", "GET", "/api/categories", None),
+        ("GET /api/dishes", "GET", "/api/dishes", None),
+        ("GET /api/dishes/popular", "GET", "/api/dishes/popular", None),
+        ("POST /api/cart/add", "POST", "/api/cart/add", {"session_id": session_id, "dish_id": dish["id"]}),
+        ("GET /api/cart/{session_id}", "GET", f"/api/cart/{session_id}", None),
+        ("POST /api/orders", "POST", "/api/orders", {"session_id": session_id, "table_number": 1}),
+        ("GET /api/orders/history/{session_id}", "GET", f"/api/orders/history/{session_id}", None),
+        ("GET /api/notifications", "GET", "/api/notifications", None),
+        ("GET /api/notifications/unread/count", "GET", "/api/notifications/unread/count", None),
+    ]
+    trips = {}
+    for route, method, url, body in steps:
+        before = counter.total()
+        await client.request(method, url, json=body)
+        # Let fire-and-forget follow-up writes land before reading the counter
+        await asyncio.sleep(0.01)
+        trips[route] = counter.total() - before
+    return trips
+
+
+@asynccontextmanager
+async def open_client(args):
+    if args.url:
+        async with httpx.AsyncClient(base_url=args.url, timeout=30) as client:
+            yield client, None
+        return
+
+    os.environ["STORAGE_ENGINE"] = args.engine
+    sys.path.insert(0, str(ROOT_DIR))
+    import server
+
+    server.connect_database()
+    counter = CommandCounter(server.db)
+    async with server.app.router.lifespan_context(server.app):
+        transport = httpx.ASGITransport(app=server.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=30) as client:
+            yield client, counter
+
+
+async def run(args) -> dict:
+    rng = random.Random(args.seed)
+    recorder = Recorder()
+    async with open_client(args) as (client, counter):
+        dishes = await ensure_catalog(client, args.dishes_per_category)
+        round_trips = await profile_round_trips(client, counter, dishes) if counter else {}
+
+        semaphore = asyncio.Semaphore(args.concurrency)
+
+        async def seated(number):
+            async with semaphore:
+                await table(client, recorder, dishes, number % 100 + 1, rng, args.think)
+
+        stop = asyncio.Event()
+        dashboards = [asyncio.create_task(dashboard(client, recorder, args.poll_interval, stop))
+                      for _ in range(args.dashboards)]
+        db_before = counter.total() if counter else None
+        started = time.perf_counter()
+        await asyncio.gather(*[seated(i) for i in range(args.tables)])
+        elapsed = time.perf_counter() - started
+        stop.set()
+        await asyncio.gather(*dashboards)
+        db_total = counter.total() - db_before if counter else None
+
+    total_requests = sum(len(v) for v in recorder.latencies.values())
+    routes = {}
+    for route, samples in sorted(recorder.latencies.items()):
+        routes[route] = {
+            "requests": len(samples),
+            "errors": recorder.errors.get(route, 0),
+            "rps": round(len(samples) / elapsed, 1),
+            "p50_ms": round(statistics.median(samples) * 1000, 3),
+            "p95_ms": round(percentile(samples, 95) * 1000, 3),
+            "p99_ms": round(percentile(samples, 99) * 1000, 3),
+            "db_round_trips": round_trips.get(route),
+        }
+    return {
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "target": args.url or f"in-process ({args.engine})",
+        "scenario": {
+            "tables": args.tables, "concurrency": args.concurrency, "dashboards": args.dashboards,
+            "poll_interval": args.poll_interval, "think": args.think, "dishes": len(dishes), "seed": args.seed,
+        },
+        "elapsed_seconds": round(elapsed, 3),
+        "requests": total_requests,
+        "throughput_rps": round(total_requests / elapsed, 1),
+        "db_round_trips_per_request": round(db_total / total_requests, 2) if db_total is not None else None,
+        "routes": routes,
+    }
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list:
+    regressions = []
+    for route, current in results["routes"].items():
+        previous = baseline.get("routes", {}).get(route)
+        if not previous:
+            continue
+        for metric in ("p95_ms", "p99_ms"):
+            if previous[metric] and current[metric] > previous[metric] * (1 + tolerance):
+                regressions.append(f"{route} {metric}: {previous[metric]} -> {current[metric]}")
+        if previous.get("db_round_trips") is not None and current.get("db_round_trips") is not None \
+                and current["db_round_trips"] > previous["db_round_trips"]:
+            regressions.append(f"{route} db_round_trips: {previous['db_round_trips']} -> {current['db_round_trips']}")
+    return regressions
+
+
+def print_report(results: dict):
+    print(f"{results['target']}: {results['requests']} requests in {results['elapsed_seconds']}s "
+          f"({results['throughput_rps']} req/s, {results['db_round_trips_per_request']} DB round trips/request)")
+    print(f"{'route':42} {'reqs':>6} {'rps':>8} {'p50':>8} {'p95':>8} {'p99':>8} {'db':>4} {'err':>4}")
+    for route, r in results["routes"].items():
+        trips = "-" if r["db_round_trips"] is None else r["db_round_trips"]
+        print(f"{route:42} {r['requests']:>6} {r['rps']:>8} {r['p50_ms']:>8} {r['p95_ms']:>8} {r['p99_ms']:>8} "
+              f"{trips:>4} {r['errors']:>4}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--url", help="target a running server instead of the in-process app")
+    parser.add_argument("--engine", default=os.environ.get("STORAGE_ENGINE", "memory"), choices=["memory", "mongo"],
+                        help="storage engine for the in-process app")
+    parser.add_argument("--tables", type=int, default=200, help="number of table sessions to simulate")
+    parser.add_argument("--concurrency", type=int, default=50, help="tables active at the same time")
+    parser.add_argument("--dashboards", type=int, default=4, help="dashboards polling notifications")
+    parser.add_argument("--poll-interval", type=float, default=0.5, help="dashboard poll interval in seconds")
+    parser.add_argument("--think", type=float, default=0.0, help="max think time between cart taps in seconds")
+    parser.add_argument("--dishes-per-category", type=int, default=4)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="results file (default: benchmarks/results/lunch_rush-<time>.json)")
+    parser.add_argument("--compare", help="baseline results file to check for regressions")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed p95/p99 slowdown vs baseline")
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args))
+    print_report(results)
+
+    output = Path(args.output) if args.output else \
+        RESULTS_DIR / f"lunch_rush-{datetime.now().strftime('%Y%m%d-%H%M%S')}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(results, indent=2))
+    print(f"Results written to {output}")
+
+    if args.compare:
+        regressions = compare(results, json.loads(Path(args.compare).read_text()), args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
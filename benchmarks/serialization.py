@@ -0,0 +1,136 @@
+"""CPU cost of response serialization for the list endpoints.
+
+Compares, per response, the stock FastAPI path (validate the documents
+against `response_model`, `jsonable_encoder`, `json.dumps`) with the fast
+path the routes use now (orjson over trusted documents, or pre-encoded
+bytes for the menu). Then drives the in-process app on the memory engine
+and reports CPU time per request for the same routes end to end.
+
+    python benchmarks/serialization.py --rows 50 --iterations 2000
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import List
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT_DIR))
+os.environ["STORAGE_ENGINE"] = "memory"
+
+import httpx  # noqa: E402
+from fastapi.responses import JSONResponse  # noqa: E402
+from fastapi.routing import serialize_response  # noqa: E402
+from fastapi.utils import create_response_field  # noqa: E402
+
+import server  # noqa: E402
+from fast_json import FastJSONResponse, trusted_response  # noqa: E402
+
+
+def make_docs(rows: int):
+    now = datetime.now(timezone.utc)
+    dishes = [{
+        "id": str(uuid.uuid4()), "name": f"Dish {i}", "description": f"House dish number {i}",
+        "price": 50.0, "category": f"Category {i % 6}", "image_url": "https://example.com/dish.jpeg",
+        "is_popular": i % 10 == 0,
+    } for i in range(rows)]
+    orders = [{
+        "id": str(uuid.uuid4()), "order_number": f"ORD{i:05d}", "session_id": "bench", "table_number": i % 40 + 1,
+        "items": [{"dish_id": d["id"], "dish_name": d["name"], "dish_price": d["price"], "quantity": 2}
+                  for d in dishes[:3]],
+        "total": 300.0, "status": "pending", "timestamp": now - timedelta(seconds=i),
+    } for i in range(rows)]
+    notifications = [{
+        "id": str(uuid.uuid4()), "order_id": o["id"], "order_number": o["order_number"],
+        "table_number": o["table_number"], "message": f"An order is placed from table {o['table_number']}.",
+        "read": False, "timestamp": o["timestamp"],
+    } for o in orders]
+    return dishes, orders, notifications
+
+
+async def stock_body(field, docs) -> bytes:
+    content = await serialize_response(field=field, response_content=docs)
+    return JSONResponse(content).body
+
+
+async def cpu_per_call(fn, iterations: int) -> float:
+    await fn()
+    started = time.process_time()
+    for _ in range(iterations):
+        await fn()
+    return (time.process_time() - started) / iterations
+
+
+async def serialization(rows: int, iterations: int) -> list:
+    dishes, orders, notifications = make_docs(rows)
+    menu_body = FastJSONResponse([server.Dish(**d).model_dump() for d in dishes]).body
+    cases = [
+        ("GET /api/dishes", List[server.Dish], dishes, lambda: FastJSONResponse(menu_body)),
+        ("GET /api/orders/history/{session_id}", List[server.Order], orders,
+         lambda: trusted_response(orders, server.ORDER_DEFAULTS)),
+        ("GET /api/notifications", List[server.Notification], notifications,
+         lambda: trusted_response(notifications, server.NOTIFICATION_DEFAULTS)),
+    ]
+    results = []
+    for route, type_, docs, fast in cases:
+        field = create_response_field(name="Response_" + route, type_=type_, mode="serialization")
+
+        async def stock():
+            return await stock_body(field, docs)
+
+        async def fast_path():
+            return fast().body
+
+        before = await cpu_per_call(stock, iterations)
+        after = await cpu_per_call(fast_path, iterations)
+        results.append((route, before, after))
+    return results
+
+
+async def end_to_end(rows: int, iterations: int) -> list:
+    dishes, orders, notifications = make_docs(rows)
+    server.connect_database()
+    await server.db.dishes.insert_many([dict(d) for d in dishes])
+    await server.db.orders.insert_many([dict(o) for o in orders])
+    await server.db.notifications.insert_many([dict(n) for n in notifications])
+    routes = [
+        ("GET /api/dishes", "/api/dishes"),
+        ("GET /api/orders/history/{session_id}", f"/api/orders/history/bench?limit={rows}"),
+        ("GET /api/notifications", f"/api/notifications?limit={rows}"),
+    ]
+    results = []
+    async with server.app.router.lifespan_context(server.app):
+        transport = httpx.ASGITransport(app=server.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            for route, url in routes:
+                async def call():
+                    response = await client.get(url)
+                    response.raise_for_status()
+
+                results.append((route, await cpu_per_call(call, iterations)))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=50, help="documents per response (history/notification page size)")
+    parser.add_argument("--iterations", type=int, default=2000)
+    args = parser.parse_args()
+
+    print(f"Serialization CPU per response, {args.rows} rows")
+    print(f"{'route':42} {'stock us':>10} {'fast us':>10} {'speedup':>8}")
+    for route, before, after in asyncio.run(serialization(args.rows, args.iterations)):
+        print(f"{route:42} {before * 1e6:>10.1f} {after * 1e6:>10.1f} {before / after:>7.1f}x")
+
+    print(f"\nIn-process request CPU (client + app, memory engine), {args.rows} rows")
+    print(f"{'route':42} {'us/request':>10}")
+    for route, cpu in asyncio.run(end_to_end(args.rows, max(1, args.iterations // 10))):
+        print(f"{route:42} {cpu * 1e6:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
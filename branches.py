@@ -0,0 +1,80 @@
+import asyncio
+import re
+from typing import Awaitable, Callable, Dict, Generic, Iterable, List, Optional, TypeVar
+
+from starlette.requests import HTTPConnection
+
+# Documents written before branches existed belong to this branch
+DEFAULT_BRANCH_ID = "main"
+BRANCH_HEADER = "X-Branch-Id"
+# Query parameter alternative for clients that cannot set headers (EventSource, WebSocket)
+BRANCH_PARAM = "branch"
+
+_BRANCH_ID = re.compile(r"^[a-z0-9][a-z0-9_-]{0,31}$")
+
+T = TypeVar("T")
+
+
+def parse_branch_ids(value: str) -> List[str]:
+    branch_ids = [branch_id.strip() for branch_id in value.split(",") if branch_id.strip()]
+    invalid = [branch_id for branch_id in branch_ids if not _BRANCH_ID.match(branch_id)]
+    if invalid:
+        raise ValueError(f"Invalid branch ids: {', '.join(invalid)}")
+    return branch_ids
+
+
+def request_branch_id(connection: HTTPConnection) -> str:
+    return (connection.headers.get(BRANCH_HEADER) or connection.query_params.get(BRANCH_PARAM)
+            or DEFAULT_BRANCH_ID)
+
+
+class BranchRegistry(Generic[T]):
+    """Per-branch in-process state (caches, queues), created on first use.
+
+    Only `branch_ids` are served, so the number of states stays bounded
+    whatever ids clients send. `factory(branch_id)` builds a branch's state
+    and `start(state)` runs once before the state is first handed out, e.g.
+    to load its caches; `stop(state)` runs at shutdown.
+    """
+
+    def __init__(self, branch_ids: Iterable[str], factory: Callable[[str], T],
+                 start: Optional[Callable[[T], Awaitable[None]]] = None,
+                 stop: Optional[Callable[[T], Awaitable[None]]] = None):
+        self.branch_ids = list(branch_ids)
+        self.factory = factory
+        self._start = start
+        self._stop = stop
+        self._states: Dict[str, T] = {}
+        self._lock = asyncio.Lock()
+
+    def __contains__(self, branch_id: str) -> bool:
+        return branch_id in self.branch_ids
+
+    def loaded(self) -> List[T]:
+        return list(self._states.values())
+
+    def peek(self, branch_id: str) -> Optional[T]:
+        """The branch's state if it has been created, without creating it."""
+        return self._states.get(branch_id)
+
+    async def get(self, branch_id: str) -> T:
+        """Raises KeyError for branches that are not served."""
+        state = self._states.get(branch_id)
+        if state is not None:
+            return state
+        if branch_id not in self.branch_ids:
+            raise KeyError(branch_id)
+        async with self._lock:
+            state = self._states.get(branch_id)
+            if state is None:
+                state = self.factory(branch_id)
+                if self._start is not None:
+                    await self._start(state)
+                self._states[branch_id] = state
+        return state
+
+    async def stop(self):
+        states, self._states = self._states, {}
+        if self._stop is not None:
+            for state in states.values():
+                await self._stop(state)
@@ -0,0 +1,350 @@
+import asyncio
+import logging
+import time
+import uuid
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Set
+
+from pymongo import DeleteOne, ReturnDocument, UpdateOne
+from pymongo.errors import DuplicateKeyError
+
+from image_store import variant_url
+
+
+logger = logging.getLogger(__name__)
+
+# Fields copied from the dish when a row is first inserted
+SNAPSHOT_FIELDS = ("id", "dish_name", "dish_price", "dish_image")
+
+
+def cart_snapshot(dish: dict) -> dict:
+    return {
+        "id": str(uuid.uuid4()),
+        "dish_name": dish["name"],
+        "dish_price": dish["price"],
+        # Carts show small images
+        "dish_image": variant_url(dish["image_url"], "thumb"),
+    }
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+class CartStore:
+    """One branch's session carts in `db.cart`, one row per (branch_id, session_id, dish_id).
+
+    Every write stamps `updated_at`, which the cart TTL index uses to expire
+    carts that were abandoned instead of cleared or checked out.
+    """
+
+    def __init__(self, db, projection: dict, branch_id: str):
+        self.db = db
+        self.projection = projection
+        self.branch_id = branch_id
+
+    def _row(self, session_id: str, dish_id: str) -> dict:
+        return {"branch_id": self.branch_id, "session_id": session_id, "dish_id": dish_id}
+
+    def start(self):
+        pass
+
+    async def stop(self):
+        pass
+
+    async def items(self, session_id: str) -> List[dict]:
+        query = {"branch_id": self.branch_id, "session_id": session_id}
+        return await self.db.cart.find(query, self.projection).to_list(None)
+
+    async def _upsert(self, session_id: str, dish_id: str, update: dict) -> dict:
+        query = self._row(session_id, dish_id)
+        try:
+            return await self.db.cart.find_one_and_update(
+                query, update, projection=self.projection, upsert=True, return_document=ReturnDocument.AFTER
+            )
+        except DuplicateKeyError:
+            # A concurrent upsert for the same item won the insert; this retry matches it
+            return await self.db.cart.find_one_and_update(
+                query, update, projection=self.projection, upsert=True, return_document=ReturnDocument.AFTER
+            )
+
+    async def add(self, session_id: str, dish: dict) -> dict:
+        return await self._upsert(session_id, dish["id"], {
+            "$inc": {"quantity": 1},
+            "$set": {"updated_at": _now()},
+            "$setOnInsert": cart_snapshot(dish),
+        })
+
+    async def set_quantity(self, session_id: str, dish: dict, quantity: int) -> dict:
+        return await self._upsert(session_id, dish["id"], {
+            "$set": {"quantity": quantity, "updated_at": _now()},
+            "$setOnInsert": cart_snapshot(dish),
+        })
+
+    async def decrement(self, session_id: str, dish_id: str) -> Optional[dict]:
+        """Take one off the row; returns None if there was no row, quantity 0 once it is removed."""
+        item = await self.db.cart.find_one_and_update(
+            {**self._row(session_id, dish_id), "quantity": {"$gt": 1}},
+            {"$inc": {"quantity": -1}, "$set": {"updated_at": _now()}},
+            projection=self.projection,
+            return_document=ReturnDocument.AFTER,
+        )
+        if item:
+            return item
+        if not await self.remove(session_id, dish_id):
+            return None
+        return {**self._row(session_id, dish_id), "quantity": 0}
+
+    async def remove(self, session_id: str, dish_id: str) -> bool:
+        result = await self.db.cart.delete_one(self._row(session_id, dish_id))
+        return result.deleted_count > 0
+
+    async def clear(self, session_id: str):
+        await self.db.cart.delete_many({"branch_id": self.branch_id, "session_id": session_id})
+
+    async def sync(self, session_id: str, quantities: Dict[str, int], dishes: Dict[str, dict]) -> List[dict]:
+        """Make the cart hold exactly `quantities` (dish_id -> quantity > 0) in one bulk write."""
+        current = {item["dish_id"]: item for item in await self.items(session_id)}
+        now = _now()
+        operations = []
+        items = []
+        for dish_id in current:
+            if dish_id not in quantities:
+                operations.append(DeleteOne(self._row(session_id, dish_id)))
+        for dish_id, quantity in quantities.items():
+            existing = current.get(dish_id)
+            if existing and existing["quantity"] == quantity:
+                items.append(existing)
+                continue
+            snapshot = cart_snapshot(dishes[dish_id])
+            operations.append(UpdateOne(
+                self._row(session_id, dish_id),
+                {"$set": {"quantity": quantity, "updated_at": now}, "$setOnInsert": snapshot},
+                upsert=True,
+            ))
+            base = existing or {**self._row(session_id, dish_id), **snapshot}
+            items.append({**base, "quantity": quantity})
+
+        if operations:
+            await self.db.cart.bulk_write(operations, ordered=False)
+        return items
+
+    def checked_out(self, session_id: str, cart_ids: List[str]):
+        """Called once checkout has removed `cart_ids` from `db.cart`."""
+
+
+class _SessionCart:
+    __slots__ = ("items", "dirty", "updated_at", "touched")
+
+    def __init__(self, items: Dict[str, dict]):
+        self.items = items
+        # dish_ids changed since the last flush; absent from `items` means deleted
+        self.dirty: Set[str] = set()
+        self.updated_at = _now()
+        self.touched = time.monotonic()
+
+
+class CachedCartStore(CartStore):
+    """Hot session carts held in memory and written behind to `db.cart`.
+
+    Sessions are spread over `shards` LRU maps by hash. Each shard holds at
+    most `max_sessions / shards` carts and loads misses under its own lock,
+    so one slow load never blocks sessions on other shards. Changes are
+    marked dirty and written by a flusher every `flush_interval` seconds in
+    a single unordered bulk write. Carts leave memory when their shard is
+    full or after `idle_ttl` seconds without use, once their changes are
+    written; `db.cart` itself is expired by the TTL index.
+
+    Every worker keeps its own copy, so this requires session affinity (or
+    a single worker) in front of the API.
+    """
+
+    def __init__(self, db, projection: dict, branch_id: str, shards: int = 16, max_sessions: int = 10000,
+                 idle_ttl: float = 900.0, flush_interval: float = 1.0):
+        super().__init__(db, projection, branch_id)
+        self.idle_ttl = idle_ttl
+        self.flush_interval = flush_interval
+        self.shard_capacity = max(1, max_sessions // shards)
+        self._shards: List[OrderedDict] = [OrderedDict() for _ in range(shards)]
+        self._locks = [asyncio.Lock() for _ in range(shards)]
+        # Carts with unwritten changes, including ones already evicted from their shard
+        self._dirty: Dict[str, _SessionCart] = {}
+        # Carts whose changes are being written by the current flush
+        self._flushing: Dict[str, _SessionCart] = {}
+        self._flush_lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return sum(len(shard) for shard in self._shards)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._flush_forever())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        await self.flush()
+
+    # -- cache
+
+    async def _cart(self, session_id: str) -> _SessionCart:
+        index = hash(session_id) % len(self._shards)
+        shard = self._shards[index]
+        cart = shard.get(session_id)
+        if cart is None:
+            async with self._locks[index]:
+                cart = shard.get(session_id)
+                if cart is None:
+                    self.misses += 1
+                    cart = self._dirty.get(session_id) or self._flushing.get(session_id)
+                    if cart is None:
+                        rows = await super().items(session_id)
+                        cart = _SessionCart({row["dish_id"]: row for row in rows})
+                    shard[session_id] = cart
+                    while len(shard) > self.shard_capacity:
+                        # Dirty carts stay reachable through _dirty until flushed
+                        shard.popitem(last=False)
+                    cart.touched = time.monotonic()
+                    return cart
+        self.hits += 1
+        shard.move_to_end(session_id)
+        cart.touched = time.monotonic()
+        return cart
+
+    def _changed(self, session_id: str, cart: _SessionCart, dish_id: str):
+        cart.dirty.add(dish_id)
+        cart.updated_at = _now()
+        self._dirty[session_id] = cart
+
+    # -- write-behind
+
+    async def flush(self):
+        async with self._flush_lock:
+            if not self._dirty:
+                return
+            pending, self._dirty = self._dirty, {}
+            self._flushing = pending
+            operations = []
+            taken = []
+            for session_id, cart in pending.items():
+                for dish_id in cart.dirty:
+                    query = self._row(session_id, dish_id)
+                    item = cart.items.get(dish_id)
+                    if item is None:
+                        operations.append(DeleteOne(query))
+                        continue
+                    operations.append(UpdateOne(query, {
+                        "$set": {"quantity": item["quantity"], "updated_at": cart.updated_at},
+                        "$setOnInsert": {field: item[field] for field in SNAPSHOT_FIELDS},
+                    }, upsert=True))
+                taken.append((session_id, cart, cart.dirty))
+                cart.dirty = set()
+            try:
+                if operations:
+                    await self.db.cart.bulk_write(operations, ordered=False)
+            except Exception:
+                for session_id, cart, dirty in taken:
+                    cart.dirty |= dirty
+                    self._dirty.setdefault(session_id, cart)
+                raise
+            finally:
+                self._flushing = {}
+
+    def _evict_idle(self):
+        cutoff = time.monotonic() - self.idle_ttl
+        for shard in self._shards:
+            while shard:
+                session_id, cart = next(iter(shard.items()))
+                if cart.touched > cutoff or session_id in self._dirty:
+                    break
+                shard.popitem(last=False)
+
+    async def _flush_forever(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+                self._evict_idle()
+            except Exception:
+                logger.exception("Cart write-behind flush failed")
+
+    # -- cart operations
+
+    async def items(self, session_id: str) -> List[dict]:
+        cart = await self._cart(session_id)
+        return [dict(item) for item in cart.items.values()]
+
+    async def add(self, session_id: str, dish: dict) -> dict:
+        cart = await self._cart(session_id)
+        item = cart.items.get(dish["id"])
+        if item is None:
+            item = cart.items[dish["id"]] = {**self._row(session_id, dish["id"]), **cart_snapshot(dish), "quantity": 0}
+        item["quantity"] += 1
+        self._changed(session_id, cart, dish["id"])
+        return dict(item)
+
+    async def set_quantity(self, session_id: str, dish: dict, quantity: int) -> dict:
+        cart = await self._cart(session_id)
+        item = cart.items.get(dish["id"])
+        if item is None:
+            item = cart.items[dish["id"]] = {**self._row(session_id, dish["id"]), **cart_snapshot(dish)}
+        item["quantity"] = quantity
+        self._changed(session_id, cart, dish["id"])
+        return dict(item)
+
+    async def decrement(self, session_id: str, dish_id: str) -> Optional[dict]:
+        cart = await self._cart(session_id)
+        item = cart.items.get(dish_id)
+        if item is None:
+            return None
+        item["quantity"] -= 1
+        if item["quantity"] <= 0:
+            del cart.items[dish_id]
+            item["quantity"] = 0
+        self._changed(session_id, cart, dish_id)
+        return dict(item)
+
+    async def remove(self, session_id: str, dish_id: str) -> bool:
+        cart = await self._cart(session_id)
+        if cart.items.pop(dish_id, None) is None:
+            return False
+        self._changed(session_id, cart, dish_id)
+        return True
+
+    async def clear(self, session_id: str):
+        cart = await self._cart(session_id)
+        for dish_id in list(cart.items):
+            del cart.items[dish_id]
+            self._changed(session_id, cart, dish_id)
+
+    async def sync(self, session_id: str, quantities: Dict[str, int], dishes: Dict[str, dict]) -> List[dict]:
+        cart = await self._cart(session_id)
+        for dish_id in [dish_id for dish_id in cart.items if dish_id not in quantities]:
+            del cart.items[dish_id]
+            self._changed(session_id, cart, dish_id)
+        for dish_id, quantity in quantities.items():
+            item = cart.items.get(dish_id)
+            if item is not None and item["quantity"] == quantity:
+                continue
+            if item is None:
+                item = cart.items[dish_id] = {**self._row(session_id, dish_id), **cart_snapshot(dishes[dish_id])}
+            item["quantity"] = quantity
+            self._changed(session_id, cart, dish_id)
+        return [dict(cart.items[dish_id]) for dish_id in quantities]
+
+    def checked_out(self, session_id: str, cart_ids: List[str]):
+        index = hash(session_id) % len(self._shards)
+        cart = self._shards[index].get(session_id) or self._dirty.get(session_id) or self._flushing.get(session_id)
+        if cart is None:
+            return
+        checked_out = set(cart_ids)
+        for dish_id, item in list(cart.items.items()):
+            if item["id"] in checked_out:
+                del cart.items[dish_id]
+                # Also deletes any copy an in-flight flush writes after checkout
+                self._changed(session_id, cart, dish_id)
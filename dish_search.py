@@ -0,0 +1,266 @@
+import bisect
+import re
+import unicodedata
+from collections import OrderedDict
+from typing import Dict, List, Optional, Set, Tuple
+
+SORTS = ("relevance", "price_asc", "price_desc", "name", "popular")
+
+# Terms shorter than this must match exactly or as a prefix
+TYPO_MIN_LENGTH = 4
+
+_WORD = re.compile(r"\w+")
+
+# Sort keys; relevance walks the "popular" order within each match tier
+_SORT_KEYS = {
+    "price_asc": lambda dish: (dish["price"], dish["name"]),
+    "price_desc": lambda dish: (-dish["price"], dish["name"]),
+    "name": lambda dish: (dish["name"].casefold(),),
+    "popular": lambda dish: (not dish["is_popular"], dish["name"]),
+}
+
+
+def tokenize(text: str) -> List[str]:
+    folded = unicodedata.normalize("NFKD", text.casefold())
+    return _WORD.findall("".join(ch for ch in folded if not unicodedata.combining(ch)))
+
+
+def _deletes(token: str) -> Set[str]:
+    return {token[:i] + token[i + 1:] for i in range(len(token))}
+
+
+def _slots(mask: int) -> List[int]:
+    """Set bit positions of `mask`, ascending, working a 64-bit word at a time."""
+    slots = []
+    data = mask.to_bytes((mask.bit_length() + 63) // 64 * 8, "little")
+    for offset in range(0, len(data), 8):
+        word = int.from_bytes(data[offset:offset + 8], "little")
+        while word:
+            low = word & -word
+            slots.append(offset * 8 + low.bit_length() - 1)
+            word ^= low
+    return slots
+
+
+class DishIndex:
+    """In-memory search over dish names and descriptions.
+
+    Every dish occupies a slot, and each token maps to bitmaps (Python ints)
+    of the slots whose name, or name or description, contain it, so filters
+    and multi-term queries are a few big-integer ANDs. A sorted vocabulary
+    answers prefix lookups with bisect, and a one-deletion neighbourhood
+    index (symmetric delete) adds tokens one edit away for typo tolerance.
+
+    Relevance ranks dishes by how many query terms match their name, then
+    popular dishes first, then by name. Results are produced by walking a
+    precomputed order for the requested sort and stopping once the page is
+    full, so a query never sorts the whole candidate set. `sync()` applies
+    only the dishes that changed since the last call.
+    """
+
+    def __init__(self, cache_size: int = 1024):
+        self.cache_size = cache_size
+        self._dishes: Dict[str, dict] = {}
+        self._slot_of: Dict[str, int] = {}
+        self._slots: List[Optional[dict]] = []
+        self._free: List[int] = []
+        self._tokens: Dict[int, Tuple[Set[str], Set[str]]] = {}
+        self._name: Dict[str, int] = {}
+        self._text: Dict[str, int] = {}
+        self._vocabulary: List[str] = []
+        self._neighbours: Dict[str, Set[str]] = {}
+        self._all = 0
+        self._popular = 0
+        self._categories: Dict[str, int] = {}
+        # (sort key, slot) in order, per sort used so far; patched as dishes change
+        self._sorted: Dict[str, List[tuple]] = {}
+        # Derived from the above; dropped whenever the catalog changes
+        self._orders: Dict[str, Tuple[List[int], List[int]]] = {}
+        self._terms: OrderedDict = OrderedDict()
+
+    def __len__(self):
+        return len(self._dishes)
+
+    # -- maintenance
+
+    def _add(self, dish: dict):
+        slot = self._free.pop() if self._free else len(self._slots)
+        if slot == len(self._slots):
+            self._slots.append(None)
+        bit = 1 << slot
+        name_tokens = set(tokenize(dish["name"]))
+        text_tokens = name_tokens | set(tokenize(dish.get("description", "")))
+        for token in text_tokens:
+            if token not in self._text:
+                self._text[token] = 0
+                bisect.insort(self._vocabulary, token)
+                for variant in _deletes(token):
+                    self._neighbours.setdefault(variant, set()).add(token)
+            self._text[token] |= bit
+        for token in name_tokens:
+            self._name[token] = self._name.get(token, 0) | bit
+        self._all |= bit
+        if dish["is_popular"]:
+            self._popular |= bit
+        self._categories[dish["category"]] = self._categories.get(dish["category"], 0) | bit
+        for sort, entries in self._sorted.items():
+            bisect.insort(entries, (*_SORT_KEYS[sort](dish), slot))
+        self._slots[slot] = dish
+        self._slot_of[dish["id"]] = slot
+        self._tokens[slot] = (name_tokens, text_tokens)
+        self._dishes[dish["id"]] = dish
+
+    def _remove(self, dish_id: str):
+        dish = self._dishes.pop(dish_id)
+        slot = self._slot_of.pop(dish_id)
+        keep = ~(1 << slot)
+        name_tokens, text_tokens = self._tokens.pop(slot)
+        for token in name_tokens:
+            self._name[token] &= keep
+            if not self._name[token]:
+                del self._name[token]
+        for token in text_tokens:
+            self._text[token] &= keep
+            if self._text[token]:
+                continue
+            del self._text[token]
+            del self._vocabulary[bisect.bisect_left(self._vocabulary, token)]
+            for variant in _deletes(token):
+                tokens = self._neighbours.get(variant)
+                if tokens is not None:
+                    tokens.discard(token)
+                    if not tokens:
+                        del self._neighbours[variant]
+        self._all &= keep
+        self._popular &= keep
+        self._categories[dish["category"]] &= keep
+        for sort, entries in self._sorted.items():
+            del entries[bisect.bisect_left(entries, (*_SORT_KEYS[sort](dish), slot))]
+        self._slots[slot] = None
+        self._free.append(slot)
+
+    def sync(self, dishes: List[dict]):
+        """Bring the index in line with the catalog, touching only changed dishes."""
+        current = {dish["id"]: dish for dish in dishes}
+        changed = False
+        for dish_id in [dish_id for dish_id in self._dishes if dish_id not in current]:
+            self._remove(dish_id)
+            changed = True
+        for dish_id, dish in current.items():
+            previous = self._dishes.get(dish_id)
+            if previous == dish:
+                continue
+            if previous is not None:
+                self._remove(dish_id)
+            self._add(dish)
+            changed = True
+        if changed:
+            self._orders.clear()
+            self._terms.clear()
+            # Rebuilt now so the first search after a change does not pay for it
+            for sort in {"popular", *self._sorted}:
+                self._order(sort)
+
+    # -- queries
+
+    def _order(self, sort: str) -> Tuple[List[int], List[int]]:
+        """Live slots in `sort` order, and each slot's position in it."""
+        cached = self._orders.get(sort)
+        if cached is not None:
+            return cached
+        entries = self._sorted.get(sort)
+        if entries is None:
+            key = _SORT_KEYS[sort]
+            entries = self._sorted[sort] = sorted(
+                (*key(dish), slot) for slot, dish in enumerate(self._slots) if dish is not None
+            )
+        slots = [entry[-1] for entry in entries]
+        rank = [0] * len(self._slots)
+        for position, slot in enumerate(slots):
+            rank[slot] = position
+        self._orders[sort] = (slots, rank)
+        return slots, rank
+
+    def _term(self, term: str) -> Tuple[int, int]:
+        """Bitmaps of dishes matching `term` anywhere, and in the name (prefix matches only)."""
+        cached = self._terms.get(term)
+        if cached is not None:
+            self._terms.move_to_end(term)
+            return cached
+        text = name = 0
+        start = bisect.bisect_left(self._vocabulary, term)
+        for token in self._vocabulary[start:bisect.bisect_right(self._vocabulary, term + "\uffff", lo=start)]:
+            text |= self._text[token]
+            name |= self._name.get(token, 0)
+        if len(term) >= TYPO_MIN_LENGTH:
+            typos = set(self._neighbours.get(term, ()))
+            for variant in _deletes(term):
+                if variant in self._text:
+                    typos.add(variant)
+                typos.update(self._neighbours.get(variant, ()))
+            for token in typos:
+                text |= self._text[token]
+        self._terms[term] = (text, name)
+        if len(self._terms) > self.cache_size:
+            self._terms.popitem(last=False)
+        return text, name
+
+    def _walk(self, mask: int, sort: str, wanted: int, accept) -> List[dict]:
+        """Up to `wanted` accepted dishes from `mask`, in `sort` order."""
+        order, rank = self._order(sort)
+        count = mask.bit_count()
+        if not count:
+            return []
+        results = []
+        if count < wanted * 64:
+            # Sparse: sort just the candidates
+            candidates = sorted(_slots(mask), key=rank.__getitem__)
+        else:
+            # Dense: scan the precomputed order; matches come quickly
+            bits = mask.to_bytes((mask.bit_length() + 7) // 8, "little")
+            size = len(bits)
+            candidates = (slot for slot in order if slot >> 3 < size and bits[slot >> 3] >> (slot & 7) & 1)
+        for slot in candidates:
+            dish = self._slots[slot]
+            if accept(dish):
+                results.append(dish)
+                if len(results) >= wanted:
+                    break
+        return results
+
+    def search(self, query: str = "", category: Optional[str] = None, min_price: Optional[float] = None,
+               max_price: Optional[float] = None, popular: Optional[bool] = None, sort: str = "relevance",
+               limit: int = 20, offset: int = 0) -> List[dict]:
+        candidates = self._all
+        if category is not None:
+            candidates &= self._categories.get(category, 0)
+        if popular is not None:
+            candidates &= self._popular if popular else ~self._popular
+        name_masks = []
+        for term in tokenize(query):
+            text, name = self._term(term)
+            candidates &= text
+            name_masks.append(name)
+
+        tiers = [candidates]
+        if sort == "relevance" and name_masks:
+            # at_least[k]: dishes whose name matches at least k of the terms
+            at_least = [candidates] + [0] * len(name_masks)
+            for name in name_masks:
+                for k in range(len(name_masks), 0, -1):
+                    at_least[k] |= at_least[k - 1] & name
+            tiers = [at_least[k] & ~(at_least[k + 1] if k < len(name_masks) else 0)
+                     for k in range(len(name_masks), -1, -1)]
+
+        def accept(dish: dict) -> bool:
+            if min_price is not None and dish["price"] < min_price:
+                return False
+            return max_price is None or dish["price"] <= max_price
+
+        wanted = offset + limit
+        results: List[dict] = []
+        for tier in tiers:
+            results += self._walk(tier, "popular" if sort == "relevance" else sort, wanted - len(results), accept)
+            if len(results) >= wanted:
+                break
+        return results[offset:wanted]
@@ -0,0 +1,50 @@
+from typing import Any, Dict, Iterable, Mapping, Optional
+
+import orjson
+from fastapi import Response
+
+
+# Aware UTC datetimes are written with a "Z" suffix, matching pydantic's JSON output
+_OPTIONS = orjson.OPT_UTC_Z
+
+
+def dumps(value: Any) -> bytes:
+    return orjson.dumps(value, option=_OPTIONS)
+
+
+class FastJSONResponse(Response):
+    """JSON response encoded with orjson; pre-encoded bytes are sent as-is."""
+
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        if isinstance(content, bytes):
+            return content
+        return dumps(content)
+
+
+def model_defaults(model) -> Dict[str, Any]:
+    """Plain (non-factory) field defaults, for documents written before a field existed."""
+    return {
+        name: field.default
+        for name, field in model.model_fields.items()
+        if not field.is_required() and field.default_factory is None
+    }
+
+
+def trusted_response(
+    docs: Iterable[dict],
+    defaults: Optional[Mapping[str, Any]] = None,
+    headers: Optional[Mapping[str, str]] = None,
+) -> FastJSONResponse:
+    """Encode documents read with a model's projection without re-validating them.
+
+    Only for data this service wrote itself: the route's `response_model`
+    still documents the shape, but FastAPI skips validation for a returned
+    Response, so missing defaults are filled in here instead.
+    """
+    if defaults:
+        docs = [{**defaults, **doc} for doc in docs]
+    else:
+        docs = list(docs)
+    return FastJSONResponse(docs, headers=headers)
@@ -0,0 +1,198 @@
+import asyncio
+import hashlib
+import logging
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional, Tuple
+
+from pymongo import ReplaceOne
+from pymongo.errors import DuplicateKeyError
+
+from fast_json import dumps
+
+
+logger = logging.getLogger(__name__)
+
+IDEMPOTENCY_HEADER = "Idempotency-Key"
+# Set on responses that return an order placed by an earlier request
+REPLAYED_HEADER = "Idempotent-Replayed"
+MAX_KEY_LENGTH = 255
+
+
+class RequestInProgress(Exception):
+    """Another request with the same key is still being processed."""
+
+
+class KeyReused(Exception):
+    """The key was first used for a request with different parameters."""
+
+
+class OutcomeUnknown(Exception):
+    """The write of order `order_id` failed in a way that may still have applied it."""
+
+    def __init__(self, order_id: str, cause: BaseException):
+        super().__init__(f"order {order_id} may or may not have been written: {cause}")
+        self.order_id = order_id
+        self.cause = cause
+
+
+def request_fingerprint(*parts) -> str:
+    return hashlib.sha256(dumps(parts)).hexdigest()
+
+
+def cart_key(session_id: str, cart_ids: Iterable[str]) -> str:
+    """Key for a checkout of the session's server-side cart without an Idempotency-Key.
+
+    Cart rows get new ids once a checkout clears them, so ordering the same
+    dishes again is a new key; only a retry of the same cart matches.
+    """
+    return f"cart:{request_fingerprint(session_id, sorted(cart_ids))}"
+
+
+def items_key(session_id: str, lines: Iterable[dict]) -> str:
+    """Key for a checkout of client-supplied items: the session and what it orders."""
+    quantities: Dict[str, int] = {}
+    for line in lines:
+        if line["quantity"] > 0:
+            quantities[line["dish_id"]] = quantities.get(line["dish_id"], 0) + line["quantity"]
+    return f"items:{request_fingerprint(session_id, sorted(quantities.items()))}"
+
+
+class IdempotencyStore:
+    """Remembers the order each checkout key produced, so retries get it back.
+
+    A request claims its key by inserting `{_id: key, order_id: None}` into
+    `db.idempotency_keys`. The claim is a short lease (`lease` seconds), so
+    a worker that dies mid-checkout does not block the key for long. Once
+    the order is written the record and its aliases get the order id in one
+    bulk write and live for the key's TTL; a TTL index on `expires_at` removes it afterwards. A retry
+    that finds the record gets the recorded order without any writes; one
+    that arrives while the claim is still open gets RequestInProgress.
+
+    Recent results are also kept in a bounded in-memory LRU, and concurrent
+    duplicates on the same worker wait for the first one instead of racing
+    it to the database, so a retry storm costs at most one read per key.
+    """
+
+    def __init__(self, db, fetch: Callable[[str], Awaitable[Optional[dict]]], lease: float = 30.0,
+                 cache_size: int = 10000):
+        self.db = db
+        self.fetch = fetch
+        self.lease = lease
+        self.cache_size = cache_size
+        self._cache: OrderedDict = OrderedDict()
+        self._pending: Dict[str, asyncio.Future] = {}
+        self.replayed = 0
+
+    def _cached(self, key: str, fingerprint: str) -> Optional[dict]:
+        entry = self._cache.get(key)
+        if entry is None:
+            return None
+        expires, recorded, order = entry
+        if expires <= time.monotonic():
+            del self._cache[key]
+            return None
+        if recorded != fingerprint:
+            raise KeyReused(key)
+        self._cache.move_to_end(key)
+        return order
+
+    def _remember(self, key: str, fingerprint: str, order: dict, ttl: float):
+        self._cache[key] = (time.monotonic() + ttl, fingerprint, order)
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    async def _claim(self, key: str, fingerprint: str) -> Optional[dict]:
+        """None once this request owns `key`; otherwise the order recorded for it."""
+        for _ in range(3):
+            now = datetime.now(timezone.utc)
+            try:
+                await self.db.idempotency_keys.insert_one({
+                    "_id": key,
+                    "fingerprint": fingerprint,
+                    "order_id": None,
+                    "expires_at": now + timedelta(seconds=self.lease),
+                })
+                return None
+            except DuplicateKeyError:
+                existing = await self.db.idempotency_keys.find_one({"_id": key})
+            if existing is None:
+                continue
+            if existing["expires_at"] <= now:
+                # Expired (the TTL monitor runs about once a minute) or an abandoned claim
+                await self.db.idempotency_keys.delete_one({"_id": key, "expires_at": existing["expires_at"]})
+                continue
+            if existing["fingerprint"] != fingerprint:
+                raise KeyReused(key)
+            if existing["order_id"] is None:
+                raise RequestInProgress(key)
+            order = await self.fetch(existing["order_id"])
+            if order is not None:
+                return order
+            # The order is gone (archived or deleted); treat the key as unused
+            await self.db.idempotency_keys.delete_one({"_id": key})
+        raise RequestInProgress(key)
+
+    async def _record(self, keys: List[str], fingerprint: str, order_id: str, ttl: float):
+        expires_at = datetime.now(timezone.utc) + timedelta(seconds=ttl)
+        record = {"fingerprint": fingerprint, "order_id": order_id, "expires_at": expires_at}
+        await self.db.idempotency_keys.bulk_write(
+            [ReplaceOne({"_id": key}, record, upsert=True) for key in keys], ordered=False
+        )
+
+    async def run(self, key: str, fingerprint: str, ttl: float, create: Callable[[], Awaitable[dict]],
+                  aliases: Iterable[str] = ()) -> Tuple[dict, bool]:
+        """The order for `key` and whether it was replayed rather than created.
+
+        `create()` runs only if no order is recorded for `key`; if it raises,
+        the key is released so the client can retry. If it raises
+        OutcomeUnknown the key is recorded with the order it may have placed
+        instead, so a retry replays that order if it exists and places it
+        again if not. Once it succeeds, `aliases` return the same order for
+        `ttl` too.
+        """
+        while True:
+            order = self._cached(key, fingerprint)
+            if order is not None:
+                self.replayed += 1
+                return order, True
+            pending = self._pending.get(key)
+            if pending is None:
+                break
+            # The first of several identical requests on this worker decides for all
+            await asyncio.shield(pending)
+
+        future = asyncio.get_running_loop().create_future()
+        self._pending[key] = future
+        try:
+            order = await self._claim(key, fingerprint)
+            if order is not None:
+                self.replayed += 1
+                self._remember(key, fingerprint, order, ttl)
+                return order, True
+            try:
+                order = await create()
+            except OutcomeUnknown as exc:
+                try:
+                    await self._record([key], fingerprint, exc.order_id, ttl)
+                except Exception:
+                    # The claim stays open until its lease runs out
+                    logger.exception("Could not record idempotency key %s", key)
+                raise
+            except BaseException:
+                await self.db.idempotency_keys.delete_one({"_id": key, "order_id": None})
+                raise
+            keys = [key, *aliases]
+            for name in keys:
+                self._remember(name, fingerprint, order, ttl)
+            try:
+                await self._record(keys, fingerprint, order["id"], ttl)
+            except Exception:
+                # The order is placed; only retries on other workers lose the dedupe
+                logger.exception("Could not record idempotency key %s", key)
+            return order, False
+        finally:
+            del self._pending[key]
+            future.set_result(None)
@@ -0,0 +1,239 @@
+import argparse
+import asyncio
+import hashlib
+import io
+import logging
+import math
+import os
+import re
+import uuid
+from pathlib import Path
+from typing import TYPE_CHECKING, Dict, Iterable, List, Optional
+
+from dotenv import load_dotenv
+from starlette.staticfiles import StaticFiles
+
+from menu_cache import menu_version_id
+
+if TYPE_CHECKING:
+    from PIL import Image
+
+
+logger = logging.getLogger(__name__)
+
+# Longest edge of each pre-generated variant; nothing is upscaled
+VARIANTS = {"thumb": 160, "card": 480, "full": 1280}
+FORMATS = ("webp", "jpeg")
+# What `image_url` points at for dishes and categories
+DEFAULT_VARIANT = "card"
+DEFAULT_FORMAT = "webp"
+INPUT_FORMATS = {"JPEG": "jpeg", "PNG": "png", "WEBP": "webp", "GIF": "gif"}
+# Served for a year and never revalidated: a digest's files never change
+CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+_DIGEST = re.compile(r"^[0-9a-f]{64}$")
+_LOCAL_URL = re.compile(r"/images/(?P<digest>[0-9a-f]{64})/(?P<variant>[a-z]+)\.(?P<format>[a-z]+)$")
+
+
+def variant_url(url: str, variant: str) -> str:
+    """The `variant` size of a local image URL; other URLs are returned unchanged."""
+    match = _LOCAL_URL.search(url or "")
+    if match is None or variant not in VARIANTS:
+        return url
+    return f"{url[:match.start('variant')]}{variant}.{match['format']}"
+
+
+class ImageStore:
+    """Content-addressed images on disk, with pre-generated size variants.
+
+    An ingested image is stored under the SHA-256 of its bytes as
+    `<root>/<digest>/original.<ext>`, next to one file per variant and
+    format (`card.webp`, `thumb.jpeg`, ...). Ingesting the same bytes again
+    is a no-op, and since a digest's files never change they are served
+    with an immutable, year-long Cache-Control. Variants are generated at
+    ingest time, so serving never touches Pillow.
+
+    `ingest()` is CPU-bound; call it from a worker thread in the API.
+    Pillow is only imported once an image is ingested, keeping it out of
+    the API's import time.
+    """
+
+    def __init__(self, root, base_url: str = "", max_bytes: int = 10 * 1024 * 1024):
+        self.root = Path(root)
+        self.base_url = base_url.rstrip("/")
+        self.max_bytes = max_bytes
+        self.root.mkdir(parents=True, exist_ok=True)
+
+    def url(self, digest: str, variant: str = DEFAULT_VARIANT, fmt: str = DEFAULT_FORMAT) -> str:
+        return f"{self.base_url}/images/{digest}/{variant}.{fmt}"
+
+    def urls(self, digest: str) -> Dict[str, Dict[str, str]]:
+        return {variant: {fmt: self.url(digest, variant, fmt) for fmt in FORMATS} for variant in VARIANTS}
+
+    def has(self, digest: str) -> bool:
+        directory = self.root / digest
+        return all((directory / f"{variant}.{fmt}").is_file() for variant in VARIANTS for fmt in FORMATS)
+
+    def ingest(self, data: bytes) -> str:
+        """Store `data` and its variants; returns the digest. Raises ValueError for non-images."""
+        if len(data) > self.max_bytes:
+            raise ValueError(f"Images are limited to {self.max_bytes} bytes")
+        digest = hashlib.sha256(data).hexdigest()
+        if self.has(digest):
+            return digest
+        from PIL import Image
+
+        try:
+            image = Image.open(io.BytesIO(data))
+            ext = INPUT_FORMATS.get(image.format)
+            if ext is None:
+                raise ValueError(f"Unsupported image format: {image.format}")
+            directory = self.root / digest
+            directory.mkdir(exist_ok=True)
+            _write(directory / f"original.{ext}", data)
+            self._variants(image, directory)
+        except (OSError, Image.DecompressionBombError) as exc:
+            raise ValueError(f"Not a readable image: {exc}") from exc
+        return digest
+
+    def rebuild(self, digest: str):
+        """Regenerate the variants of a stored image, e.g. after VARIANTS changed."""
+        from PIL import Image
+
+        original = next((self.root / digest).glob("original.*"))
+        with Image.open(original) as image:
+            self._variants(image, self.root / digest)
+
+    def _variants(self, image: "Image.Image", directory: Path):
+        from PIL import Image, ImageOps
+
+        scale = min(1.0, max(VARIANTS.values()) / max(image.size))
+        # JPEG decoding can downscale by 1/2..1/8 for free; stays at least the largest variant
+        image.draft("RGB", (math.ceil(image.width * scale), math.ceil(image.height * scale)))
+        image = ImageOps.exif_transpose(image)
+        if image.mode in ("RGBA", "LA", "P"):
+            image = image.convert("RGBA")
+            flat = Image.new("RGB", image.size, "white")
+            flat.paste(image, mask=image.getchannel("A"))
+            image = flat
+        elif image.mode != "RGB":
+            image = image.convert("RGB")
+        # Largest first, each variant resized from the previous one
+        for variant, edge in sorted(VARIANTS.items(), key=lambda item: -item[1]):
+            if max(image.size) > edge:
+                image = image.copy()
+                image.thumbnail((edge, edge), Image.LANCZOS)
+            for fmt in FORMATS:
+                buffer = io.BytesIO()
+                if fmt == "webp":
+                    image.save(buffer, "WEBP", quality=80, method=4)
+                else:
+                    image.save(buffer, "JPEG", quality=82, optimize=True, progressive=True)
+                _write(directory / f"{variant}.{fmt}", buffer.getvalue())
+
+
+def _write(path: Path, data: bytes):
+    # Readers never see a partial file; concurrent writers of the same file
+    # (threads of one worker included) each get their own temporary
+    temporary = path.with_name(f".{path.name}.{uuid.uuid4().hex}.tmp")
+    temporary.write_bytes(data)
+    os.replace(temporary, path)
+
+
+class ImageFiles(StaticFiles):
+    """Serves an ImageStore's files; conditional requests get a 304 from StaticFiles."""
+
+    def file_response(self, full_path, stat_result, scope, status_code=200):
+        response = super().file_response(full_path, stat_result, scope, status_code)
+        response.headers["Cache-Control"] = CACHE_CONTROL
+        return response
+
+
+def _download(url: str) -> bytes:
+    import urllib.request
+
+    with urllib.request.urlopen(url, timeout=30) as response:
+        return response.read()
+
+
+async def ingest_files(store: ImageStore, paths: Iterable[Path]) -> List[str]:
+    """Ingest image files off the event loop; returns their digests in order."""
+    return [await asyncio.to_thread(store.ingest, Path(path).read_bytes()) for path in paths]
+
+
+async def localize(db, store: ImageStore) -> int:
+    """Copy remote `image_url`s of categories and dishes into the store and point them at it.
+
+    Returns the documents updated, and bumps the menu version of every branch
+    that had any so API workers reload.
+    """
+    digests: Dict[str, Optional[str]] = {}
+    branches = set()
+    updated = 0
+    for collection in (db.categories, db.dishes):
+        docs = await collection.find(
+            {"image_url": {"$regex": "^https?://"}}, {"_id": 0, "id": 1, "branch_id": 1, "image_url": 1}
+        ).to_list(None)
+        for doc in docs:
+            source = doc["image_url"]
+            if _LOCAL_URL.search(source):
+                continue
+            if source not in digests:
+                try:
+                    data = await asyncio.to_thread(_download, source)
+                    digests[source] = await asyncio.to_thread(store.ingest, data)
+                except (OSError, ValueError):
+                    logger.exception("Could not localize %s", source)
+                    digests[source] = None
+            if digests[source] is None:
+                continue
+            await collection.update_one({"id": doc["id"]}, {"$set": {"image_url": store.url(digests[source])}})
+            branches.add(doc["branch_id"])
+            updated += 1
+    for branch_id in branches:
+        await db.counters.update_one({"_id": menu_version_id(branch_id)}, {"$inc": {"value": 1}}, upsert=True)
+    return updated
+
+
+def store_from_env(root_dir: Path) -> ImageStore:
+    return ImageStore(
+        os.environ.get('IMAGE_STORE_DIR', root_dir / 'images'),
+        base_url=os.environ.get('IMAGE_BASE_URL', ''),
+        max_bytes=int(os.environ.get('IMAGE_MAX_BYTES', str(10 * 1024 * 1024))),
+    )
+
+
+async def main(args):
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    root_dir = Path(__file__).parent
+    load_dotenv(root_dir / '.env')
+    store = store_from_env(root_dir)
+
+    if args.command == "ingest":
+        for path, digest in zip(args.paths, await ingest_files(store, args.paths)):
+            print(f"{path}: {store.url(digest)}")
+    elif args.command == "rebuild":
+        digests = [path.name for path in store.root.iterdir() if _DIGEST.match(path.name)]
+        for digest in digests:
+            await asyncio.to_thread(store.rebuild, digest)
+        print(f"✓ Rebuilt variants of {len(digests)} images")
+    else:
+        client = AsyncIOMotorClient(os.environ['MONGO_URL'], tz_aware=True)
+        db = client[os.environ['DB_NAME']]
+        try:
+            updated = await localize(db, store)
+            print(f"✓ Localized {updated} image URLs")
+        finally:
+            client.close()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Manage the local content-addressed image store.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    ingest = commands.add_parser("ingest", help="add image files and print their URLs")
+    ingest.add_argument("paths", nargs="+")
+    commands.add_parser("rebuild", help="regenerate every stored image's variants")
+    commands.add_parser("localize", help="copy remote category and dish images into the store")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,313 @@
+import argparse
+import asyncio
+import logging
+import os
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+from dotenv import load_dotenv
+from pymongo import ASCENDING, DESCENDING, IndexModel, UpdateOne
+
+import storage
+from branches import DEFAULT_BRANCH_ID
+from kitchen import ACTIVE_STATUSES
+
+
+logger = logging.getLogger(__name__)
+
+MIGRATION_BATCH_SIZE = 1000
+
+# Cart rows expire this long after they were last touched (`updated_at`)
+CART_TTL_INDEX = "updated_at_ttl"
+DEFAULT_CART_TTL_SECONDS = 6 * 60 * 60
+
+# Index declarations per collection. Every index carries an explicit name so
+# verification does not depend on MongoDB's generated names. Queries made on
+# behalf of a branch lead with `branch_id`, so each one reads only its slice;
+# the global `timestamp_id` indexes serve the archive job.
+INDEXES = {
+    "categories": [
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+        IndexModel([("branch_id", ASCENDING), ("order", ASCENDING)], name="branch_order"),
+    ],
+    "dishes": [
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+        IndexModel([("branch_id", ASCENDING), ("category", ASCENDING)], name="branch_category"),
+        IndexModel([("branch_id", ASCENDING), ("is_popular", ASCENDING)], name="branch_is_popular"),
+    ],
+    "cart": [
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+        IndexModel([("branch_id", ASCENDING), ("session_id", ASCENDING), ("dish_id", ASCENDING)],
+                   name="branch_session_dish_unique", unique=True),
+    ],
+    "orders": [
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+        IndexModel([("branch_id", ASCENDING), ("session_id", ASCENDING), ("timestamp", DESCENDING), ("id", DESCENDING)],
+                   name="branch_session_timestamp_id"),
+        IndexModel([("branch_id", ASCENDING), ("timestamp", DESCENDING), ("id", DESCENDING)], name="branch_timestamp_id"),
+        IndexModel([("timestamp", DESCENDING), ("id", DESCENDING)], name="timestamp_id"),
+        IndexModel([("checkout_pending", ASCENDING)], name="checkout_pending", sparse=True),
+        IndexModel([("branch_id", ASCENDING), ("status", ASCENDING), ("timestamp", ASCENDING)],
+                   name="branch_status_timestamp"),
+    ],
+    "notifications": [
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+        IndexModel([("order_id", ASCENDING)], name="order_id_unique", unique=True),
+        IndexModel([("branch_id", ASCENDING), ("read", ASCENDING), ("timestamp", DESCENDING)],
+                   name="branch_read_timestamp"),
+        IndexModel([("branch_id", ASCENDING), ("table_number", ASCENDING), ("read", ASCENDING)],
+                   name="branch_table_read"),
+        IndexModel([("branch_id", ASCENDING), ("timestamp", DESCENDING), ("id", DESCENDING)], name="branch_timestamp_id"),
+        IndexModel([("timestamp", DESCENDING), ("id", DESCENDING)], name="timestamp_id"),
+    ],
+    "order_archive": [
+        # Blocks overlapping an export range, oldest first
+        IndexModel([("kind", ASCENDING), ("start", ASCENDING)], name="kind_start"),
+    ],
+    "idempotency_keys": [
+        # Each record carries its own expiry
+        IndexModel([("expires_at", ASCENDING)], name="expires_at_ttl", expireAfterSeconds=0),
+    ],
+}
+
+# Indexes superseded by the declarations above, dropped during bootstrap
+OBSOLETE_INDEXES = {
+    "categories": ["order"],
+    "dishes": ["category", "is_popular"],
+    "cart": ["session_dish_unique"],
+    "orders": ["session_timestamp", "timestamp", "session_timestamp_id", "status_timestamp"],
+    "notifications": ["timestamp", "read_timestamp", "table_read"],
+}
+
+# Collections partitioned by `branch_id`
+BRANCH_COLLECTIONS = ("categories", "dishes", "cart", "orders", "notifications")
+
+# Collections whose `timestamp` used to be written as an ISO-8601 string
+TIMESTAMP_COLLECTIONS = ("orders", "notifications")
+
+# Orders used to stay "pending" forever; older ones than this are taken as served
+STALE_ORDER_AGE = timedelta(hours=12)
+
+# Bump whenever bootstrap gains a data migration. The version the data has
+# been migrated to is kept in `db.counters`, and workers refuse to start on
+# data that is behind it.
+SCHEMA_VERSION = 1
+SCHEMA_VERSION_ID = "schema_version"
+
+
+def _parse_timestamp(value: str) -> datetime:
+    parsed = datetime.fromisoformat(value)
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed
+
+
+async def dedupe_cart(db) -> int:
+    """Merge duplicate (branch_id, session_id, dish_id) cart rows so the unique index can be built."""
+    pipeline = [
+        {"$group": {
+            "_id": {"branch_id": "$branch_id", "session_id": "$session_id", "dish_id": "$dish_id"},
+            "ids": {"$push": "$_id"},
+            "quantity": {"$sum": "$quantity"},
+            "count": {"$sum": 1},
+        }},
+        {"$match": {"count": {"$gt": 1}}},
+    ]
+    merged = 0
+    async for group in db.cart.aggregate(pipeline):
+        keep, *extra = group["ids"]
+        await db.cart.update_one({"_id": keep}, {"$set": {"quantity": group["quantity"]}})
+        await db.cart.delete_many({"_id": {"$in": extra}})
+        merged += len(extra)
+    return merged
+
+
+async def migrate_timestamps(db) -> dict:
+    """Convert ISO-string `timestamp` fields into native BSON dates."""
+    migrated = {}
+    for name in TIMESTAMP_COLLECTIONS:
+        collection = db[name]
+        count = 0
+        batch = []
+        async for doc in collection.find({"timestamp": {"$type": "string"}}, {"_id": 1, "timestamp": 1}):
+            batch.append(UpdateOne({"_id": doc["_id"]}, {"$set": {"timestamp": _parse_timestamp(doc["timestamp"])}}))
+            if len(batch) >= MIGRATION_BATCH_SIZE:
+                await collection.bulk_write(batch, ordered=False)
+                count += len(batch)
+                batch = []
+        if batch:
+            await collection.bulk_write(batch, ordered=False)
+            count += len(batch)
+        migrated[name] = count
+    return migrated
+
+
+async def serve_stale_orders(db, age: timedelta = STALE_ORDER_AGE) -> int:
+    """Mark orders placed before the kitchen workflow existed as served.
+
+    The kitchen queue loads, and the archive skips, every order in an active
+    status; without this the whole legacy history would count as active.
+    """
+    now = datetime.now(timezone.utc)
+    result = await db.orders.update_many(
+        {"status": {"$in": list(ACTIVE_STATUSES)}, "timestamp": {"$lt": now - age}},
+        {"$set": {"status": "served", "status_updated_at": now}},
+    )
+    return result.modified_count
+
+
+async def backfill_branches(db) -> dict:
+    """Assign documents written before branches existed to the default branch."""
+    backfilled = {}
+    for name in BRANCH_COLLECTIONS:
+        result = await db[name].update_many(
+            {"branch_id": {"$exists": False}}, {"$set": {"branch_id": DEFAULT_BRANCH_ID}}
+        )
+        backfilled[name] = result.modified_count
+    # Hourly rollup ids gained a branch prefix
+    rollups = await db.sales_rollups.find({"branch_id": {"$exists": False}}).to_list(None)
+    for doc in rollups:
+        legacy_id = doc.pop("_id")
+        await db.sales_rollups.replace_one(
+            {"_id": f"{DEFAULT_BRANCH_ID}:{legacy_id}"}, {**doc, "branch_id": DEFAULT_BRANCH_ID}, upsert=True
+        )
+        await db.sales_rollups.delete_one({"_id": legacy_id})
+    backfilled["sales_rollups"] = len(rollups)
+    return backfilled
+
+
+async def touch_legacy_cart(db) -> int:
+    """Stamp cart rows written before `updated_at` existed so the TTL index covers them."""
+    result = await db.cart.update_many(
+        {"updated_at": {"$exists": False}},
+        {"$set": {"updated_at": datetime.now(timezone.utc)}},
+    )
+    return result.modified_count
+
+
+async def read_schema_version(db) -> int:
+    doc = await db.counters.find_one({"_id": SCHEMA_VERSION_ID})
+    return doc["value"] if doc else 0
+
+
+async def record_schema_version(db, version: int = SCHEMA_VERSION):
+    await db.counters.update_one({"_id": SCHEMA_VERSION_ID}, {"$set": {"value": version}}, upsert=True)
+
+
+async def pending_migrations(db) -> bool:
+    """Whether the data predates the migrations of this release.
+
+    A database with nothing in it has nothing to migrate, so it is stamped
+    with the current version instead.
+    """
+    if await read_schema_version(db) >= SCHEMA_VERSION:
+        return False
+    for name in BRANCH_COLLECTIONS:
+        if await db[name].find_one({}, {"_id": 1}) is not None:
+            return True
+    await record_schema_version(db)
+    return False
+
+
+async def ensure_cart_ttl(db, seconds: int):
+    existing = (await db.cart.index_information()).get(CART_TTL_INDEX)
+    if existing is None:
+        await db.cart.create_indexes([
+            IndexModel([("updated_at", ASCENDING)], name=CART_TTL_INDEX, expireAfterSeconds=seconds),
+        ])
+    elif existing.get("expireAfterSeconds") != seconds:
+        # TTL indexes can be changed in place; create_indexes would conflict
+        await db.command("collMod", "cart", index={"name": CART_TTL_INDEX, "expireAfterSeconds": seconds})
+        logger.info("Cart TTL changed from %ss to %ss", existing.get("expireAfterSeconds"), seconds)
+
+
+async def ensure_indexes(db, cart_ttl_seconds: int = DEFAULT_CART_TTL_SECONDS):
+    for name, indexes in INDEXES.items():
+        await db[name].create_indexes(indexes)
+    await ensure_cart_ttl(db, cart_ttl_seconds)
+    for name, index_names in OBSOLETE_INDEXES.items():
+        existing = await db[name].index_information()
+        for index_name in index_names:
+            if index_name in existing:
+                await db[name].drop_index(index_name)
+
+
+async def verify_indexes(db) -> list:
+    """Return the `collection.index` names that are declared but missing."""
+    missing = []
+    for name, indexes in INDEXES.items():
+        existing = await db[name].index_information()
+        for index in indexes:
+            index_name = index.document["name"]
+            if index_name not in existing:
+                missing.append(f"{name}.{index_name}")
+    if CART_TTL_INDEX not in await db.cart.index_information():
+        missing.append(f"cart.{CART_TTL_INDEX}")
+    return missing
+
+
+async def bootstrap(db, migrate: bool = True, cart_ttl_seconds: int = DEFAULT_CART_TTL_SECONDS):
+    if migrate:
+        backfilled = await backfill_branches(db)
+        if any(backfilled.values()):
+            logger.info("Assigned documents to branch %s: %s", DEFAULT_BRANCH_ID, backfilled)
+        merged = await dedupe_cart(db)
+        if merged:
+            logger.info("Merged %d duplicate cart rows", merged)
+        touched = await touch_legacy_cart(db)
+        if touched:
+            logger.info("Stamped %d cart rows with updated_at", touched)
+        migrated = await migrate_timestamps(db)
+        if any(migrated.values()):
+            logger.info("Migrated string timestamps: %s", migrated)
+        # Needs native timestamps to compare against
+        served = await serve_stale_orders(db)
+        if served:
+            logger.info("Marked %d stale active orders as served", served)
+        await record_schema_version(db)
+    elif await pending_migrations(db):
+        # Legacy documents would miss the menu, break cursors and sorting, and
+        # can stop the unique indexes from building
+        raise RuntimeError(
+            f"Data migrations pending (schema version {await read_schema_version(db)}, need {SCHEMA_VERSION}): "
+            "run `python indexes.py` first"
+        )
+    await ensure_indexes(db, cart_ttl_seconds)
+    missing = await verify_indexes(db)
+    if missing:
+        raise RuntimeError(f"Missing indexes after bootstrap: {', '.join(missing)}")
+    logger.info("Database indexes verified")
+
+
+async def main(args):
+    load_dotenv(Path(__file__).parent / '.env')
+
+    # Same engine and pool settings as the workers
+    client, db = storage.connect()
+    try:
+        if args.verify_only:
+            missing = await verify_indexes(db)
+            if missing:
+                print("✗ Missing indexes: " + ", ".join(missing))
+                raise SystemExit(1)
+            print("✓ All indexes present")
+            if await pending_migrations(db):
+                print(f"✗ Data migrations pending (schema version {await read_schema_version(db)}, need {SCHEMA_VERSION})")
+                raise SystemExit(1)
+            print(f"✓ Data at schema version {SCHEMA_VERSION}")
+            return
+        cart_ttl = args.cart_ttl or int(os.environ.get('CART_TTL_SECONDS', DEFAULT_CART_TTL_SECONDS))
+        await bootstrap(db, migrate=not args.skip_migrate, cart_ttl_seconds=cart_ttl)
+        print("✓ Indexes created and verified")
+    finally:
+        client.close()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Create and verify MongoDB indexes, and migrate legacy data.")
+    parser.add_argument("--verify-only", action="store_true", help="only check that the declared indexes exist")
+    parser.add_argument("--skip-migrate", action="store_true", help="do not convert string timestamps or merge duplicate cart rows")
+    parser.add_argument("--cart-ttl", type=int, default=None,
+                        help=f"seconds before an untouched cart expires (default: CART_TTL_SECONDS or {DEFAULT_CART_TTL_SECONDS})")
+    asyncio.run(main(parser.parse_args()))
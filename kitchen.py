@@ -0,0 +1,159 @@
+import asyncio
+import heapq
+import logging
+from datetime import datetime, timezone
+from typing import Callable, Dict, List, Optional, Tuple
+
+from fast_json import dumps
+
+
+logger = logging.getLogger(__name__)
+
+ALL_STATIONS = "*"
+
+# Allowed status transitions; anything else is rejected with 409
+TRANSITIONS = {
+    "pending": "preparing",
+    "preparing": "ready",
+    "ready": "served",
+}
+ACTIVE_STATUSES = ("pending", "preparing", "ready")
+
+
+def _utc(value) -> datetime:
+    """An order timestamp as an aware UTC datetime, which `dumps` writes with a "Z" suffix."""
+    if isinstance(value, str):
+        # Written before timestamps were stored as dates
+        value = datetime.fromisoformat(value)
+    if value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc)
+
+
+class KitchenQueue:
+    """Active orders (not yet served) grouped by station, oldest first.
+
+    Each station keeps a heap keyed on the order timestamp plus a cached,
+    pre-encoded snapshot; the snapshot is rebuilt only after that station
+    changes, so rendering the kitchen screen is a dictionary lookup.
+    """
+
+    def __init__(self, station_of: Callable[[str], str]):
+        self.station_of = station_of
+        self._orders: Dict[str, dict] = {}
+        self._heaps: Dict[str, List[Tuple[datetime, str]]] = {}
+        self._snapshots: Dict[str, bytes] = {}
+
+    def __len__(self):
+        return len(self._orders)
+
+    def _entries(self, order: dict) -> Dict[str, dict]:
+        by_station: Dict[str, list] = {}
+        for item in order["items"]:
+            by_station.setdefault(self.station_of(item["dish_id"]), []).append(item)
+        base = {
+            "order_id": order["id"],
+            "order_number": order["order_number"],
+            "table_number": order["table_number"],
+            "status": order["status"],
+            "timestamp": _utc(order["timestamp"]),
+        }
+        return {station: {**base, "station": station, "items": items} for station, items in by_station.items()}
+
+    def upsert(self, order: dict):
+        """Add or update an order; served orders leave the queue."""
+        previous = self._orders.pop(order["id"], None)
+        stations = set(previous["entries"]) if previous else set()
+        if order["status"] in ACTIVE_STATUSES:
+            entries = previous["entries"] if previous else self._entries(order)
+            for entry in entries.values():
+                entry["status"] = order["status"]
+            self._orders[order["id"]] = {"timestamp": _utc(order["timestamp"]), "entries": entries}
+            for station in entries:
+                if station not in stations:
+                    heapq.heappush(self._heaps.setdefault(station, []), (_utc(order["timestamp"]), order["id"]))
+            stations.update(entries)
+        for station in stations | {ALL_STATIONS}:
+            self._snapshots.pop(station, None)
+
+    def replace_all(self, orders: List[dict]):
+        self._orders.clear()
+        self._heaps.clear()
+        self._snapshots.clear()
+        for order in orders:
+            self.upsert(order)
+
+    def _active(self, station: str) -> List[dict]:
+        heap = self._heaps.get(station, [])
+        # Drop entries for orders that have left the queue (lazy deletion)
+        while heap and (heap[0][1] not in self._orders or station not in self._orders[heap[0][1]]["entries"]):
+            heapq.heappop(heap)
+        return [self._orders[order_id]["entries"][station] for _, order_id in sorted(heap)
+                if order_id in self._orders and station in self._orders[order_id]["entries"]]
+
+    def snapshot(self, station: Optional[str] = None) -> bytes:
+        key = station or ALL_STATIONS
+        cached = self._snapshots.get(key)
+        if cached is None:
+            if key == ALL_STATIONS:
+                entries = [entry for _, order in sorted(self._orders.items(), key=lambda kv: kv[1]["timestamp"])
+                           for entry in order["entries"].values()]
+            else:
+                entries = self._active(key)
+            cached = dumps(entries)
+            self._snapshots[key] = cached
+        return cached
+
+    def next_order(self, station: str, status: str = "pending") -> Optional[dict]:
+        for entry in self._active(station):
+            if entry["status"] == status:
+                return entry
+        return None
+
+    def stations(self) -> List[str]:
+        return sorted(station for station, heap in self._heaps.items() if heap)
+
+
+class KitchenSync:
+    """Periodically reloads the active orders (of one branch) so every worker converges.
+
+    `on_change` is called after a reload that changed the queue, e.g. because
+    another worker took an order or moved one along.
+    """
+
+    def __init__(self, db, queue: KitchenQueue, interval: float = 2.0, on_change: Optional[Callable[[], None]] = None,
+                 branch_id: Optional[str] = None):
+        self.db = db
+        self.queue = queue
+        self.branch_id = branch_id
+        self.interval = interval
+        self.on_change = on_change
+        self._task: Optional[asyncio.Task] = None
+
+    async def load(self):
+        projection = {"_id": 0, "id": 1, "order_number": 1, "table_number": 1, "items": 1, "status": 1, "timestamp": 1}
+        query = {"status": {"$in": list(ACTIVE_STATUSES)}}
+        if self.branch_id is not None:
+            query["branch_id"] = self.branch_id
+        orders = await self.db.orders.find(query, projection).to_list(None)
+        before = self.queue.snapshot()
+        self.queue.replace_all(orders)
+        if self.on_change is not None and self.queue.snapshot() != before:
+            self.on_change()
+
+    async def _sync_forever(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.load()
+            except Exception:
+                logger.exception("Kitchen queue sync failed")
+
+    def start(self):
+        if self.interval > 0 and self._task is None:
+            self._task = asyncio.create_task(self._sync_forever())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
@@ -0,0 +1,975 @@
+"""In-memory storage engine exposing the subset of the Motor API the app uses.
+
+Collections keep documents in a dict keyed by `_id` and maintain the indexes
+declared through `create_indexes`: every index is a hash on its key tuple,
+unique indexes reject duplicates with `DuplicateKeyError`, and queries with an
+equality (or `$in`) on `_id` or on a prefix of an index's fields only visit
+the matching buckets. All operations run synchronously inside the event
+loop, so each one is atomic just like a single-document MongoDB write. TTL indexes are swept on
+the next operation at most once per TTL_MONITOR_SECONDS, like mongod's TTL
+monitor.
+"""
+import re
+import time
+from collections import Counter
+from itertools import product
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Tuple
+from zoneinfo import ZoneInfo
+
+from bson import ObjectId
+from pymongo import DeleteMany, DeleteOne, InsertOne, ReplaceOne, UpdateMany, UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError, OperationFailure
+
+
+_MISSING = object()
+
+TTL_MONITOR_SECONDS = 60
+
+
+def _clone(value):
+    if isinstance(value, dict):
+        return {k: _clone(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_clone(v) for v in value]
+    return value
+
+
+def _hashable(value):
+    if isinstance(value, dict):
+        return tuple((k, _hashable(v)) for k, v in value.items())
+    if isinstance(value, list):
+        return tuple(_hashable(v) for v in value)
+    return value
+
+
+def _get(doc, path: str):
+    current = doc
+    for part in path.split("."):
+        if isinstance(current, dict):
+            current = current.get(part, _MISSING)
+        elif isinstance(current, list):
+            values = [item.get(part, _MISSING) for item in current if isinstance(item, dict)]
+            current = [v for v in values if v is not _MISSING] or _MISSING
+        else:
+            return _MISSING
+        if current is _MISSING:
+            return _MISSING
+    return current
+
+
+def _set(doc: dict, path: str, value):
+    parts = path.split(".")
+    for part in parts[:-1]:
+        doc = doc.setdefault(part, {})
+    doc[parts[-1]] = value
+
+
+def _unset(doc: dict, path: str):
+    parts = path.split(".")
+    for part in parts[:-1]:
+        doc = doc.get(part)
+        if not isinstance(doc, dict):
+            return
+    doc.pop(parts[-1], None)
+
+
+# ---------------------------------------------------------------- matching
+
+_TYPE_NAMES = {
+    "string": str,
+    "date": datetime,
+    "bool": bool,
+    "int": int,
+    "double": float,
+    "object": dict,
+    "array": list,
+}
+
+
+def _compare(op: str, value, operand) -> bool:
+    if value is _MISSING or value is None or operand is None:
+        return False
+    try:
+        if op == "$gt":
+            return value > operand
+        if op == "$gte":
+            return value >= operand
+        if op == "$lt":
+            return value < operand
+        return value <= operand
+    except TypeError:
+        return False
+
+
+def _candidates(value) -> list:
+    # Array fields match if the array itself or any element matches
+    if isinstance(value, list):
+        return [value] + value
+    return [value]
+
+
+def _match_condition(value, condition) -> bool:
+    if isinstance(condition, dict) and condition and all(k.startswith("$") for k in condition):
+        return all(_match_operator(value, op, operand) for op, operand in condition.items())
+    if isinstance(condition, re.Pattern):
+        return any(isinstance(v, str) and condition.search(v) for v in _candidates(value))
+    if value is _MISSING:
+        return condition is None
+    return any(v == condition for v in _candidates(value))
+
+
+def _match_operator(value, op: str, operand) -> bool:
+    if op == "$eq":
+        return _match_condition(value, operand)
+    if op == "$ne":
+        return not _match_condition(value, operand)
+    if op in ("$gt", "$gte", "$lt", "$lte"):
+        return any(_compare(op, v, operand) for v in _candidates(value))
+    if op == "$in":
+        return any(_match_condition(value, item) for item in operand)
+    if op == "$nin":
+        return not any(_match_condition(value, item) for item in operand)
+    if op == "$exists":
+        return (value is not _MISSING) == bool(operand)
+    if op == "$type":
+        expected = _TYPE_NAMES[operand]
+        return value is not _MISSING and any(isinstance(v, expected) for v in _candidates(value))
+    if op == "$regex":
+        pattern = re.compile(operand) if isinstance(operand, str) else operand
+        return any(isinstance(v, str) and pattern.search(v) for v in _candidates(value))
+    if op == "$options":
+        return True
+    if op == "$elemMatch":
+        return isinstance(value, list) and any(isinstance(v, dict) and matches(v, operand) for v in value)
+    if op == "$not":
+        return not _match_condition(value, operand)
+    raise OperationFailure(f"Unsupported query operator {op}")
+
+
+def matches(doc: dict, query: dict) -> bool:
+    for key, condition in query.items():
+        if key == "$or":
+            if not any(matches(doc, q) for q in condition):
+                return False
+        elif key == "$and":
+            if not all(matches(doc, q) for q in condition):
+                return False
+        elif key == "$nor":
+            if any(matches(doc, q) for q in condition):
+                return False
+        elif not _match_condition(_get(doc, key), condition):
+            return False
+    return True
+
+
+# ---------------------------------------------------------------- updates
+
+def _apply_update(doc: dict, update: dict, inserting: bool) -> bool:
+    """Apply update operators in place; returns whether anything changed."""
+    if not any(k.startswith("$") for k in update):
+        # Replacement document
+        replacement = _clone(update)
+        if "_id" in doc:
+            replacement["_id"] = doc["_id"]
+        changed = replacement != doc
+        doc.clear()
+        doc.update(replacement)
+        return changed
+
+    before = _clone(doc)
+    for op, fields in update.items():
+        if op == "$setOnInsert":
+            if not inserting:
+                continue
+            op = "$set"
+        for path, value in fields.items():
+            current = _get(doc, path)
+            if op == "$set":
+                _set(doc, path, _clone(value))
+            elif op == "$unset":
+                _unset(doc, path)
+            elif op == "$inc":
+                _set(doc, path, (0 if current is _MISSING else current) + value)
+            elif op == "$max":
+                if current is _MISSING or value > current:
+                    _set(doc, path, value)
+            elif op == "$min":
+                if current is _MISSING or value < current:
+                    _set(doc, path, value)
+            elif op == "$push":
+                items = [] if current is _MISSING else list(current)
+                if isinstance(value, dict) and "$each" in value:
+                    items.extend(_clone(value["$each"]))
+                    if "$slice" in value:
+                        items = items[value["$slice"]:] if value["$slice"] < 0 else items[:value["$slice"]]
+                else:
+                    items.append(_clone(value))
+                _set(doc, path, items)
+            elif op == "$addToSet":
+                items = [] if current is _MISSING else list(current)
+                if value not in items:
+                    items.append(_clone(value))
+                _set(doc, path, items)
+            else:
+                raise OperationFailure(f"Unsupported update operator {op}")
+    return doc != before
+
+
+def _upsert_seed(query: dict) -> dict:
+    doc = {}
+    for key, condition in query.items():
+        if key.startswith("$"):
+            continue
+        if isinstance(condition, dict) and any(k.startswith("$") for k in condition):
+            if "$eq" in condition:
+                _set(doc, key, _clone(condition["$eq"]))
+            continue
+        _set(doc, key, _clone(condition))
+    return doc
+
+
+# ---------------------------------------------------------------- projection / sort
+
+def _project(doc: dict, projection: Optional[dict]) -> dict:
+    if not projection:
+        return _clone(doc)
+    include_id = projection.get("_id", 1)
+    fields = {k: v for k, v in projection.items() if k != "_id"}
+    if fields and all(v for v in fields.values()):
+        result = {}
+        if include_id and "_id" in doc:
+            result["_id"] = doc["_id"]
+        for key in fields:
+            value = _get(doc, key)
+            if value is not _MISSING:
+                _set(result, key, _clone(value))
+        return result
+    result = _clone(doc)
+    if not include_id:
+        result.pop("_id", None)
+    for key in fields:
+        _unset(result, key)
+    return result
+
+
+def _sort_key(value):
+    if value is _MISSING or value is None:
+        return (0, 0)
+    if isinstance(value, bool):
+        return (3, value)
+    if isinstance(value, (int, float)):
+        return (1, value)
+    if isinstance(value, str):
+        return (2, value)
+    if isinstance(value, datetime):
+        return (4, value)
+    return (5, str(value))
+
+
+def _normalize_sort(key_or_list, direction=None) -> List[Tuple[str, int]]:
+    if isinstance(key_or_list, str):
+        return [(key_or_list, direction or 1)]
+    return list(key_or_list)
+
+
+def sort_documents(docs: List[dict], spec: List[Tuple[str, int]]) -> List[dict]:
+    for key, direction in reversed(spec):
+        docs.sort(key=lambda d: _sort_key(_get(d, key)), reverse=direction < 0)
+    return docs
+
+
+# ---------------------------------------------------------------- results
+
+class InsertOneResult:
+    def __init__(self, inserted_id):
+        self.inserted_id = inserted_id
+        self.acknowledged = True
+
+
+class InsertManyResult:
+    def __init__(self, inserted_ids):
+        self.inserted_ids = inserted_ids
+        self.acknowledged = True
+
+
+class UpdateResult:
+    def __init__(self, matched_count=0, modified_count=0, upserted_id=None):
+        self.matched_count = matched_count
+        self.modified_count = modified_count
+        self.upserted_id = upserted_id
+        self.acknowledged = True
+
+
+class DeleteResult:
+    def __init__(self, deleted_count=0):
+        self.deleted_count = deleted_count
+        self.acknowledged = True
+
+
+class BulkWriteResult:
+    def __init__(self, counts: dict):
+        self.inserted_count = counts["nInserted"]
+        self.matched_count = counts["nMatched"]
+        self.modified_count = counts["nModified"]
+        self.deleted_count = counts["nRemoved"]
+        self.upserted_count = counts["nUpserted"]
+        self.bulk_api_result = counts
+        self.acknowledged = True
+
+
+# ---------------------------------------------------------------- indexes
+
+class _Index:
+    def __init__(self, document: dict):
+        self.name = document["name"]
+        self.keys = list(document["key"].items())
+        self.fields = [field for field, _ in self.keys]
+        self.unique = document.get("unique", False)
+        self.sparse = document.get("sparse", False)
+        self.expire_after = document.get("expireAfterSeconds")
+        # Buckets are dicts used as insertion-ordered sets of _ids, one table
+        # per key prefix: prefixes[n] is keyed on the first n + 1 fields
+        self.prefixes: List[Dict[Any, dict]] = [{} for _ in self.fields]
+        self.entries = self.prefixes[-1]
+        # Set once a document has an array in an indexed field; equality on an
+        # array field also matches its elements, which the buckets cannot answer
+        self.multikey = False
+
+    def info(self) -> dict:
+        info = {"key": self.keys, "v": 2}
+        if self.unique:
+            info["unique"] = True
+        if self.sparse:
+            info["sparse"] = True
+        if self.expire_after is not None:
+            info["expireAfterSeconds"] = self.expire_after
+        return info
+
+    def key_for(self, doc: dict):
+        values = [_get(doc, field) for field in self.fields]
+        if self.sparse and all(v is _MISSING for v in values):
+            return _MISSING
+        return tuple(None if v is _MISSING else _hashable(v) for v in values)
+
+    def check(self, doc: dict, ignore_id=None):
+        if not self.unique:
+            return
+        key = self.key_for(doc)
+        if key is _MISSING:
+            return
+        holders = [_id for _id in self.entries.get(key, ()) if _id != ignore_id]
+        if holders:
+            raise DuplicateKeyError(
+                f"E11000 duplicate key error index: {self.name} dup key: {dict(zip(self.fields, key))}",
+                11000,
+            )
+
+    def add(self, doc: dict):
+        key = self.key_for(doc)
+        if key is _MISSING:
+            return
+        if any(isinstance(_get(doc, field), list) for field in self.fields):
+            self.multikey = True
+        for length, table in enumerate(self.prefixes, 1):
+            table.setdefault(key[:length], {})[doc["_id"]] = None
+
+    def remove(self, doc: dict):
+        key = self.key_for(doc)
+        if key is _MISSING:
+            return
+        for length, table in enumerate(self.prefixes, 1):
+            bucket = table.get(key[:length])
+            if bucket is not None:
+                bucket.pop(doc["_id"], None)
+                if not bucket:
+                    del table[key[:length]]
+
+
+# ---------------------------------------------------------------- cursor
+
+class MemoryCursor:
+    def __init__(self, collection: "MemoryCollection", query: dict, projection: Optional[dict]):
+        self._collection = collection
+        self._query = query or {}
+        self._projection = projection
+        self._sort: List[Tuple[str, int]] = []
+        self._skip = 0
+        self._limit = 0
+        self._results: Optional[List[dict]] = None
+
+    def sort(self, key_or_list, direction=None):
+        self._sort = _normalize_sort(key_or_list, direction)
+        return self
+
+    def skip(self, count: int):
+        self._skip = count
+        return self
+
+    def limit(self, count: int):
+        self._limit = count
+        return self
+
+    def batch_size(self, size: int):
+        return self
+
+    def _execute(self) -> List[dict]:
+        if self._results is None:
+            self._collection._count("find")
+            docs = self._collection._scan(self._query)
+            if self._sort:
+                docs = sort_documents(docs, self._sort)
+            docs = docs[self._skip:]
+            if self._limit:
+                docs = docs[:self._limit]
+            self._results = [_project(doc, self._projection) for doc in docs]
+        return self._results
+
+    async def to_list(self, length: Optional[int] = None) -> List[dict]:
+        results = self._execute()
+        return results if length is None else results[:length]
+
+    def __aiter__(self):
+        self._iter = iter(self._execute())
+        return self
+
+    async def __anext__(self):
+        try:
+            return next(self._iter)
+        except StopIteration:
+            raise StopAsyncIteration
+
+
+class _AggregateCursor:
+    def __init__(self, docs: List[dict]):
+        self._docs = docs
+
+    async def to_list(self, length: Optional[int] = None) -> List[dict]:
+        return self._docs if length is None else self._docs[:length]
+
+    def __aiter__(self):
+        self._iter = iter(self._docs)
+        return self
+
+    async def __anext__(self):
+        try:
+            return next(self._iter)
+        except StopIteration:
+            raise StopAsyncIteration
+
+
+# ---------------------------------------------------------------- aggregation
+
+def _evaluate(expression, doc):
+    if isinstance(expression, str) and expression.startswith("$"):
+        value = _get(doc, expression[1:])
+        return None if value is _MISSING else value
+    if isinstance(expression, dict):
+        if len(expression) == 1 and next(iter(expression)).startswith("$"):
+            op, args = next(iter(expression.items()))
+            if op == "$dateToString":
+                date = _evaluate(args["date"], doc)
+                if args.get("timezone"):
+                    date = date.astimezone(ZoneInfo(args["timezone"]))
+                return date.strftime(args["format"])
+            values = [_evaluate(arg, doc) for arg in (args if isinstance(args, list) else [args])]
+            if op == "$multiply":
+                result = 1
+                for value in values:
+                    result *= value or 0
+                return result
+            if op == "$add":
+                return sum(value or 0 for value in values)
+            if op == "$subtract":
+                return (values[0] or 0) - (values[1] or 0)
+            if op == "$hour":
+                return values[0].hour
+            if op == "$ifNull":
+                return values[0] if values[0] is not None else values[1]
+            raise OperationFailure(f"Unsupported aggregation operator {op}")
+        return {key: _evaluate(value, doc) for key, value in expression.items()}
+    return expression
+
+
+def _accumulate(groups: Dict[Any, dict], key, accumulators: dict, doc: dict):
+    group = groups.get(key)
+    if group is None:
+        group = groups[key] = {"_id": key}
+    for field, spec in accumulators.items():
+        op, expression = next(iter(spec.items()))
+        value = _evaluate(expression, doc)
+        if op == "$sum":
+            group[field] = group.get(field, 0) + (value or 0)
+        elif op == "$push":
+            group.setdefault(field, []).append(value)
+        elif op == "$addToSet":
+            items = group.setdefault(field, [])
+            if value not in items:
+                items.append(value)
+        elif op == "$first":
+            group.setdefault(field, value)
+        elif op == "$last":
+            group[field] = value
+        elif op == "$max":
+            if field not in group or (value is not None and value > group[field]):
+                group[field] = value
+        elif op == "$min":
+            if field not in group or (value is not None and value < group[field]):
+                group[field] = value
+        else:
+            raise OperationFailure(f"Unsupported accumulator {op}")
+
+
+def aggregate_documents(docs: List[dict], pipeline: List[dict]) -> List[dict]:
+    for stage in pipeline:
+        (name, spec), = stage.items()
+        if name == "$match":
+            docs = [doc for doc in docs if matches(doc, spec)]
+        elif name == "$unwind":
+            path = (spec if isinstance(spec, str) else spec["path"])[1:]
+            unwound = []
+            for doc in docs:
+                values = _get(doc, path)
+                for value in (values if isinstance(values, list) else []):
+                    copy = _clone(doc)
+                    _set(copy, path, value)
+                    unwound.append(copy)
+            docs = unwound
+        elif name == "$group":
+            groups: Dict[Any, dict] = {}
+            accumulators = {k: v for k, v in spec.items() if k != "_id"}
+            keys = {}
+            for doc in docs:
+                key = _evaluate(spec["_id"], doc)
+                hashed = _hashable(key)
+                keys.setdefault(hashed, key)
+                _accumulate(groups, hashed, accumulators, doc)
+            docs = [{**group, "_id": keys[hashed]} for hashed, group in groups.items()]
+        elif name == "$project":
+            projected = []
+            for doc in docs:
+                out = {"_id": doc.get("_id")}
+                for key, value in spec.items():
+                    if value is False or value == 0:
+                        out.pop(key, None)
+                    elif value is True or value == 1:
+                        found = _get(doc, key)
+                        if found is not _MISSING:
+                            out[key] = found
+                    else:
+                        out[key] = _evaluate(value, doc)
+                projected.append(out)
+            docs = projected
+        elif name == "$sort":
+            docs = sort_documents(docs, list(spec.items()))
+        elif name == "$skip":
+            docs = docs[spec:]
+        elif name == "$limit":
+            docs = docs[:spec]
+        elif name == "$count":
+            docs = [{spec: len(docs)}]
+        else:
+            raise OperationFailure(f"Unsupported aggregation stage {name}")
+    return docs
+
+
+# ---------------------------------------------------------------- collection
+
+def _equality_values(condition) -> Optional[list]:
+    """The values a query condition pins a field to, or None if it is not an equality or `$in`."""
+    if condition is _MISSING or isinstance(condition, (list, re.Pattern)):
+        return None
+    if isinstance(condition, dict) and any(key.startswith("$") for key in condition):
+        if set(condition) == {"$in"} and not any(isinstance(value, (list, re.Pattern)) for value in condition["$in"]):
+            return list(condition["$in"])
+        return None
+    return [condition]
+
+
+class MemoryCollection:
+    def __init__(self, database: "MemoryDatabase", name: str):
+        self.database = database
+        self.name = name
+        self._docs: Dict[Any, dict] = {}
+        self._indexes: Dict[str, _Index] = {}
+        self._next_expiry = 0.0
+
+    def __repr__(self):
+        return f"MemoryCollection({self.database.name}.{self.name})"
+
+    def _count(self, op: str):
+        self.database.operations[f"{self.name}.{op}"] += 1
+        for listener in self.database.client.event_listeners:
+            listener.record(self.name, op, 0.0)
+        self._expire()
+
+    def _expire(self):
+        if time.monotonic() < self._next_expiry:
+            return
+        self._next_expiry = time.monotonic() + TTL_MONITOR_SECONDS
+        for index in self._indexes.values():
+            if index.expire_after is None:
+                continue
+            cutoff = datetime.now(timezone.utc) - timedelta(seconds=index.expire_after)
+            for doc in list(self._docs.values()):
+                value = _get(doc, index.fields[0])
+                if not isinstance(value, datetime):
+                    continue
+                if value.tzinfo is None:
+                    value = value.replace(tzinfo=timezone.utc)
+                if value < cutoff:
+                    self._delete(doc)
+
+    # -- planning
+
+    def _plan(self, query: dict):
+        """Return candidate `_id`s for `query`, or None to scan the collection.
+
+        Uses `_id` when the query pins it, otherwise the index whose longest
+        prefix of equality (or `$in`) fields yields the fewest candidates.
+        """
+        ids = _equality_values(query.get("_id", _MISSING))
+        if ids is not None:
+            return {_id: None for _id in map(_hashable, ids) if _id in self._docs}
+        best = None
+        for index in self._indexes.values():
+            if index.sparse or index.multikey:
+                continue
+            values = []
+            for field in index.fields:
+                field_values = _equality_values(query.get(field, _MISSING))
+                if field_values is None:
+                    break
+                values.append([_hashable(value) for value in field_values])
+            if not values:
+                continue
+            table = index.prefixes[len(values) - 1]
+            candidates = {}
+            for key in product(*values):
+                candidates.update(table.get(key, {}))
+            if best is None or len(candidates) < len(best):
+                best = candidates
+        return best
+
+    def _scan(self, query: dict) -> List[dict]:
+        ids = self._plan(query)
+        if ids is None:
+            docs = self._docs.values()
+        else:
+            docs = [self._docs[_id] for _id in ids if _id in self._docs]
+        return [doc for doc in docs if matches(doc, query)]
+
+    def _first(self, query: dict, sort=None) -> Optional[dict]:
+        docs = self._scan(query or {})
+        if sort:
+            docs = sort_documents(docs, _normalize_sort(sort))
+        return docs[0] if docs else None
+
+    # -- mutation primitives
+
+    def _insert(self, doc: dict) -> Any:
+        doc.setdefault("_id", ObjectId())
+        if doc["_id"] in self._docs:
+            raise DuplicateKeyError(f"E11000 duplicate key error index: _id_ dup key: {doc['_id']}", 11000)
+        for index in self._indexes.values():
+            index.check(doc)
+        stored = _clone(doc)
+        self._docs[stored["_id"]] = stored
+        for index in self._indexes.values():
+            index.add(stored)
+        return stored["_id"]
+
+    def _replace_stored(self, stored: dict, updated: dict):
+        for index in self._indexes.values():
+            index.check(updated, ignore_id=stored["_id"])
+        for index in self._indexes.values():
+            index.remove(stored)
+        stored.clear()
+        stored.update(updated)
+        for index in self._indexes.values():
+            index.add(stored)
+
+    def _delete(self, stored: dict):
+        for index in self._indexes.values():
+            index.remove(stored)
+        del self._docs[stored["_id"]]
+
+    def _update(self, query: dict, update: dict, upsert: bool, multi: bool, sort=None):
+        """Returns (UpdateResult, [(before, after), ...])."""
+        targets = self._scan(query) if multi else [d for d in [self._first(query, sort)] if d is not None]
+        if not targets:
+            if not upsert:
+                return UpdateResult(), []
+            doc = _upsert_seed(query)
+            _apply_update(doc, update, inserting=True)
+            _id = self._insert(doc)
+            stored = self._docs[_id]
+            return UpdateResult(upserted_id=_id), [(None, stored)]
+        modified = 0
+        changes = []
+        for stored in targets:
+            updated = _clone(stored)
+            if _apply_update(updated, update, inserting=False):
+                before = _clone(stored)
+                self._replace_stored(stored, updated)
+                modified += 1
+                changes.append((before, stored))
+            else:
+                changes.append((stored, stored))
+        return UpdateResult(matched_count=len(targets), modified_count=modified), changes
+
+    # -- public API
+
+    async def insert_one(self, document: dict, session=None) -> InsertOneResult:
+        self._count("insert")
+        return InsertOneResult(self._insert(document))
+
+    async def insert_many(self, documents: List[dict], ordered: bool = True, session=None) -> InsertManyResult:
+        self._count("insert")
+        inserted, errors = [], []
+        for index, document in enumerate(documents):
+            try:
+                inserted.append(self._insert(document))
+            except DuplicateKeyError as exc:
+                errors.append({"index": index, "code": 11000, "errmsg": str(exc), "op": document})
+                if ordered:
+                    break
+        if errors:
+            raise BulkWriteError({
+                "writeErrors": errors, "writeConcernErrors": [], "nInserted": len(inserted),
+                "nUpserted": 0, "nMatched": 0, "nModified": 0, "nRemoved": 0, "upserted": [],
+            })
+        return InsertManyResult(inserted)
+
+    def find(self, filter: Optional[dict] = None, projection: Optional[dict] = None, **kwargs) -> MemoryCursor:
+        cursor = MemoryCursor(self, filter or {}, projection)
+        if kwargs.get("sort"):
+            cursor.sort(kwargs["sort"])
+        if kwargs.get("limit"):
+            cursor.limit(kwargs["limit"])
+        return cursor
+
+    async def find_one(self, filter: Optional[dict] = None, projection: Optional[dict] = None, sort=None, session=None):
+        self._count("find")
+        doc = self._first(filter or {}, sort)
+        return None if doc is None else _project(doc, projection)
+
+    async def count_documents(self, filter: dict, session=None, **kwargs) -> int:
+        self._count("count")
+        return len(self._scan(filter))
+
+    async def estimated_document_count(self) -> int:
+        self._count("count")
+        return len(self._docs)
+
+    async def update_one(self, filter: dict, update: dict, upsert: bool = False, session=None) -> UpdateResult:
+        self._count("update")
+        return self._update(filter, update, upsert, multi=False)[0]
+
+    async def update_many(self, filter: dict, update: dict, upsert: bool = False, session=None) -> UpdateResult:
+        self._count("update")
+        return self._update(filter, update, upsert, multi=True)[0]
+
+    async def replace_one(self, filter: dict, replacement: dict, upsert: bool = False, session=None) -> UpdateResult:
+        self._count("update")
+        return self._update(filter, replacement, upsert, multi=False)[0]
+
+    async def find_one_and_update(self, filter: dict, update: dict, projection: Optional[dict] = None,
+                                  sort=None, upsert: bool = False, return_document: bool = False, session=None):
+        self._count("findAndModify")
+        result, changes = self._update(filter, update, upsert, multi=False, sort=sort)
+        if not changes:
+            return None
+        before, after = changes[0]
+        doc = after if return_document else before
+        return None if doc is None else _project(doc, projection)
+
+    async def find_one_and_delete(self, filter: dict, projection: Optional[dict] = None, sort=None, session=None):
+        self._count("findAndModify")
+        doc = self._first(filter, sort)
+        if doc is None:
+            return None
+        result = _project(doc, projection)
+        self._delete(doc)
+        return result
+
+    async def delete_one(self, filter: dict, session=None) -> DeleteResult:
+        self._count("delete")
+        doc = self._first(filter)
+        if doc is None:
+            return DeleteResult()
+        self._delete(doc)
+        return DeleteResult(1)
+
+    async def delete_many(self, filter: dict, session=None) -> DeleteResult:
+        self._count("delete")
+        docs = self._scan(filter)
+        for doc in docs:
+            self._delete(doc)
+        return DeleteResult(len(docs))
+
+    async def bulk_write(self, requests: list, ordered: bool = True, session=None) -> BulkWriteResult:
+        self._count("bulkWrite")
+        counts = {"nInserted": 0, "nMatched": 0, "nModified": 0, "nRemoved": 0, "nUpserted": 0}
+        upserted, errors = [], []
+        for index, request in enumerate(requests):
+            try:
+                if isinstance(request, InsertOne):
+                    self._insert(request._doc)
+                    counts["nInserted"] += 1
+                elif isinstance(request, (UpdateOne, UpdateMany, ReplaceOne)):
+                    update = request._doc
+                    result, _ = self._update(request._filter, update, bool(request._upsert),
+                                             multi=isinstance(request, UpdateMany))
+                    counts["nMatched"] += result.matched_count
+                    counts["nModified"] += result.modified_count
+                    if result.upserted_id is not None:
+                        counts["nUpserted"] += 1
+                        upserted.append({"index": index, "_id": result.upserted_id})
+                elif isinstance(request, DeleteOne):
+                    doc = self._first(request._filter)
+                    if doc is not None:
+                        self._delete(doc)
+                        counts["nRemoved"] += 1
+                elif isinstance(request, DeleteMany):
+                    for doc in self._scan(request._filter):
+                        self._delete(doc)
+                        counts["nRemoved"] += 1
+                else:
+                    raise OperationFailure(f"Unsupported bulk operation {type(request).__name__}")
+            except DuplicateKeyError as exc:
+                errors.append({"index": index, "code": 11000, "errmsg": str(exc)})
+                if ordered:
+                    break
+        if errors:
+            raise BulkWriteError({**counts, "writeErrors": errors, "writeConcernErrors": [], "upserted": upserted})
+        return BulkWriteResult({**counts, "upserted": upserted})
+
+    def aggregate(self, pipeline: List[dict], session=None, **kwargs) -> _AggregateCursor:
+        self._count("aggregate")
+        query = pipeline[0]["$match"] if pipeline and "$match" in pipeline[0] else {}
+        docs = [_clone(doc) for doc in self._scan(query)]
+        return _AggregateCursor(aggregate_documents(docs, pipeline[1:] if query else pipeline))
+
+    async def distinct(self, key: str, filter: Optional[dict] = None, session=None) -> list:
+        self._count("distinct")
+        values = []
+        for doc in self._scan(filter or {}):
+            for value in _candidates(_get(doc, key)):
+                if value is not _MISSING and not isinstance(value, list) and value not in values:
+                    values.append(value)
+        return values
+
+    async def create_indexes(self, indexes: list, session=None) -> List[str]:
+        self._count("createIndexes")
+        names = []
+        for model in indexes:
+            document = model.document
+            if document["name"] not in self._indexes:
+                index = _Index(document)
+                for doc in self._docs.values():
+                    index.check(doc)
+                    index.add(doc)
+                self._indexes[index.name] = index
+            names.append(document["name"])
+        return names
+
+    async def create_index(self, keys, **kwargs) -> str:
+        from pymongo import IndexModel
+        return (await self.create_indexes([IndexModel(keys, **kwargs)]))[0]
+
+    async def index_information(self, session=None) -> dict:
+        info = {"_id_": {"key": [("_id", 1)], "v": 2}}
+        info.update({name: index.info() for name, index in self._indexes.items()})
+        return info
+
+    async def drop_index(self, name: str, session=None):
+        if self._indexes.pop(name, None) is None:
+            raise OperationFailure(f"index not found with name [{name}]")
+
+    async def drop(self, session=None):
+        self._docs.clear()
+        for index in self._indexes.values():
+            index.prefixes = [{} for _ in index.fields]
+            index.entries = index.prefixes[-1]
+            index.multikey = False
+
+    def watch(self, *args, **kwargs):
+        raise OperationFailure("Change streams are not supported by the memory storage engine")
+
+
+# ---------------------------------------------------------------- database / client
+
+class MemoryDatabase:
+    def __init__(self, client: "MemoryClient", name: str):
+        self.client = client
+        self.name = name
+        self._collections: Dict[str, MemoryCollection] = {}
+        # Operation counts per "<collection>.<op>", the engine's round-trip equivalent
+        self.operations: Counter = Counter()
+
+    def __getitem__(self, name: str) -> MemoryCollection:
+        collection = self._collections.get(name)
+        if collection is None:
+            collection = self._collections[name] = MemoryCollection(self, name)
+        return collection
+
+    def __getattr__(self, name: str) -> MemoryCollection:
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return self[name]
+
+    def get_collection(self, name: str) -> MemoryCollection:
+        return self[name]
+
+    async def list_collection_names(self) -> List[str]:
+        return [name for name, collection in self._collections.items() if collection._docs]
+
+    async def drop_collection(self, name: str):
+        self._collections.pop(name, None)
+
+    async def command(self, command, *args, **kwargs) -> dict:
+        name = command if isinstance(command, str) else next(iter(command))
+        if name in ("ping", "hello", "isMaster", "ismaster"):
+            # No replica set, so checkout runs without transactions
+            return {"ok": 1.0, "isWritablePrimary": True, "ismaster": True}
+        if name == "collMod":
+            options = kwargs if isinstance(command, str) else {**command, **kwargs}
+            collection = self[args[0] if isinstance(command, str) else command[name]]
+            change = options["index"]
+            index = collection._indexes.get(change["name"])
+            if index is None:
+                raise OperationFailure(f"cannot find index {change['name']}")
+            index.expire_after = change["expireAfterSeconds"]
+            return {"ok": 1.0}
+        raise OperationFailure(f"Unsupported command {name}")
+
+
+class MemoryClient:
+    def __init__(self, event_listeners=()):
+        # Listeners exposing record(collection, command, seconds), e.g. metrics.CommandMetrics
+        self.event_listeners = [listener for listener in event_listeners if hasattr(listener, "record")]
+        self._databases: Dict[str, MemoryDatabase] = {}
+
+    def __getitem__(self, name: str) -> MemoryDatabase:
+        database = self._databases.get(name)
+        if database is None:
+            database = self._databases[name] = MemoryDatabase(self, name)
+        return database
+
+    def __getattr__(self, name: str) -> MemoryDatabase:
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return self[name]
+
+    def get_database(self, name: str) -> MemoryDatabase:
+        return self[name]
+
+    async def drop_database(self, name):
+        self._databases.pop(getattr(name, "name", name), None)
+
+    async def start_session(self, **kwargs):
+        raise OperationFailure("Transactions are not supported by the memory storage engine")
+
+    def close(self):
+        pass
@@ -0,0 +1,153 @@
+import asyncio
+import hashlib
+import logging
+from typing import Callable, Dict, List, Optional
+
+from fastapi import Request, Response
+from pymongo import ReturnDocument
+
+from fast_json import dumps
+
+
+logger = logging.getLogger(__name__)
+
+MENU_VERSION_ID = "menu_version"
+
+
+def menu_version_id(branch_id: str) -> str:
+    """`db.counters` id of a branch's menu version; bump it after writing that branch's menu."""
+    return f"{MENU_VERSION_ID}:{branch_id}"
+
+
+class CachedResponse:
+    __slots__ = ("body", "etag")
+
+    def __init__(self, body: bytes):
+        self.body = body
+        self.etag = '"' + hashlib.sha1(body).hexdigest()[:20] + '"'
+
+
+def _encode(docs: List[dict]) -> CachedResponse:
+    return CachedResponse(dumps(docs))
+
+
+class MenuCache:
+    """In-memory snapshot of one branch's catalog (categories + dishes).
+
+    Reads are served entirely from memory as pre-encoded JSON bytes. Writes go
+    through `bump()`, which increments a shared version document so that other
+    workers pick the change up on their next `poll()`. `on_load` receives the
+    dishes after every (re)load, e.g. to keep a search index in step.
+    """
+
+    def __init__(self, db, category_model, dish_model, branch_id: str, refresh_interval: float = 5.0,
+                 on_load: Optional[Callable[[List[dict]], None]] = None):
+        self.db = db
+        self.branch_id = branch_id
+        self.version_id = menu_version_id(branch_id)
+        self.category_model = category_model
+        self.dish_model = dish_model
+        self.refresh_interval = refresh_interval
+        self.on_load = on_load
+        self.version: Optional[int] = None
+        self.categories: List[dict] = []
+        self.dishes: List[dict] = []
+        self.dishes_by_id: Dict[str, dict] = {}
+        self._responses: Dict[str, CachedResponse] = {}
+        self._lock = asyncio.Lock()
+        self._poll_task: Optional[asyncio.Task] = None
+
+    @property
+    def loaded(self) -> bool:
+        return self.version is not None
+
+    async def _remote_version(self) -> int:
+        doc = await self.db.counters.find_one({"_id": self.version_id})
+        return doc["value"] if doc else 0
+
+    async def load(self, version: Optional[int] = None):
+        async with self._lock:
+            if version is None:
+                version = await self._remote_version()
+            branch = {"branch_id": self.branch_id}
+            categories = await self.db.categories.find(branch, {"_id": 0}).sort("order", 1).to_list(None)
+            dishes = await self.db.dishes.find(branch, {"_id": 0}).to_list(None)
+            self.categories = [self.category_model(**c).model_dump() for c in categories]
+            self.dishes = [self.dish_model(**d).model_dump() for d in dishes]
+            self.dishes_by_id = {d["id"]: d for d in self.dishes}
+            self._build_responses()
+            if self.on_load is not None:
+                self.on_load(self.dishes)
+            self.version = version
+            logger.info("Menu cache for %s loaded: %d categories, %d dishes (version %s)",
+                        self.branch_id, len(self.categories), len(self.dishes), version)
+
+    def _build_responses(self):
+        by_category: Dict[str, List[dict]] = {}
+        for dish in self.dishes:
+            by_category.setdefault(dish["category"], []).append(dish)
+        responses = {
+            "categories": _encode(self.categories),
+            "dishes": _encode(self.dishes),
+            "dishes:popular": _encode([d for d in self.dishes if d["is_popular"]]),
+        }
+        for name, dishes in by_category.items():
+            responses[f"dishes:category:{name}"] = _encode(dishes)
+        self._responses = responses
+
+    async def ensure_loaded(self):
+        if not self.loaded:
+            await self.load()
+
+    async def bump(self):
+        doc = await self.db.counters.find_one_and_update(
+            {"_id": self.version_id},
+            {"$inc": {"value": 1}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
+        )
+        await self.load(doc["value"])
+
+    async def poll(self):
+        remote = await self._remote_version()
+        if remote != self.version:
+            await self.load(remote)
+
+    async def _poll_forever(self):
+        while True:
+            await asyncio.sleep(self.refresh_interval)
+            try:
+                await self.poll()
+            except Exception:
+                logger.exception("Menu cache refresh failed")
+
+    def start(self):
+        if self.refresh_interval > 0 and self._poll_task is None:
+            self._poll_task = asyncio.create_task(self._poll_forever())
+
+    async def stop(self):
+        if self._poll_task is not None:
+            self._poll_task.cancel()
+            self._poll_task = None
+
+    def dish(self, dish_id: str) -> Optional[dict]:
+        return self.dishes_by_id.get(dish_id)
+
+    def categories_response(self) -> CachedResponse:
+        return self._responses["categories"]
+
+    def dishes_response(self, category: Optional[str] = None) -> CachedResponse:
+        if category:
+            return self._responses.get(f"dishes:category:{category}") or _encode([])
+        return self._responses["dishes"]
+
+    def popular_response(self) -> CachedResponse:
+        return self._responses["dishes:popular"]
+
+
+def cached_json_response(request: Request, cached: CachedResponse) -> Response:
+    headers = {"ETag": cached.etag, "Cache-Control": "no-cache"}
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and cached.etag in [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]:
+        return Response(status_code=304, headers=headers)
+    return Response(content=cached.body, media_type="application/json", headers=headers)
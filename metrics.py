@@ -0,0 +1,212 @@
+import bisect
+import contextvars
+import logging
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+from pymongo import monitoring
+
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+SIZE_BUCKETS = (128, 512, 2048, 8192, 32768, 131072, 524288, 2097152)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21)
+
+# Database commands issued on behalf of the current request: [(collection, command, seconds)]
+_request_commands: contextvars.ContextVar[Optional[list]] = contextvars.ContextVar("request_commands", default=None)
+
+
+def _labels(names: Tuple[str, ...], values: Tuple) -> str:
+    if not names:
+        return ""
+    pairs = ",".join(f'{name}="{str(value).replace(chr(34), chr(39))}"' for name, value in zip(names, values))
+    return "{" + pairs + "}"
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, labels: Tuple[str, ...], buckets: Tuple[float, ...]):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = buckets
+        self._series: Dict[Tuple, List] = {}
+
+    def observe(self, value: float, *labels):
+        series = self._series.get(labels)
+        if series is None:
+            series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        series[0][bisect.bisect_left(self.buckets, value)] += 1
+        series[1] += value
+        series[2] += 1
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for labels, (counts, total, count) in sorted(self._series.items()):
+            cumulative = 0
+            for bound, bucket in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(f"{self.name}_bucket{_labels(self.labels + ('le',), labels + (le,))} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labels, labels)} {total}")
+            lines.append(f"{self.name}_count{_labels(self.labels, labels)} {count}")
+        return lines
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labels: Tuple[str, ...]):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self._values: Dict[Tuple, float] = {}
+
+    def inc(self, *labels, amount: float = 1):
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        lines.extend(f"{self.name}{_labels(self.labels, labels)} {value}" for labels, value in sorted(self._values.items()))
+        return lines
+
+
+class CommandMetrics(monitoring.CommandListener):
+    """pymongo listener recording per-collection/per-command latency.
+
+    Motor runs commands on executor threads with a copy of the caller's
+    context, so the request's command list is reachable from the callbacks.
+    The memory engine calls `record()` directly.
+    """
+
+    def __init__(self, registry: "Metrics"):
+        self.registry = registry
+        self._pending: Dict[int, Tuple[str, str, Optional[list]]] = {}
+        self._lock = threading.Lock()
+
+    def started(self, event):
+        collection = event.command.get(event.command_name)
+        if not isinstance(collection, str):
+            collection = event.database_name
+        with self._lock:
+            self._pending[event.request_id] = (collection, event.command_name, _request_commands.get())
+
+    def _finish(self, event, failed: bool):
+        with self._lock:
+            pending = self._pending.pop(event.request_id, None)
+        if pending is None:
+            return
+        collection, command, request = pending
+        self.registry.record_command(collection, command, event.duration_micros / 1e6, failed, request)
+
+    def succeeded(self, event):
+        self._finish(event, failed=False)
+
+    def failed(self, event):
+        self._finish(event, failed=True)
+
+    def record(self, collection: str, command: str, seconds: float):
+        self.registry.record_command(collection, command, seconds, False, _request_commands.get())
+
+
+class Metrics:
+    def __init__(self, slow_request_seconds: float = 0.0):
+        self.slow_request_seconds = slow_request_seconds
+        self.in_flight = 0
+        self.requests = Histogram(
+            "http_request_duration_seconds", "Request latency by route", ("method", "route", "status"), LATENCY_BUCKETS)
+        self.request_sizes = Histogram(
+            "http_request_size_bytes", "Request body size by route", ("method", "route"), SIZE_BUCKETS)
+        self.response_sizes = Histogram(
+            "http_response_size_bytes", "Response body size by route", ("method", "route"), SIZE_BUCKETS)
+        self.request_commands = Histogram(
+            "http_request_db_commands", "Database commands issued per request", ("method", "route"), COUNT_BUCKETS)
+        self.commands = Histogram(
+            "db_command_duration_seconds", "Database command latency", ("collection", "command"), LATENCY_BUCKETS)
+        self.command_failures = Counter(
+            "db_command_failures_total", "Failed database commands", ("collection", "command"))
+        self._gauges: List[Tuple[str, str, Callable[[], float]]] = []
+        self._lock = threading.Lock()
+        self.command_listener = CommandMetrics(self)
+
+    def add_gauge(self, name: str, help: str, read: Callable[[], float]):
+        self._gauges.append((name, help, read))
+
+    def record_command(self, collection: str, command: str, seconds: float, failed: bool, request: Optional[list]):
+        with self._lock:
+            self.commands.observe(seconds, collection, command)
+            if failed:
+                self.command_failures.inc(collection, command)
+        if request is not None:
+            request.append((collection, command, seconds))
+
+    def record_request(self, method: str, route: str, status: int, seconds: float,
+                       request_bytes: int, response_bytes: int, commands: list):
+        with self._lock:
+            self.requests.observe(seconds, method, route, str(status))
+            self.request_sizes.observe(request_bytes, method, route)
+            self.response_sizes.observe(response_bytes, method, route)
+            self.request_commands.observe(len(commands), method, route)
+        if self.slow_request_seconds and seconds >= self.slow_request_seconds:
+            detail = ", ".join(f"{c}.{cmd} {s * 1000:.1f}ms" for c, cmd, s in commands) or "no db commands"
+            logger.warning("Slow request %s %s %d %.1fms (%d db commands: %s)",
+                           method, route, status, seconds * 1000, len(commands), detail)
+
+    def render(self) -> str:
+        lines = [
+            "# HELP http_requests_in_flight Requests currently being served",
+            "# TYPE http_requests_in_flight gauge",
+            f"http_requests_in_flight {self.in_flight}",
+        ]
+        for name, help, read in self._gauges:
+            lines += [f"# HELP {name} {help}", f"# TYPE {name} gauge", f"{name} {read()}"]
+        with self._lock:
+            for metric in (self.requests, self.request_sizes, self.response_sizes, self.request_commands,
+                           self.commands, self.command_failures):
+                lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+class MetricsMiddleware:
+    """ASGI middleware timing each HTTP request against its route template."""
+
+    def __init__(self, app, metrics: Metrics):
+        self.app = app
+        self.metrics = metrics
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        metrics = self.metrics
+        commands = []
+        token = _request_commands.set(commands)
+        sizes = {"request": 0, "response": 0}
+        status = {"code": 500}
+
+        async def counting_receive():
+            message = await receive()
+            if message["type"] == "http.request":
+                sizes["request"] += len(message.get("body", b""))
+            return message
+
+        async def counting_send(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            elif message["type"] == "http.response.body":
+                sizes["response"] += len(message.get("body", b""))
+            await send(message)
+
+        metrics.in_flight += 1
+        started = time.perf_counter()
+        try:
+            await self.app(scope, counting_receive, counting_send)
+        finally:
+            elapsed = time.perf_counter() - started
+            metrics.in_flight -= 1
+            _request_commands.reset(token)
+            route = scope.get("route")
+            metrics.record_request(
+                scope["method"], route.path if route is not None else "unmatched", status["code"], elapsed,
+                sizes["request"], sizes["response"], commands,
+            )
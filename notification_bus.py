@@ -0,0 +1,154 @@
+import asyncio
+import itertools
+import json
+import logging
+import uuid
+from collections import deque
+from typing import AsyncIterator, Callable, Deque, Optional, Set, Tuple
+
+from pymongo.errors import PyMongoError
+
+
+logger = logging.getLogger(__name__)
+
+# Sent when a subscriber cannot be brought up to date from the replay buffer;
+# clients should refetch /api/notifications and continue from the stream.
+RESYNC = "resync"
+
+Event = Tuple[str, str, str]  # (id, event type, JSON data)
+
+
+class Subscription:
+    def __init__(self, max_pending: int):
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=max_pending)
+        self.lagged = False
+
+    def push(self, event: Event):
+        if self.lagged:
+            return
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            self.lagged = True
+
+
+class NotificationBus:
+    """In-process pub/sub for dashboard events.
+
+    Event ids are `<epoch>-<sequence>`, where the epoch identifies this bus
+    instance. A reconnecting client passes its last id back and gets the
+    missed events from a bounded replay buffer, or a `resync` event if they
+    are no longer available (buffer overflow, or a different worker/process).
+    """
+
+    def __init__(self, history: int = 1000, max_pending: int = 256):
+        self.epoch = uuid.uuid4().hex[:8]
+        self.max_pending = max_pending
+        self._sequence = itertools.count(1)
+        self._history: Deque[Tuple[int, Event]] = deque(maxlen=history)
+        self._subscribers: Set[Subscription] = set()
+
+    @property
+    def subscriber_count(self) -> int:
+        return len(self._subscribers)
+
+    def publish(self, event_type: str, data) -> str:
+        sequence = next(self._sequence)
+        event = (f"{self.epoch}-{sequence}", event_type, data if isinstance(data, str) else json.dumps(data))
+        self._history.append((sequence, event))
+        for subscription in self._subscribers:
+            subscription.push(event)
+        return event[0]
+
+    def _replay(self, last_event_id: str):
+        epoch, _, sequence = last_event_id.partition("-")
+        if epoch != self.epoch or not sequence.isdigit():
+            return None
+        sequence = int(sequence)
+        if self._history and sequence < self._history[0][0] - 1:
+            return None
+        return [event for seq, event in self._history if seq > sequence]
+
+    async def subscribe(self, last_event_id: Optional[str] = None, heartbeat: float = 15.0) -> AsyncIterator[Optional[Event]]:
+        """Yield events as they are published; `None` marks an idle heartbeat."""
+        subscription = Subscription(self.max_pending)
+        self._subscribers.add(subscription)
+        try:
+            if last_event_id:
+                missed = self._replay(last_event_id)
+                if missed is None:
+                    yield (f"{self.epoch}-0", RESYNC, "{}")
+                else:
+                    for event in missed:
+                        yield event
+            while not subscription.lagged or not subscription.queue.empty():
+                try:
+                    yield await asyncio.wait_for(subscription.queue.get(), heartbeat)
+                except asyncio.TimeoutError:
+                    yield None
+            # Fell too far behind; let the client catch up over REST
+            yield (f"{self.epoch}-0", RESYNC, "{}")
+        finally:
+            self._subscribers.discard(subscription)
+
+
+def format_sse(event: Optional[Event]) -> str:
+    if event is None:
+        return ": keep-alive\n\n"
+    event_id, event_type, data = event
+    return f"id: {event_id}\nevent: {event_type}\ndata: {data}\n\n"
+
+
+class ChangeStreamSource:
+    """Feeds buses from a MongoDB change stream on `notifications`.
+
+    With this enabled every worker sees inserts and read-flag updates made by
+    any other worker. `bus_for(doc)` picks the bus for a notification (one
+    per branch), or None to drop it. Requires a replica set or sharded
+    cluster.
+    """
+
+    def __init__(self, db, bus_for: Callable[[dict], Optional[NotificationBus]], serialize):
+        self.db = db
+        self.bus_for = bus_for
+        self.serialize = serialize
+        self._task: Optional[asyncio.Task] = None
+        self._resume_token = None
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _run(self):
+        pipeline = [{"$match": {"operationType": {"$in": ["insert", "update"]}}}]
+        backoff = 0.5
+        while True:
+            try:
+                async with self.db.notifications.watch(
+                    pipeline, full_document="updateLookup", resume_after=self._resume_token
+                ) as stream:
+                    backoff = 0.5
+                    async for change in stream:
+                        self._resume_token = stream.resume_token
+                        self._dispatch(change)
+            except asyncio.CancelledError:
+                raise
+            except PyMongoError:
+                logger.exception("Notification change stream failed, retrying in %.1fs", backoff)
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, 30)
+
+    def _dispatch(self, change: dict):
+        doc = change.get("fullDocument")
+        bus = self.bus_for(doc) if doc else None
+        if bus is None:
+            return
+        if change["operationType"] == "insert":
+            bus.publish("notification", self.serialize(doc))
+        elif doc.get("read") and "read" in change["updateDescription"]["updatedFields"]:
+            bus.publish("read", {"ids": [doc["id"]]})
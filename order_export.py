@@ -0,0 +1,78 @@
+import csv
+import io
+import zlib
+from datetime import datetime, timezone
+from typing import AsyncIterator, Iterator, List
+
+from fast_json import dumps
+
+EXPORT_FORMATS = ("ndjson", "csv")
+MEDIA_TYPES = {"ndjson": "application/x-ndjson", "csv": "text/csv; charset=utf-8"}
+# Orders fetched per cursor batch
+EXPORT_BATCH_SIZE = 1000
+# Item rows encoded (and compressed) per chunk sent to the client
+ROWS_PER_CHUNK = 1000
+
+# One row per order item, with the order's fields repeated
+COLUMNS = (
+    "order_id", "order_number", "timestamp", "session_id", "table_number", "status", "order_total",
+    "dish_id", "dish_name", "dish_price", "quantity", "line_total",
+)
+
+
+def _iso(value: datetime) -> str:
+    return value.astimezone(timezone.utc).isoformat().replace("+00:00", "Z")
+
+
+def item_rows(order: dict) -> Iterator[tuple]:
+    head = (
+        order["id"], order["order_number"], _iso(order["timestamp"]), order["session_id"],
+        order["table_number"], order["status"], order["total"],
+    )
+    for item in order["items"]:
+        yield head + (
+            item["dish_id"], item["dish_name"], item["dish_price"], item["quantity"],
+            round(item["dish_price"] * item["quantity"], 2),
+        )
+
+
+def _encode_ndjson(rows: List[tuple]) -> bytes:
+    return b"".join(dumps(dict(zip(COLUMNS, row))) + b"\n" for row in rows)
+
+
+def _encode_csv(rows: List[tuple]) -> bytes:
+    text = io.StringIO()
+    csv.writer(text).writerows(rows)
+    return text.getvalue().encode()
+
+
+_ENCODERS = {"ndjson": _encode_ndjson, "csv": _encode_csv}
+
+
+async def export_stream(orders: AsyncIterator[dict], fmt: str, compress: bool = False) -> AsyncIterator[bytes]:
+    """Encode `orders` as item rows in `fmt`, optionally gzipped, a chunk at a time.
+
+    Holds at most ROWS_PER_CHUNK rows, so memory does not depend on how many
+    orders the iterator produces.
+    """
+    encode = _ENCODERS[fmt]
+    # wbits=31 writes a gzip container rather than a bare zlib stream
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31) if compress else None
+    rows: List[tuple] = [COLUMNS] if fmt == "csv" else []
+
+    def chunk() -> bytes:
+        data = encode(rows)
+        rows.clear()
+        return compressor.compress(data) if compressor else data
+
+    async for order in orders:
+        rows.extend(item_rows(order))
+        if len(rows) >= ROWS_PER_CHUNK:
+            data = chunk()
+            if data:
+                yield data
+    data = chunk() if rows else b""
+    if compressor:
+        data += compressor.flush()
+    if data:
+        yield data
@@ -0,0 +1,172 @@
+import asyncio
+import logging
+from typing import Dict, List, Optional
+
+from pymongo import DeleteMany
+from pymongo.errors import BulkWriteError
+
+from idempotency import OutcomeUnknown
+
+
+logger = logging.getLogger(__name__)
+
+DUPLICATE_KEY = 11000
+
+
+class QueueFull(Exception):
+    pass
+
+
+class _PendingOrder:
+    __slots__ = ("order", "notification", "cart_ids", "future")
+
+    def __init__(self, order: dict, notification: dict, cart_ids: List[str], future: asyncio.Future):
+        self.order = order
+        self.notification = notification
+        self.cart_ids = cart_ids
+        self.future = future
+
+
+class GroupCommitter:
+    """Batches checkout writes from concurrent requests into shared bulk writes.
+
+    Requests enqueue their order and wait on a future. A single flusher task
+    collects whatever arrived within `flush_interval` (up to `max_batch`
+    orders) and writes them with one `insert_many(ordered=False)` per
+    collection. Orders are inserted with the same `checkout_pending` marker
+    as the non-transactional checkout path, so recovery works unchanged.
+    If the insert fails without saying which orders it wrote (a timeout or
+    dropped connection), the orders found afterwards are committed and the
+    rest fail with OutcomeUnknown rather than a plain error.
+    """
+
+    def __init__(self, db, max_queue: int = 1000, flush_interval: float = 0.005, max_batch: int = 200,
+                 unread_counter=None):
+        self.db = db
+        self.unread_counter = unread_counter
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=max_queue)
+        self._task: Optional[asyncio.Task] = None
+        self.batches = 0
+        self.committed = 0
+        self.rejected = 0
+
+    def full(self) -> bool:
+        return self._queue.full()
+
+    def depth(self) -> int:
+        return self._queue.qsize()
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is None:
+            return
+        await self._queue.join()
+        self._task.cancel()
+        self._task = None
+
+    async def submit(self, order: dict, notification: dict, cart_ids: List[str]):
+        future = asyncio.get_running_loop().create_future()
+        try:
+            self._queue.put_nowait(_PendingOrder(order, notification, cart_ids, future))
+        except asyncio.QueueFull:
+            self.rejected += 1
+            raise QueueFull()
+        # The write proceeds even if the client disconnects while waiting
+        await asyncio.shield(future)
+
+    async def _run(self):
+        while True:
+            batch = [await self._queue.get()]
+            await asyncio.sleep(self.flush_interval)
+            while len(batch) < self.max_batch and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+            try:
+                await self._flush(batch)
+            except Exception as exc:
+                logger.exception("Order batch of %d failed", len(batch))
+                for pending in batch:
+                    if not pending.future.done():
+                        pending.future.set_exception(exc)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    async def _flush(self, batch: List[_PendingOrder]):
+        docs = [{**p.order, "checkout_pending": {"cart_ids": p.cart_ids}} for p in batch]
+        failed = {}
+        try:
+            await self.db.orders.insert_many(docs, ordered=False)
+        except BulkWriteError as exc:
+            failed = {error["index"]: RuntimeError(error.get("errmsg", "order insert failed"))
+                      for error in exc.details["writeErrors"]}
+        except Exception as exc:
+            # A timeout or dropped connection leaves any part of the batch written
+            failed = await self._unwritten(batch, exc)
+
+        committed = []
+        for index, pending in enumerate(batch):
+            if index in failed:
+                pending.future.set_exception(failed[index])
+            else:
+                committed.append(pending)
+        if not committed:
+            return
+
+        follow_ups = [self._insert_notifications([p.notification for p in committed])]
+        cart_ops = [
+            DeleteMany({"branch_id": p.order["branch_id"], "session_id": p.order["session_id"],
+                        "id": {"$in": p.cart_ids}})
+            for p in committed if p.cart_ids
+        ]
+        if cart_ops:
+            follow_ups.append(self.db.cart.bulk_write(cart_ops, ordered=False))
+        results = await asyncio.gather(*follow_ups, return_exceptions=True)
+
+        self.batches += 1
+        self.committed += len(committed)
+        for pending in committed:
+            pending.future.set_result(None)
+
+        errors = [result for result in results if isinstance(result, Exception)]
+        if errors:
+            # Orders keep their checkout_pending marker and are replayed by recovery
+            logger.error("Follow-up writes failed for %d orders: %s", len(committed), errors[0])
+            return
+        await self.db.orders.update_many(
+            {"id": {"$in": [p.order["id"] for p in committed]}},
+            {"$unset": {"checkout_pending": ""}},
+        )
+
+    async def _unwritten(self, batch: List[_PendingOrder], cause: Exception) -> Dict[int, Exception]:
+        """Errors for the orders of `batch` that cannot be found after an ambiguous insert."""
+        ids = [p.order["id"] for p in batch]
+        try:
+            written = {doc["id"] async for doc in self.db.orders.find({"id": {"$in": ids}}, {"id": 1})}
+        except Exception:
+            logger.exception("Could not check which of %d orders were written", len(batch))
+            written = set()
+        logger.warning("Order batch insert failed (%s); %d of %d orders were written", cause, len(written), len(batch))
+        # The missing ones may still be applied by a write the driver gave up on
+        return {index: OutcomeUnknown(order_id, cause) for index, order_id in enumerate(ids) if order_id not in written}
+
+    async def _insert_notifications(self, docs: List[dict]):
+        duplicates = set()
+        try:
+            await self.db.notifications.insert_many(docs, ordered=False)
+        except BulkWriteError as exc:
+            # Duplicates on order_id mean the alert already exists
+            if any(error["code"] != DUPLICATE_KEY for error in exc.details["writeErrors"]):
+                raise
+            duplicates = {error["index"] for error in exc.details["writeErrors"]}
+        if self.unread_counter is not None:
+            inserted: Dict[str, int] = {}
+            for index, doc in enumerate(docs):
+                if index not in duplicates:
+                    inserted[doc["branch_id"]] = inserted.get(doc["branch_id"], 0) + 1
+            for branch_id, count in inserted.items():
+                await self.unread_counter.add(branch_id, count)
@@ -0,0 +1,47 @@
+import base64
+import binascii
+from datetime import datetime
+from typing import Optional, Tuple
+
+from fastapi import HTTPException
+
+
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+# Newest first, with `id` as the tie-breaker for equal timestamps
+KEYSET_SORT = [("timestamp", -1), ("id", -1)]
+
+
+def encode_cursor(doc: dict) -> str:
+    timestamp = doc["timestamp"]
+    if isinstance(timestamp, str):
+        # Written before timestamps were stored as dates
+        timestamp = datetime.fromisoformat(timestamp)
+    raw = f"{timestamp.isoformat()}|{doc['id']}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, str]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        timestamp, doc_id = raw.split("|", 1)
+        return datetime.fromisoformat(timestamp), doc_id
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise HTTPException(status_code=400, detail="Invalid pagination cursor")
+
+
+def keyset_query(query: dict, before: Optional[str]) -> dict:
+    if not before:
+        return query
+    timestamp, doc_id = decode_cursor(before)
+    return {
+        **query,
+        "$or": [
+            {"timestamp": {"$lt": timestamp}},
+            {"timestamp": timestamp, "id": {"$lt": doc_id}},
+        ],
+    }
+
+
+def projection_for(model) -> dict:
+    return {"_id": 0, **{name: 1 for name in model.model_fields}}
@@ -1,302 +1,675 @@
+"""Seed the Cafetaria database with the menu and, optionally, synthetic load.
+
+    python seed_data.py                                   # curated menu only
+    python seed_data.py --dishes 2000 --orders 1000000 --carts 20000
+    python seed_data.py --orders 50000 --days 30 --seed 7 --concurrency 8
+    python seed_data.py --local-images                    # serve menu and banner images from the local store
+    python seed_data.py --branch north --orders 10000     # seed another branch
+
+Seeding is idempotent. The menu is upserted by id, and synthetic documents
+get ids derived from --seed, so a re-run with the same parameters skips
+what is already there (duplicate-key errors from the unordered bulk inserts
+are counted as skipped). --reset removes previously generated synthetic
+data first; the curated menu is never deleted. Everything is written to
+one --branch; branches other than the default get their own menu ids.
+Synthetic orders skip checkout, so the sales rollups of the days they
+cover are rebuilt from `orders` afterwards.
+"""
+import argparse
 import asyncio
-from motor.motor_asyncio import AsyncIOMotorClient
 import os
-from dotenv import load_dotenv
+import random
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from itertools import accumulate
 from pathlib import Path
+from typing import Optional
+from zoneinfo import ZoneInfo
+
+from dotenv import load_dotenv
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+
+from analytics import SalesRollups
+from branches import DEFAULT_BRANCH_ID, parse_branch_ids
+from image_store import ingest_files, localize, store_from_env, variant_url
+from indexes import bootstrap
+from menu_cache import menu_version_id
+from unread_counter import UnreadCounter
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
 mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
+client = AsyncIOMotorClient(mongo_url, tz_aware=True)
 db = client[os.environ['DB_NAME']]
 
+DUPLICATE_KEY = 11000
 
-async def seed_database():
-    # Clear existing data
-    await db.categories.delete_many({})
-    await db.dishes.delete_many({})
-    
-    # Categories
-    categories = [
-        {
-            "id": "cat_coffee",
-            "name": "Coffee",
-            "image_url": "https://images.unsplash.com/photo-1762657440603-2afa5580eaf8?auto=format&fit=crop&w=800&q=80",
-            "order": 1
-        },
-        {
-            "id": "cat_tea",
-            "name": "Tea",
-            "image_url": "https://images.unsplash.com/photo-1701933810995-3331d9ff463b?auto=format&fit=crop&w=800&q=80",
-            "order": 2
-        },
-        {
-            "id": "cat_sandwich",
-            "name": "Sandwich",
-            "image_url": "https://images.unsplash.com/photo-1717250180255-5509e931bded?auto=format&fit=crop&w=800&q=80",
-            "order": 3
-        },
-        {
-            "id": "cat_cookies",
-            "name": "Cookies",
-            "image_url": "https://images.unsplash.com/photo-1613563628001-aac5a5307153?auto=format&fit=crop&w=800&q=80",
-            "order": 4
-        },
-        {
-            "id": "cat_pizza",
-            "name": "Pizza",
-            "image_url": "https://images.unsplash.com/photo-1767065604070-574bb62ce4fc?auto=format&fit=crop&w=800&q=80",
-            "order": 5
-        },
-        {
-            "id": "cat_burger",
-            "name": "Burger",
-            "image_url": "https://images.unsplash.com/photo-1632898657999-ae6920976661?auto=format&fit=crop&w=800&q=80",
-            "order": 6
-        }
-    ]
-    
-    await db.categories.insert_many(categories)
-    print("✓ Categories seeded")
-    
-    # Dishes
-    dishes = [
-        # Coffee
-        {
-            "id": "dish_espresso",
-            "name": "Espresso",
-            "description": "Rich and bold single shot espresso",
-            "price": 50,
-            "category": "Coffee",
-            "image_url": "https://images.unsplash.com/photo-1510591509098-f4fdc6d0ff04?auto=format&fit=crop&w=800&q=80",
-            "is_popular": True
-        },
-        {
-            "id": "dish_cappuccino",
-            "name": "Cappuccino",
-            "description": "Classic Italian coffee with steamed milk foam",
-            "price": 50,
-            "category": "Coffee",
-            "image_url": "https://images.unsplash.com/photo-1572442388796-11668a67e53d?auto=format&fit=crop&w=800&q=80",
-            "is_popular": True
-        },
-        {
-            "id": "dish_latte",
-            "name": "Latte",
-            "description": "Smooth coffee with steamed milk",
-            "price": 50,
-            "category": "Coffee",
-            "image_url": "https://images.unsplash.com/photo-1541167760496-1628856ab772?auto=format&fit=crop&w=800&q=80",
-            "is_popular": False
-        },
-        {
-            "id": "dish_americano",
-            "name": "Americano",
-            "description": "Espresso with hot water",
-            "price": 50,
-            "category": "Coffee",
-            "image_url": "https://images.unsplash.com/photo-1514432324607-a09d9b4aefdd?auto=format&fit=crop&w=800&q=80",
-            "is_popular": False
-        },
-        
-        # Tea
-        {
-            "id": "dish_masala_chai",
-            "name": "Masala Chai",
-            "description": "Traditional Indian spiced tea",
-            "price": 20,
-            "category": "Tea",
-            "image_url": "https://images.unsplash.com/photo-1597318181275-c0f61c36f1bc?auto=format&fit=crop&w=800&q=80",
-            "is_popular": False
-        },
-        {
-            "id": "dish_green_tea",
-            "name": "Green Tea",
-            "description": "Refreshing and healthy green tea",
-            "price": 20,
-            "category": "Tea",
-            "image_url": "https://images.unsplash.com/photo-1627435601361-ec25f5b1d0e5?auto=format&fit=crop&w=800&q=80",
-            "is_popular": False
-        },
-        {
-            "id": "dish_lemon_tea",
-            "name": "Lemon Tea",
-            "description": "Refreshing tea with a zesty lemon twist",
-            "price": 20,
-            "category": "Tea",
-            "image_url": "https://images.unsplash.com/photo-1556679343-c7306c1976bc?auto=format&fit=crop&w=800&q=80",
-            "is_popular": False
-        },
-        {
-            "id": "dish_iced_tea",
-            "name": "Iced Tea",
-            "description": "Chilled tea perfect for hot days",
-            "price": 20,
-            "category": "Tea",
-            "image_url": "https://images.unsplash.com/photo-1499638309848-e9968540da83?auto=format&fit=crop&w=800&q=80",
-            "is_popular": False
-        },
-        
-        # Sandwich
-        {
-            "id": "dish_club_sandwich",
-            "name": "Club Sandwich",
-            "description": "Triple layer sandwich with chicken and veggies",
-            "price": 50,
-            "category": "Sandwich",
-            "image_url": "https://images.unsplash.com/photo-1528735602780-2552fd46c7af?auto=format&fit=crop&w=800&q=80",
-            "is_popular": True
-        },
-        {
-            "id": "dish_veg_sandwich",
-            "name": "Veg Sandwich",
-            "description": "Fresh vegetables with tangy chutney",
-            "price": 50,
-            "category": "Sandwich",
-            "image_url": "https://images.unsplash.com/photo-1509722747041-616f39b57569?auto=format&fit=crop&w=800&q=80",
-            "is_popular": False
-        },
-        {
-            "id": "dish_grilled_sandwich",
-            "name": "Grilled Sandwich",
-            "description": "Crispy grilled sandwich with cheese",
-            "price": 50,
-            "category": "Sandwich",
-            "image_url": "https://images.unsplash.com/photo-1621852004146-75d47c57e990?auto=format&fit=crop&w=800&q=80",
-            "is_popular": False
-        },
-        {
-            "id": "dish_paneer_sandwich",
-            "name": "Paneer Sandwich",
-            "description": "Grilled sandwich with spiced paneer",
-            "price": 50,
-            "category": "Sandwich",
-            "image_url": "https://images.unsplash.com/photo-1553909489-cd47e0907980?auto=format&fit=crop&w=800&q=80",
-            "is_popular": False
-        },
-        
-        # Cookies
-        {
-            "id": "dish_choco_chip",
-            "name": "Chocolate Chip Cookies",
-            "description": "Classic cookies with chocolate chips",
-            "price": 30,
-            "category": "Cookies",
-            "image_url": "https://images.unsplash.com/photo-1499636136210-6f4ee915583e?auto=format&fit=crop&w=800&q=80",
-            "is_popular": False
-        },
-        {
-            "id": "dish_oatmeal_cookies",
-            "name": "Oatmeal Cookies",
-            "description": "Healthy oatmeal cookies with raisins",
-            "price": 30,
-            "category": "Cookies",
-            "image_url": "https://images.unsplash.com/photo-1590841609987-4ac211afdde1?auto=format&fit=crop&w=800&q=80",
-            "is_popular": False
-        },
-        {
-            "id": "dish_butter_cookies",
-            "name": "Butter Cookies",
-            "description": "Melt-in-mouth butter cookies",
-            "price": 30,
-            "category": "Cookies",
-            "image_url": "https://images.unsplash.com/photo-1558961363-fa8fdf82db35?auto=format&fit=crop&w=800&q=80",
-            "is_popular": False
-        },
-        {
-            "id": "dish_double_chocolate",
-            "name": "Double Chocolate Cookies",
-            "description": "Rich chocolate cookies for chocolate lovers",
-            "price": 30,
-            "category": "Cookies",
-            "image_url": "https://images.unsplash.com/photo-1606890737304-57a1ca8a5b62?auto=format&fit=crop&w=800&q=80",
-            "is_popular": False
-        },
-        
-        # Pizza
-        {
-            "id": "dish_margherita",
-            "name": "Margherita Pizza",
-            "description": "Classic pizza with cheese and tomato sauce",
-            "price": 100,
-            "category": "Pizza",
-            "image_url": "https://images.unsplash.com/photo-1574071318508-1cdbab80d002?auto=format&fit=crop&w=800&q=80",
-            "is_popular": True
-        },
-        {
-            "id": "dish_pepperoni",
-            "name": "Pepperoni Pizza",
-            "description": "Loaded with pepperoni and cheese",
-            "price": 100,
-            "category": "Pizza",
-            "image_url": "https://images.unsplash.com/photo-1628840042765-356cda07504e?auto=format&fit=crop&w=800&q=80",
-            "is_popular": False
-        },
-        {
-            "id": "dish_veg_pizza",
-            "name": "Veggie Pizza",
-            "description": "Fresh vegetables on cheese base",
-            "price": 100,
-            "category": "Pizza",
-            "image_url": "https://images.unsplash.com/photo-1511689660979-10d2b1aada49?auto=format&fit=crop&w=800&q=80",
-            "is_popular": False
-        },
-        {
-            "id": "dish_farmhouse",
-            "name": "Farmhouse Pizza",
-            "description": "Garden fresh vegetables with cheese",
-            "price": 100,
-            "category": "Pizza",
-            "image_url": "https://images.unsplash.com/photo-1565299624946-b28f40a0ae38?auto=format&fit=crop&w=800&q=80",
-            "is_popular": False
-        },
-        
-        # Burger
-        {
-            "id": "dish_classic_burger",
-            "name": "Classic Burger",
-            "description": "Juicy beef patty with lettuce and tomato",
-            "price": 70,
-            "category": "Burger",
-            "image_url": "https://images.unsplash.com/photo-1568901346375-23c9450c58cd?auto=format&fit=crop&w=800&q=80",
-            "is_popular": True
-        },
-        {
-            "id": "dish_cheese_burger",
-            "name": "Cheese Burger",
-            "description": "Classic burger with extra cheese",
-            "price": 70,
-            "category": "Burger",
-            "image_url": "https://images.unsplash.com/photo-1550547660-d9450f859349?auto=format&fit=crop&w=800&q=80",
-            "is_popular": False
-        },
-        {
-            "id": "dish_veg_burger",
-            "name": "Veg Burger",
-            "description": "Crispy vegetable patty burger",
-            "price": 70,
-            "category": "Burger",
-            "image_url": "https://images.unsplash.com/photo-1520072959219-c595dc870360?auto=format&fit=crop&w=800&q=80",
-            "is_popular": False
-        },
-        {
-            "id": "dish_chicken_burger",
-            "name": "Chicken Burger",
-            "description": "Grilled chicken patty with special sauce",
-            "price": 70,
-            "category": "Burger",
-            "image_url": "https://images.unsplash.com/photo-1606755962773-d324e0a13086?auto=format&fit=crop&w=800&q=80",
-            "is_popular": False
+# Synthetic documents are recognisable by these prefixes (see --reset)
+SYNTHETIC_DISH_PREFIX = "dish_syn_"
+SYNTHETIC_ORDER_PREFIX = "SYN"
+SYNTHETIC_SESSION_PREFIX = "syn-"
+
+# Relative order volume per hour of the day (local time), peaking at lunch
+HOURLY_WEIGHTS = {7: 2, 8: 6, 9: 7, 10: 4, 11: 6, 12: 14, 13: 15, 14: 8, 15: 4, 16: 6, 17: 7, 18: 5, 19: 4, 20: 3}
+# Monday .. Sunday
+WEEKDAY_WEIGHTS = (1.0, 1.0, 1.0, 1.0, 1.1, 0.6, 0.3)
+# Lines per order: 1 to 4
+LINE_COUNT_WEIGHTS = (45, 30, 17, 8)
+# Orders placed within this window are still moving through the kitchen
+ACTIVE_WINDOW = timedelta(hours=1)
+
+CATEGORIES = [
+    {
+        "id": "cat_coffee",
+        "name": "Coffee",
+        "image_url": "https://images.unsplash.com/photo-1762657440603-2afa5580eaf8?auto=format&fit=crop&w=800&q=80",
+        "order": 1
+    },
+    {
+        "id": "cat_tea",
+        "name": "Tea",
+        "image_url": "https://images.unsplash.com/photo-1701933810995-3331d9ff463b?auto=format&fit=crop&w=800&q=80",
+        "order": 2
+    },
+    {
+        "id": "cat_sandwich",
+        "name": "Sandwich",
+        "image_url": "https://images.unsplash.com/photo-1717250180255-5509e931bded?auto=format&fit=crop&w=800&q=80",
+        "order": 3
+    },
+    {
+        "id": "cat_cookies",
+        "name": "Cookies",
+        "image_url": "https://images.unsplash.com/photo-1613563628001-aac5a5307153?auto=format&fit=crop&w=800&q=80",
+        "order": 4
+    },
+    {
+        "id": "cat_pizza",
+        "name": "Pizza",
+        "image_url": "https://images.unsplash.com/photo-1767065604070-574bb62ce4fc?auto=format&fit=crop&w=800&q=80",
+        "order": 5
+    },
+    {
+        "id": "cat_burger",
+        "name": "Burger",
+        "image_url": "https://images.unsplash.com/photo-1632898657999-ae6920976661?auto=format&fit=crop&w=800&q=80",
+        "order": 6
+    }
+]
+
+DISHES = [
+    # Coffee
+    {
+        "id": "dish_espresso",
+        "name": "Espresso",
+        "description": "Rich and bold single shot espresso",
+        "price": 50,
+        "category": "Coffee",
+        "image_url": "https://images.unsplash.com/photo-1510591509098-f4fdc6d0ff04?auto=format&fit=crop&w=800&q=80",
+        "is_popular": True
+    },
+    {
+        "id": "dish_cappuccino",
+        "name": "Cappuccino",
+        "description": "Classic Italian coffee with steamed milk foam",
+        "price": 50,
+        "category": "Coffee",
+        "image_url": "https://images.unsplash.com/photo-1572442388796-11668a67e53d?auto=format&fit=crop&w=800&q=80",
+        "is_popular": True
+    },
+    {
+        "id": "dish_latte",
+        "name": "Latte",
+        "description": "Smooth coffee with steamed milk",
+        "price": 50,
+        "category": "Coffee",
+        "image_url": "https://images.unsplash.com/photo-1541167760496-1628856ab772?auto=format&fit=crop&w=800&q=80",
+        "is_popular": False
+    },
+    {
+        "id": "dish_americano",
+        "name": "Americano",
+        "description": "Espresso with hot water",
+        "price": 50,
+        "category": "Coffee",
+        "image_url": "https://images.unsplash.com/photo-1514432324607-a09d9b4aefdd?auto=format&fit=crop&w=800&q=80",
+        "is_popular": False
+    },
+
+    # Tea
+    {
+        "id": "dish_masala_chai",
+        "name": "Masala Chai",
+        "description": "Traditional Indian spiced tea",
+        "price": 20,
+        "category": "Tea",
+        "image_url": "https://images.unsplash.com/photo-1597318181275-c0f61c36f1bc?auto=format&fit=crop&w=800&q=80",
+        "is_popular": False
+    },
+    {
+        "id": "dish_green_tea",
+        "name": "Green Tea",
+        "description": "Refreshing and healthy green tea",
+        "price": 20,
+        "category": "Tea",
+        "image_url": "https://images.unsplash.com/photo-1627435601361-ec25f5b1d0e5?auto=format&fit=crop&w=800&q=80",
+        "is_popular": False
+    },
+    {
+        "id": "dish_lemon_tea",
+        "name": "Lemon Tea",
+        "description": "Refreshing tea with a zesty lemon twist",
+        "price": 20,
+        "category": "Tea",
+        "image_url": "https://images.unsplash.com/photo-1556679343-c7306c1976bc?auto=format&fit=crop&w=800&q=80",
+        "is_popular": False
+    },
+    {
+        "id": "dish_iced_tea",
+        "name": "Iced Tea",
+        "description": "Chilled tea perfect for hot days",
+        "price": 20,
+        "category": "Tea",
+        "image_url": "https://images.unsplash.com/photo-1499638309848-e9968540da83?auto=format&fit=crop&w=800&q=80",
+        "is_popular": False
+    },
+
+    # Sandwich
+    {
+        "id": "dish_club_sandwich",
+        "name": "Club Sandwich",
+        "description": "Triple layer sandwich with chicken and veggies",
+        "price": 50,
+        "category": "Sandwich",
+        "image_url": "https://images.unsplash.com/photo-1528735602780-2552fd46c7af?auto=format&fit=crop&w=800&q=80",
+        "is_popular": True
+    },
+    {
+        "id": "dish_veg_sandwich",
+        "name": "Veg Sandwich",
+        "description": "Fresh vegetables with tangy chutney",
+        "price": 50,
+        "category": "Sandwich",
+        "image_url": "https://images.unsplash.com/photo-1509722747041-616f39b57569?auto=format&fit=crop&w=800&q=80",
+        "is_popular": False
+    },
+    {
+        "id": "dish_grilled_sandwich",
+        "name": "Grilled Sandwich",
+        "description": "Crispy grilled sandwich with cheese",
+        "price": 50,
+        "category": "Sandwich",
+        "image_url": "https://images.unsplash.com/photo-1621852004146-75d47c57e990?auto=format&fit=crop&w=800&q=80",
+        "is_popular": False
+    },
+    {
+        "id": "dish_paneer_sandwich",
+        "name": "Paneer Sandwich",
+        "description": "Grilled sandwich with spiced paneer",
+        "price": 50,
+        "category": "Sandwich",
+        "image_url": "https://images.unsplash.com/photo-1553909489-cd47e0907980?auto=format&fit=crop&w=800&q=80",
+        "is_popular": False
+    },
+
+    # Cookies
+    {
+        "id": "dish_choco_chip",
+        "name": "Chocolate Chip Cookies",
+        "description": "Classic cookies with chocolate chips",
+        "price": 30,
+        "category": "Cookies",
+        "image_url": "https://images.unsplash.com/photo-1499636136210-6f4ee915583e?auto=format&fit=crop&w=800&q=80",
+        "is_popular": False
+    },
+    {
+        "id": "dish_oatmeal_cookies",
+        "name": "Oatmeal Cookies",
+        "description": "Healthy oatmeal cookies with raisins",
+        "price": 30,
+        "category": "Cookies",
+        "image_url": "https://images.unsplash.com/photo-1590841609987-4ac211afdde1?auto=format&fit=crop&w=800&q=80",
+        "is_popular": False
+    },
+    {
+        "id": "dish_butter_cookies",
+        "name": "Butter Cookies",
+        "description": "Melt-in-mouth butter cookies",
+        "price": 30,
+        "category": "Cookies",
+        "image_url": "https://images.unsplash.com/photo-1558961363-fa8fdf82db35?auto=format&fit=crop&w=800&q=80",
+        "is_popular": False
+    },
+    {
+        "id": "dish_double_chocolate",
+        "name": "Double Chocolate Cookies",
+        "description": "Rich chocolate cookies for chocolate lovers",
+        "price": 30,
+        "category": "Cookies",
+        "image_url": "https://images.unsplash.com/photo-1606890737304-57a1ca8a5b62?auto=format&fit=crop&w=800&q=80",
+        "is_popular": False
+    },
+
+    # Pizza
+    {
+        "id": "dish_margherita",
+        "name": "Margherita Pizza",
+        "description": "Classic pizza with cheese and tomato sauce",
+        "price": 100,
+        "category": "Pizza",
+        "image_url": "https://images.unsplash.com/photo-1574071318508-1cdbab80d002?auto=format&fit=crop&w=800&q=80",
+        "is_popular": True
+    },
+    {
+        "id": "dish_pepperoni",
+        "name": "Pepperoni Pizza",
+        "description": "Loaded with pepperoni and cheese",
+        "price": 100,
+        "category": "Pizza",
+        "image_url": "https://images.unsplash.com/photo-1628840042765-356cda07504e?auto=format&fit=crop&w=800&q=80",
+        "is_popular": False
+    },
+    {
+        "id": "dish_veg_pizza",
+        "name": "Veggie Pizza",
+        "description": "Fresh vegetables on cheese base",
+        "price": 100,
+        "category": "Pizza",
+        "image_url": "https://images.unsplash.com/photo-1511689660979-10d2b1aada49?auto=format&fit=crop&w=800&q=80",
+        "is_popular": False
+    },
+    {
+        "id": "dish_farmhouse",
+        "name": "Farmhouse Pizza",
+        "description": "Garden fresh vegetables with cheese",
+        "price": 100,
+        "category": "Pizza",
+        "image_url": "https://images.unsplash.com/photo-1565299624946-b28f40a0ae38?auto=format&fit=crop&w=800&q=80",
+        "is_popular": False
+    },
+
+    # Burger
+    {
+        "id": "dish_classic_burger",
+        "name": "Classic Burger",
+        "description": "Juicy beef patty with lettuce and tomato",
+        "price": 70,
+        "category": "Burger",
+        "image_url": "https://images.unsplash.com/photo-1568901346375-23c9450c58cd?auto=format&fit=crop&w=800&q=80",
+        "is_popular": True
+    },
+    {
+        "id": "dish_cheese_burger",
+        "name": "Cheese Burger",
+        "description": "Classic burger with extra cheese",
+        "price": 70,
+        "category": "Burger",
+        "image_url": "https://images.unsplash.com/photo-1550547660-d9450f859349?auto=format&fit=crop&w=800&q=80",
+        "is_popular": False
+    },
+    {
+        "id": "dish_veg_burger",
+        "name": "Veg Burger",
+        "description": "Crispy vegetable patty burger",
+        "price": 70,
+        "category": "Burger",
+        "image_url": "https://images.unsplash.com/photo-1520072959219-c595dc870360?auto=format&fit=crop&w=800&q=80",
+        "is_popular": False
+    },
+    {
+        "id": "dish_chicken_burger",
+        "name": "Chicken Burger",
+        "description": "Grilled chicken patty with special sauce",
+        "price": 70,
+        "category": "Burger",
+        "image_url": "https://images.unsplash.com/photo-1606755962773-d324e0a13086?auto=format&fit=crop&w=800&q=80",
+        "is_popular": False
+    }
+]
+
+
+# ==================== MENU ====================
+
+async def upsert_menu(categories, dishes, batch_size: int = 1000):
+    """Insert or refresh menu documents by id, leaving everything else in place."""
+    await db.categories.bulk_write(
+        [UpdateOne({"id": c["id"]}, {"$set": c}, upsert=True) for c in categories], ordered=False
+    )
+    for start in range(0, len(dishes), batch_size):
+        await db.dishes.bulk_write(
+            [UpdateOne({"id": d["id"]}, {"$set": d}, upsert=True) for d in dishes[start:start + batch_size]],
+            ordered=False,
+        )
+
+
+def branch_menu(docs: list, branch_id: str) -> list:
+    """Menu documents tagged with `branch_id`; ids are unique across branches."""
+    suffix = "" if branch_id == DEFAULT_BRANCH_ID else f"-{branch_id}"
+    return [{**doc, "id": doc["id"] + suffix, "branch_id": branch_id} for doc in docs]
+
+
+def synthetic_dishes(count: int, seed: int) -> list:
+    rng = random.Random(f"{seed}:dishes")
+    templates = {}
+    for dish in DISHES:
+        templates.setdefault(dish["category"], dish)
+    categories = list(templates)
+    dishes = []
+    for i in range(count):
+        category = categories[i % len(categories)]
+        template = templates[category]
+        dishes.append({
+            "id": f"{SYNTHETIC_DISH_PREFIX}{i:06d}",
+            "name": f"{category} Special {i + 1}",
+            "description": f"House {category.lower()} variation number {i + 1}",
+            "price": template["price"] + rng.choice((0, 0, 10, 20, 30)),
+            "category": category,
+            "image_url": template["image_url"],
+            "is_popular": rng.random() < 0.02,
+        })
+    return dishes
+
+
+# ==================== SYNTHETIC LOAD ====================
+
+class Timeline:
+    """Samples order timestamps over the last `days` days with canteen rush hours.
+
+    Today only contributes the hours that have started, weighted accordingly;
+    before it opens, the window ends yesterday.
+    """
+
+    def __init__(self, days: int, now: datetime, tz: ZoneInfo):
+        self.now = now
+        self.today = now.astimezone(tz).replace(hour=0, minute=0, second=0, microsecond=0)
+        self.hours = list(HOURLY_WEIGHTS)
+        self.hour_weights = list(accumulate(HOURLY_WEIGHTS.values()))
+        self.today_hours = [hour for hour in self.hours if self.today + timedelta(hours=hour) < now]
+        self.today_weights = list(accumulate(HOURLY_WEIGHTS[hour] for hour in self.today_hours))
+        first = 0 if self.today_hours else 1
+        self.days = [self.today - timedelta(days=offset) for offset in range(first, first + days)]
+        self.day_weights = list(accumulate(
+            WEEKDAY_WEIGHTS[day.weekday()] * (self.today_weights[-1] / self.hour_weights[-1] if day == self.today else 1)
+            for day in self.days
+        ))
+
+    def sample(self, rng: random.Random) -> datetime:
+        day = rng.choices(self.days, cum_weights=self.day_weights)[0]
+        if day == self.today:
+            hour = rng.choices(self.today_hours, cum_weights=self.today_weights)[0]
+        else:
+            hour = rng.choices(self.hours, cum_weights=self.hour_weights)[0]
+        start = day + timedelta(hours=hour)
+        # The current hour is only sampled up to now
+        span = max(1, min(3600 * 1000, (self.now - start) // timedelta(milliseconds=1)))
+        return (start + timedelta(milliseconds=rng.randrange(span))).astimezone(timezone.utc)
+
+
+def _uuid(rng: random.Random) -> str:
+    return str(uuid.UUID(int=rng.getrandbits(128), version=4))
+
+
+def _pick_lines(rng: random.Random, dishes: list, dish_weights: list) -> list:
+    count = rng.choices((1, 2, 3, 4), weights=LINE_COUNT_WEIGHTS)[0]
+    lines = {}
+    for dish in rng.choices(dishes, cum_weights=dish_weights, k=count):
+        _, quantity = lines.get(dish["id"], (dish, 0))
+        lines[dish["id"]] = (dish, quantity + rng.choices((1, 2, 3), weights=(70, 22, 8))[0])
+    return list(lines.values())
+
+
+def order_batch(args, batch: int, dishes: list, dish_weights: list, timeline: Timeline):
+    """Orders and their notifications for one batch; each batch has its own seeded RNG."""
+    rng = random.Random(f"{args.seed_key}:orders:{batch}")
+    orders, notifications = [], []
+    for n in range(batch * args.batch_size, min(args.orders, (batch + 1) * args.batch_size)):
+        timestamp = timeline.sample(rng)
+        items = [
+            {"dish_id": dish["id"], "dish_name": dish["name"], "dish_price": float(dish["price"]), "quantity": quantity}
+            for dish, quantity in _pick_lines(rng, dishes, dish_weights)
+        ]
+        recent = timeline.now - timestamp < ACTIVE_WINDOW
+        order = {
+            "id": _uuid(rng),
+            "branch_id": args.branch,
+            "order_number": f"{SYNTHETIC_ORDER_PREFIX}{n + 1:08d}",
+            "session_id": f"{SYNTHETIC_SESSION_PREFIX}{rng.randrange(args.sessions)}",
+            "table_number": rng.randint(1, args.tables),
+            "items": items,
+            "total": round(sum(item["dish_price"] * item["quantity"] for item in items), 2),
+            "status": rng.choice(("pending", "preparing", "ready", "served")) if recent else "served",
+            "timestamp": timestamp,
         }
-    ]
-    
-    await db.dishes.insert_many(dishes)
-    print("✓ Dishes seeded")
-    
+        orders.append(order)
+        notifications.append({
+            "id": _uuid(rng),
+            "branch_id": args.branch,
+            "order_id": order["id"],
+            "order_number": order["order_number"],
+            "table_number": order["table_number"],
+            "message": f"An order is placed from table {order['table_number']}.",
+            "read": not recent,
+            "timestamp": timestamp,
+        })
+    return orders, notifications
+
+
+def cart_batch(args, batch: int, dishes: list, dish_weights: list, now: datetime):
+    """Open carts, touched within the last `cart_hours`, most of them recently."""
+    rng = random.Random(f"{args.seed_key}:carts:{batch}")
+    rows = []
+    for n in range(batch * args.batch_size, min(args.carts, (batch + 1) * args.batch_size)):
+        session_id = f"{SYNTHETIC_SESSION_PREFIX}cart-{n}"
+        updated_at = now - timedelta(hours=min(args.cart_hours, rng.expovariate(3 / args.cart_hours)))
+        for dish, quantity in _pick_lines(rng, dishes, dish_weights):
+            rows.append({
+                "id": _uuid(rng),
+                "branch_id": args.branch,
+                "session_id": session_id,
+                "dish_id": dish["id"],
+                "dish_name": dish["name"],
+                "dish_price": float(dish["price"]),
+                "dish_image": variant_url(dish["image_url"], "thumb"),
+                "quantity": quantity,
+                "updated_at": updated_at,
+            })
+    return rows
+
+
+async def insert_unordered(collection, docs: list) -> int:
+    """Insert what is missing; documents that already exist (same unique key) are skipped."""
+    if not docs:
+        return 0
+    try:
+        result = await collection.insert_many(docs, ordered=False)
+        return len(result.inserted_ids)
+    except BulkWriteError as exc:
+        if any(error["code"] != DUPLICATE_KEY for error in exc.details["writeErrors"]):
+            raise
+        return exc.details["nInserted"]
+
+
+class Progress:
+    def __init__(self, label: str, total: Optional[int], interval: float = 2.0):
+        self.label = label
+        self.total = total
+        self.interval = interval
+        self.done = 0
+        self.inserted = 0
+        self.started = time.perf_counter()
+        self._reported = self.started
+
+    def update(self, done: int, inserted: int):
+        self.done += done
+        self.inserted += inserted
+        now = time.perf_counter()
+        if now - self._reported >= self.interval:
+            self._reported = now
+            done = f"{self.done:,}/{self.total:,} ({self.done / self.total:.0%})" if self.total else f"{self.done:,}"
+            print(f"  {self.label}: {done}, {self.done / (now - self.started):,.0f}/s")
+
+    def finish(self):
+        elapsed = time.perf_counter() - self.started
+        print(f"✓ {self.label}: {self.inserted:,} inserted, {self.done - self.inserted:,} already present "
+              f"in {elapsed:.1f}s ({self.done / max(elapsed, 1e-9):,.0f}/s)")
+
+
+async def load_batches(label: str, total: Optional[int], batches: int, make_batch, write_batch, concurrency: int):
+    """Generate batches in order and write them on `concurrency` concurrent writers."""
+    progress = Progress(label, total)
+    queue: asyncio.Queue = asyncio.Queue(maxsize=concurrency * 2)
+
+    async def writer():
+        while True:
+            batch = await queue.get()
+            try:
+                if batch is None:
+                    return
+                size, inserted = await write_batch(batch)
+                progress.update(size, inserted)
+            finally:
+                queue.task_done()
+
+    writers = [asyncio.create_task(writer()) for _ in range(concurrency)]
+    try:
+        for batch in range(batches):
+            await queue.put(make_batch(batch))
+        for _ in writers:
+            await queue.put(None)
+        await asyncio.gather(*writers)
+    finally:
+        for task in writers:
+            task.cancel()
+    progress.finish()
+
+
+async def reset_synthetic(branch_id: str):
+    await db.dishes.delete_many({"branch_id": branch_id, "id": {"$regex": f"^{SYNTHETIC_DISH_PREFIX}"}})
+    await db.orders.delete_many({"branch_id": branch_id, "order_number": {"$regex": f"^{SYNTHETIC_ORDER_PREFIX}"}})
+    await db.notifications.delete_many({"branch_id": branch_id, "order_number": {"$regex": f"^{SYNTHETIC_ORDER_PREFIX}"}})
+    await db.cart.delete_many({"branch_id": branch_id, "session_id": {"$regex": f"^{SYNTHETIC_SESSION_PREFIX}"}})
+    print("✓ Previous synthetic data removed")
+
+
+async def rebuild_rollups(branch_id: str, dishes: list, timeline: Timeline):
+    """Recompute the branch's sales rollups for every day the timeline covers, up to today."""
+    categories = {dish["id"]: dish["category"] for dish in dishes}
+    tz = os.environ.get('ANALYTICS_TZ', os.environ.get('ORDER_NUMBER_TZ', 'UTC'))
+    rollups = SalesRollups(db, categories.get, tz=tz, branch_id=branch_id)
+    day = timeline.days[-1].astimezone(rollups.tz).date()
+    until = timeline.now.astimezone(rollups.tz).date()
+    buckets = skipped = 0
+    while day <= until:
+        # One pipeline run per day keeps each aggregation small
+        try:
+            buckets += await rollups.rebuild(day, day)
+        except ValueError:
+            # Days before the archive watermark keep the rollups they have
+            skipped += 1
+        day += timedelta(days=1)
+    print(f"✓ Sales rollups rebuilt: {buckets} hourly buckets" + (f", {skipped} archived days skipped" if skipped else ""))
+
+
+async def seed_database(args):
+    # The unique indexes are what make the synthetic inserts idempotent
+    await bootstrap(db, migrate=False)
+    if args.reset:
+        await reset_synthetic(args.branch)
+
+    categories = branch_menu(CATEGORIES, args.branch)
+    dishes = branch_menu(DISHES + synthetic_dishes(args.dishes, args.seed), args.branch)
+    await upsert_menu(categories, dishes, args.batch_size)
+    print(f"✓ Menu seeded for branch {args.branch}: {len(categories)} categories, {len(dishes)} dishes")
+
+    if args.local_images:
+        store = store_from_env(ROOT_DIR)
+        localized = await localize(db, store)
+        print(f"✓ Menu images localized: {localized} image URLs")
+        # The banner JPEGs shipped next to this script, already named by their digest
+        shipped = await ingest_files(store, sorted(ROOT_DIR.glob("*.jpeg")))
+        print(f"✓ Shipped images ingested: {', '.join(store.url(digest) for digest in shipped)}")
+        stored = await db.dishes.find({}, {"_id": 0, "id": 1, "image_url": 1}).to_list(None)
+        image_urls = {d["id"]: d["image_url"] for d in stored}
+        dishes = [{**d, "image_url": image_urls.get(d["id"], d["image_url"])} for d in dishes]
+    # Popularity follows a Zipf-like curve over the menu, popular dishes first
+    ranked = sorted(dishes, key=lambda d: not d["is_popular"])
+    dish_weights = list(accumulate(1 / (rank + 1) for rank in range(len(ranked))))
+    now = datetime.now(timezone.utc)
+
+    if args.orders:
+        timeline = Timeline(args.days, now, ZoneInfo(args.tz))
+
+        async def write_orders(batch):
+            orders, notifications = batch
+            inserted, _ = await asyncio.gather(
+                insert_unordered(db.orders, orders),
+                insert_unordered(db.notifications, notifications),
+            )
+            return len(orders), inserted
+
+        await load_batches(
+            "orders", args.orders, -(-args.orders // args.batch_size),
+            lambda batch: order_batch(args, batch, ranked, dish_weights, timeline),
+            write_orders, args.concurrency,
+        )
+
+    if args.carts:
+        async def write_carts(rows):
+            return len(rows), await insert_unordered(db.cart, rows)
+
+        await load_batches(
+            "cart rows", None, -(-args.carts // args.batch_size),
+            lambda batch: cart_batch(args, batch, ranked, dish_weights, now),
+            write_carts, args.concurrency,
+        )
+
+    # Invalidate the API's in-memory menu cache and resync the unread badge
+    await db.counters.update_one({"_id": menu_version_id(args.branch)}, {"$inc": {"value": 1}}, upsert=True)
+    await UnreadCounter(db).reconcile([args.branch])
+
+    if args.orders:
+        # Bulk-inserted orders bypass checkout, so their sales rollups are rebuilt here
+        await rebuild_rollups(args.branch, dishes, timeline)
+
     print("\n✅ Database seeded successfully!")
     client.close()
 
 
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--dishes", type=int, default=0, help="synthetic dishes to add to the curated menu")
+    parser.add_argument("--orders", type=int, default=0, help="synthetic orders (each with a notification)")
+    parser.add_argument("--carts", type=int, default=0, help="synthetic open carts (sessions)")
+    parser.add_argument("--days", type=int, default=90, help="spread orders over this many days up to now")
+    parser.add_argument("--tz", default=os.environ.get('ORDER_NUMBER_TZ', 'UTC'), help="time zone of the opening hours")
+    parser.add_argument("--tables", type=int, default=40)
+    parser.add_argument("--sessions", type=int, default=None, help="distinct ordering sessions (default: orders / 4)")
+    parser.add_argument("--cart-hours", type=float, default=12.0, help="carts were last touched within this many hours")
+    parser.add_argument("--batch-size", type=int, default=5000, help="documents per insert_many")
+    parser.add_argument("--concurrency", type=int, default=4, help="concurrent insert_many batches")
+    parser.add_argument("--seed", type=int, default=1, help="random seed; the same seed regenerates the same documents")
+    parser.add_argument("--local-images", action="store_true",
+                        help="download the menu images into the local image store, point the menu at it "
+                             "and add the shipped banner JPEGs")
+    parser.add_argument("--branch", default=DEFAULT_BRANCH_ID, help="branch to seed")
+    parser.add_argument("--reset", action="store_true", help="remove the branch's previously generated synthetic data first")
+    args = parser.parse_args()
+    try:
+        if parse_branch_ids(args.branch) != [args.branch]:
+            parser.error("--branch takes a single branch id")
+    except ValueError as exc:
+        parser.error(str(exc))
+    if args.days < 1:
+        parser.error("--days must be at least 1")
+    # The default branch keeps the documents earlier runs generated
+    args.seed_key = args.seed if args.branch == DEFAULT_BRANCH_ID else f"{args.branch}:{args.seed}"
+    args.sessions = args.sessions or max(1, args.orders // 4)
+    return args
+
+
 if __name__ == "__main__":
-    asyncio.run(seed_database())
+    asyncio.run(seed_database(parse_args()))
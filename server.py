@@ -1,26 +1,56 @@
-from fastapi import FastAPI, APIRouter, HTTPException
+from fastapi import (FastAPI, APIRouter, Depends, HTTPException, Query, Request, WebSocket, WebSocketDisconnect,
+                     WebSocketException, status)
+from fastapi.responses import PlainTextResponse, StreamingResponse
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
-from motor.motor_asyncio import AsyncIOMotorClient
+from starlette.requests import HTTPConnection
+from pymongo import ReturnDocument
 import os
+import asyncio
+import json
 import logging
 from pathlib import Path
 from pydantic import BaseModel, Field, ConfigDict
 from typing import List, Optional
 import uuid
-from datetime import datetime, timezone
+from contextlib import asynccontextmanager
+from datetime import date, datetime, time, timedelta, timezone
+from time import perf_counter
+
+from analytics import GROUP_BY, SalesRollups
+from archive import OrderArchive
+from branches import BRANCH_HEADER, DEFAULT_BRANCH_ID, BranchRegistry, parse_branch_ids, request_branch_id
+from cart_store import CachedCartStore, CartStore
+from dish_search import SORTS as DISH_SORTS, DishIndex
+from fast_json import FastJSONResponse, model_defaults, trusted_response
+from idempotency import (IDEMPOTENCY_HEADER, MAX_KEY_LENGTH, REPLAYED_HEADER, IdempotencyStore, KeyReused,
+                         OutcomeUnknown, RequestInProgress, cart_key, items_key, request_fingerprint)
+from image_store import ImageFiles, store_from_env
+from indexes import DEFAULT_CART_TTL_SECONDS, bootstrap as bootstrap_database
+from kitchen import ALL_STATIONS, TRANSITIONS, KitchenQueue, KitchenSync
+from menu_cache import MenuCache, cached_json_response
+from metrics import Metrics, MetricsMiddleware
+from notification_bus import ChangeStreamSource, NotificationBus, format_sse
+from order_ingest import GroupCommitter, QueueFull
+from order_export import EXPORT_BATCH_SIZE, EXPORT_FORMATS, MEDIA_TYPES, export_stream
+from order_numbers import OrderNumberAllocator
+from pagination import KEYSET_SORT, NEXT_CURSOR_HEADER, encode_cursor, keyset_query, projection_for
+from storage import connect as connect_storage
+from unread_counter import UnreadCounter
 
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
-# MongoDB connection
-mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
-db = client[os.environ['DB_NAME']]
+# Request and database command metrics, exposed on /api/metrics
+metrics = Metrics(slow_request_seconds=float(os.environ.get('SLOW_REQUEST_MS', '0')) / 1000)
 
-# Create the main app without a prefix
-app = FastAPI()
+# Database connection (MongoDB, or the in-memory engine with STORAGE_ENGINE=memory)
+# and the services bound to it are created by connect_database() when the app
+# starts, and the app itself by create_app(), so importing this module opens no
+# connections and touches no directories
+client = None
+db = None
 
 # Create a router with the /api prefix
 api_router = APIRouter(prefix="/api")
@@ -31,6 +61,7 @@ api_router = APIRouter(prefix="/api")
 class Category(BaseModel):
     model_config = ConfigDict(extra="ignore")
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    branch_id: str = DEFAULT_BRANCH_ID
     name: str
     image_url: str
     order: int = 0
@@ -43,6 +74,7 @@ class CategoryCreate(BaseModel):
 class Dish(BaseModel):
     model_config = ConfigDict(extra="ignore")
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    branch_id: str = DEFAULT_BRANCH_ID
     name: str
     description: str
     price: float
@@ -61,6 +93,7 @@ class DishCreate(BaseModel):
 class CartItem(BaseModel):
     model_config = ConfigDict(extra="ignore")
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    branch_id: str = DEFAULT_BRANCH_ID
     session_id: str
     dish_id: str
     dish_name: str
@@ -77,6 +110,19 @@ class CartItemUpdate(BaseModel):
     dish_id: str
     quantity: int
 
+class CartSyncItem(BaseModel):
+    dish_id: str
+    quantity: int
+
+class CartSync(BaseModel):
+    items: List[CartSyncItem]
+
+class CartSummary(BaseModel):
+    session_id: str
+    items: List[CartItem]
+    item_count: int
+    total: float
+
 class OrderItem(BaseModel):
     dish_id: str
     dish_name: str
@@ -86,6 +132,7 @@ class OrderItem(BaseModel):
 class Order(BaseModel):
     model_config = ConfigDict(extra="ignore")
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    branch_id: str = DEFAULT_BRANCH_ID
     order_number: str
     session_id: str
     table_number: int
@@ -94,15 +141,21 @@ class Order(BaseModel):
     status: str = "pending"
     timestamp: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
 
+class OrderStatusUpdate(BaseModel):
+    status: str
+
 class OrderCreate(BaseModel):
     session_id: str
     table_number: int
-    items: List[OrderItem]
-    total: float
+    # Only used when the session has no server-side cart; prices are always
+    # taken from the menu and any client-supplied total is ignored
+    items: List[OrderItem] = Field(default_factory=list)
+    total: Optional[float] = None
 
 class Notification(BaseModel):
     model_config = ConfigDict(extra="ignore")
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    branch_id: str = DEFAULT_BRANCH_ID
     order_id: str
     order_number: str
     table_number: int
@@ -116,221 +169,854 @@ class NotificationCreate(BaseModel):
     table_number: int
     message: str
 
+class NotificationReadBulk(BaseModel):
+    # Criteria are combined; at least one is required
+    ids: Optional[List[str]] = None
+    before: Optional[datetime] = None
+    table_number: Optional[int] = None
+
+
+# History and notification lists are paged newest-first by (timestamp, id)
+PAGE_SIZE_DEFAULT = int(os.environ.get('PAGE_SIZE_DEFAULT', '50'))
+PAGE_SIZE_MAX = 200
+ORDER_PROJECTION = projection_for(Order)
+NOTIFICATION_PROJECTION = projection_for(Notification)
+CART_PROJECTION = projection_for(CartItem)
+
+# Documents read with these projections were written by this service, so list
+# routes encode them directly instead of re-validating against response_model
+ORDER_DEFAULTS = model_defaults(Order)
+NOTIFICATION_DEFAULTS = model_defaults(Notification)
+CART_DEFAULTS = model_defaults(CartItem)
+
+# Branches served by this deployment (BRANCHES=main,north,...). Every query on
+# behalf of a request is scoped to its branch, chosen with the X-Branch-Id
+# header or ?branch=, so each branch reads only its own slice.
+BRANCHES = parse_branch_ids(os.environ.get('BRANCHES', DEFAULT_BRANCH_ID)) or [DEFAULT_BRANCH_ID]
+
+# Services bound to the database, created by connect_database()
+notification_changes: Optional[ChangeStreamSource] = None
+unread_counter: Optional[UnreadCounter] = None
+order_archive: Optional[OrderArchive] = None
+order_ingest: Optional[GroupCommitter] = None
+order_numbers: Optional[OrderNumberAllocator] = None
+order_requests: Optional[IdempotencyStore] = None
+
+# Session carts; with CART_CACHE=1 the hot carts live in memory and are written
+# behind to MongoDB, which needs session affinity when running several workers
+CART_CACHE = os.environ.get('CART_CACHE', '0') == '1'
+
+def _cart_store(branch_id: str) -> CartStore:
+    if not CART_CACHE:
+        return CartStore(db, CART_PROJECTION, branch_id)
+    return CachedCartStore(
+        db, CART_PROJECTION, branch_id,
+        shards=int(os.environ.get('CART_CACHE_SHARDS', '16')),
+        max_sessions=int(os.environ.get('CART_CACHE_MAX_SESSIONS', '10000')),
+        idle_ttl=float(os.environ.get('CART_CACHE_IDLE_SECONDS', '900')),
+        flush_interval=float(os.environ.get('CART_CACHE_FLUSH_MS', '1000')) / 1000,
+    )
+
+ANALYTICS_MAX_DAYS = 366
+
+
+class BranchState:
+    """A branch's in-memory state: catalog cache and search index, kitchen
+    queue, event buses, carts and sales rollups."""
+
+    def __init__(self, branch_id: str):
+        self.branch_id = branch_id
+        
+        # Dish search index, kept in step with the catalog cache
+        self.dish_index = DishIndex(cache_size=int(os.environ.get('DISH_SEARCH_CACHE_SIZE', '1024')))
+        
+        # Catalog cache shared by the menu routes
+        self.menu_cache = MenuCache(
+            db, Category, Dish, branch_id,
+            refresh_interval=float(os.environ.get('MENU_CACHE_REFRESH_SECONDS', '5')),
+            on_load=self.dish_index.sync,
+        )
+        
+        self.notification_bus = NotificationBus(history=int(os.environ.get('NOTIFICATIONS_REPLAY_BUFFER', '1000')))
+        
+        # Kitchen display: active orders per station (dish category), kept in memory
+        self.kitchen_queue = KitchenQueue(lambda dish_id: (self.menu_cache.dish(dish_id) or {}).get("category", "General"))
+        self.kitchen_bus = NotificationBus(history=int(os.environ.get('KITCHEN_REPLAY_BUFFER', '500')))
+        self.kitchen_sync = KitchenSync(
+            db, self.kitchen_queue,
+            interval=float(os.environ.get('KITCHEN_SYNC_SECONDS', '2')),
+            on_change=lambda: self.kitchen_bus.publish("sync", {"stations": [ALL_STATIONS]}),
+            branch_id=branch_id,
+        )
+        
+        self.carts = _cart_store(branch_id)
+        
+        # Sales reports read hourly rollups that checkout maintains with $inc
+        self.sales_rollups = SalesRollups(
+            db,
+            lambda dish_id: (self.menu_cache.dish(dish_id) or {}).get("category"),
+            tz=os.environ.get('ANALYTICS_TZ', os.environ.get('ORDER_NUMBER_TZ', 'UTC')),
+            branch_id=branch_id,
+        )
+
+    @property
+    def sequence(self) -> Optional[str]:
+        # The default branch keeps the order numbers issued before branches existed
+        return None if self.branch_id == DEFAULT_BRANCH_ID else self.branch_id
+
+    def publish(self, event_type: str, data):
+        if notification_changes is None:
+            self.notification_bus.publish(event_type, data)
+
+    def kitchen_update(self, order: dict):
+        self.kitchen_queue.upsert(order)
+        stations = sorted({self.kitchen_queue.station_of(item["dish_id"]) for item in order["items"]})
+        self.kitchen_bus.publish("order", {"order_id": order["id"], "status": order["status"], "stations": stations})
+
+    async def start(self):
+        await self.menu_cache.load()
+        self.menu_cache.start()
+        # Stations are derived from dish categories, so this runs after the menu loads
+        await self.kitchen_sync.load()
+        self.kitchen_sync.start()
+        self.carts.start()
+
+    async def stop(self):
+        await self.kitchen_sync.stop()
+        await self.menu_cache.stop()
+        await self.carts.stop()
+
+
+# Branch states are created on a branch's first request
+branches = BranchRegistry(BRANCHES, BranchState, BranchState.start, BranchState.stop)
+
+async def current_branch(connection: HTTPConnection) -> BranchState:
+    branch_id = request_branch_id(connection)
+    try:
+        return await branches.get(branch_id)
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"Unknown branch: {branch_id}")
+
+# Checkout writes run in a transaction when the deployment supports them
+# (CHECKOUT_TRANSACTIONS=auto|on|off); detected at startup
+use_transactions = False
+
+# Fire-and-forget writes; references are kept so tasks are not collected early
+_background_tasks = set()
+
+def _spawn(coro):
+    task = asyncio.create_task(coro)
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+    return task
+
+# Optional group commit: concurrent checkouts share batched inserts
+ORDER_GROUP_COMMIT = os.environ.get('ORDER_GROUP_COMMIT', '0') == '1'
+
+def _order_queue_full() -> HTTPException:
+    return HTTPException(
+        status_code=503,
+        detail="Too many orders right now, please retry",
+        headers={"Retry-After": os.environ.get('ORDER_RETRY_AFTER', '1')},
+    )
+
+# Retried checkouts get the order the first attempt placed. Requests with an
+# Idempotency-Key are remembered for IDEMPOTENCY_KEY_TTL_SECONDS. Others are
+# keyed on the session's cart rows for IDEMPOTENCY_CART_TTL_SECONDS, or, for
+# client-supplied items, on the dishes ordered for IDEMPOTENCY_ITEMS_TTL_SECONDS:
+# within that window the same session ordering the same dishes again gets the
+# earlier order back, so it is kept short (0 turns it off).
+IDEMPOTENCY_KEY_TTL = float(os.environ.get('IDEMPOTENCY_KEY_TTL_SECONDS', str(24 * 60 * 60)))
+IDEMPOTENCY_CART_TTL = float(os.environ.get('IDEMPOTENCY_CART_TTL_SECONDS', '120'))
+IDEMPOTENCY_ITEMS_TTL = float(os.environ.get('IDEMPOTENCY_ITEMS_TTL_SECONDS', '30'))
+
+def connect_database():
+    """Open the storage client and create the services that use it.
+
+    The app's lifespan calls this; scripts that need `db` before the app
+    starts (benchmarks, fixtures) may call it first, later calls do nothing.
+    """
+    global client, db, notification_changes, unread_counter, order_archive, order_ingest, order_numbers, order_requests
+    if db is not None:
+        return
+    client, db = connect_storage(event_listeners=[metrics.command_listener])
+    
+    # Live dashboard events. With NOTIFICATIONS_CHANGE_STREAM=1 the buses are fed from
+    # a MongoDB change stream (all workers see all events) instead of local publishes.
+    if os.environ.get('NOTIFICATIONS_CHANGE_STREAM', '0') == '1':
+        notification_changes = ChangeStreamSource(
+            db,
+            lambda doc: getattr(branches.peek(doc.get("branch_id", DEFAULT_BRANCH_ID)), "notification_bus", None),
+            lambda doc: Notification(**doc).model_dump_json(),
+        )
+    
+    # Unread counts per branch, maintained with $inc on insert/read instead of counting
+    unread_counter = UnreadCounter(
+        db,
+        refresh_interval=float(os.environ.get('UNREAD_COUNT_REFRESH_SECONDS', '1')),
+        reconcile_interval=float(os.environ.get('UNREAD_COUNT_RECONCILE_SECONDS', '300')),
+    )
+    
+    # Orders past the hot retention window, moved out by archive.py
+    order_archive = OrderArchive(db, cache_blocks=int(os.environ.get('ARCHIVE_CACHE_BLOCKS', '16')))
+    
+    if ORDER_GROUP_COMMIT:
+        order_ingest = GroupCommitter(
+            db,
+            max_queue=int(os.environ.get('ORDER_QUEUE_SIZE', '1000')),
+            flush_interval=float(os.environ.get('ORDER_FLUSH_MS', '5')) / 1000,
+            max_batch=int(os.environ.get('ORDER_BATCH_SIZE', '200')),
+            unread_counter=unread_counter,
+        )
+    
+    # Order numbers are reserved from an atomic sequence per branch, in blocks per worker
+    order_numbers = OrderNumberAllocator(
+        db,
+        block_size=int(os.environ.get('ORDER_NUMBER_BLOCK_SIZE', '20')),
+        reset=os.environ.get('ORDER_NUMBER_RESET', 'never'),
+        tz=os.environ.get('ORDER_NUMBER_TZ', 'UTC'),
+    )
+    
+    order_requests = IdempotencyStore(
+        db, _find_order,
+        lease=float(os.environ.get('IDEMPOTENCY_LEASE_SECONDS', '30')),
+        cache_size=int(os.environ.get('IDEMPOTENCY_CACHE_SIZE', '4096')),
+    )
+
+async def close_database():
+    global client, db, notification_changes, unread_counter, order_archive, order_ingest, order_numbers, order_requests
+    if db is None:
+        return
+    if order_ingest is not None:
+        await order_ingest.stop()
+    if notification_changes is not None:
+        await notification_changes.stop()
+    await unread_counter.stop()
+    await branches.stop()
+    client.close()
+    client = db = notification_changes = unread_counter = order_archive = order_ingest = order_numbers = None
+    order_requests = None
+
 
 # ==================== CATEGORY ROUTES ====================
 
 @api_router.get("/categories", response_model=List[Category])
-async def get_categories():
-    categories = await db.categories.find({}, {"_id": 0}).sort("order", 1).to_list(100)
-    return categories
+async def get_categories(request: Request, branch: BranchState = Depends(current_branch)):
+    await branch.menu_cache.ensure_loaded()
+    return cached_json_response(request, branch.menu_cache.categories_response())
 
 @api_router.post("/categories", response_model=Category)
-async def create_category(category: CategoryCreate):
-    cat_obj = Category(**category.model_dump())
+async def create_category(category: CategoryCreate, branch: BranchState = Depends(current_branch)):
+    cat_obj = Category(**category.model_dump(), branch_id=branch.branch_id)
     doc = cat_obj.model_dump()
     await db.categories.insert_one(doc)
+    await branch.menu_cache.bump()
     return cat_obj
 
 
 # ==================== DISH ROUTES ====================
 
 @api_router.get("/dishes", response_model=List[Dish])
-async def get_dishes(category: Optional[str] = None):
-    query = {}
-    if category:
-        query["category"] = category
-    dishes = await db.dishes.find(query, {"_id": 0}).to_list(1000)
-    return dishes
+async def get_dishes(request: Request, category: Optional[str] = None, branch: BranchState = Depends(current_branch)):
+    await branch.menu_cache.ensure_loaded()
+    return cached_json_response(request, branch.menu_cache.dishes_response(category))
 
 @api_router.get("/dishes/popular", response_model=List[Dish])
-async def get_popular_dishes():
-    dishes = await db.dishes.find({"is_popular": True}, {"_id": 0}).to_list(100)
-    return dishes
+async def get_popular_dishes(request: Request, branch: BranchState = Depends(current_branch)):
+    await branch.menu_cache.ensure_loaded()
+    return cached_json_response(request, branch.menu_cache.popular_response())
+
+@api_router.get("/dishes/search", response_model=List[Dish])
+async def search_dishes(
+    q: str = "",
+    category: Optional[str] = None,
+    min_price: Optional[float] = Query(None, ge=0),
+    max_price: Optional[float] = Query(None, ge=0),
+    popular: Optional[bool] = None,
+    sort: str = Query("relevance", pattern=f"^({'|'.join(DISH_SORTS)})$"),
+    limit: int = Query(PAGE_SIZE_DEFAULT, ge=1, le=PAGE_SIZE_MAX),
+    offset: int = Query(0, ge=0),
+    branch: BranchState = Depends(current_branch),
+):
+    await branch.menu_cache.ensure_loaded()
+    dishes = branch.dish_index.search(q, category, min_price, max_price, popular, sort, limit, offset)
+    return FastJSONResponse(dishes)
 
 @api_router.post("/dishes", response_model=Dish)
-async def create_dish(dish: DishCreate):
-    dish_obj = Dish(**dish.model_dump())
+async def create_dish(dish: DishCreate, branch: BranchState = Depends(current_branch)):
+    dish_obj = Dish(**dish.model_dump(), branch_id=branch.branch_id)
     doc = dish_obj.model_dump()
     await db.dishes.insert_one(doc)
+    await branch.menu_cache.bump()
     return dish_obj
 
 
+# ==================== IMAGE ROUTES ====================
+
+@api_router.post("/images")
+async def upload_image(request: Request):
+    """Ingest the raw request body as an image; `image_url` is what dishes and categories store."""
+    image_store = request.app.state.image_store
+    content_type = request.headers.get("content-type", "")
+    if not content_type.startswith("image/"):
+        raise HTTPException(status_code=415, detail="Send the image bytes with an image/* Content-Type")
+    too_large = HTTPException(status_code=413, detail=f"Images are limited to {image_store.max_bytes} bytes")
+    if int(request.headers.get("content-length") or 0) > image_store.max_bytes:
+        raise too_large
+    # Chunked uploads carry no Content-Length; stop reading once past the limit
+    chunks = []
+    size = 0
+    async for chunk in request.stream():
+        size += len(chunk)
+        if size > image_store.max_bytes:
+            raise too_large
+        chunks.append(chunk)
+    data = b"".join(chunks)
+    try:
+        digest = await asyncio.to_thread(image_store.ingest, data)
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+    return {"id": digest, "image_url": image_store.url(digest), "variants": image_store.urls(digest)}
+
+
 # ==================== CART ROUTES ====================
 
 @api_router.get("/cart/{session_id}", response_model=List[CartItem])
-async def get_cart(session_id: str):
-    cart_items = await db.cart.find({"session_id": session_id}, {"_id": 0}).to_list(1000)
-    return cart_items
+async def get_cart(session_id: str, branch: BranchState = Depends(current_branch)):
+    cart_items = await branch.carts.items(session_id)
+    return trusted_response(cart_items, CART_DEFAULTS)
 
-@api_router.post("/cart/add", response_model=CartItem)
-async def add_to_cart(item: CartItemCreate):
-    # Check if item already exists in cart
-    existing = await db.cart.find_one({"session_id": item.session_id, "dish_id": item.dish_id}, {"_id": 0})
-    
-    if existing:
-        # Increment quantity
-        await db.cart.update_one(
-            {"session_id": item.session_id, "dish_id": item.dish_id},
-            {"$inc": {"quantity": 1}}
-        )
-        existing["quantity"] += 1
-        return CartItem(**existing)
-    
-    # Get dish details
-    dish = await db.dishes.find_one({"id": item.dish_id}, {"_id": 0})
-    if not dish:
+async def _lookup_dish(menu_cache: MenuCache, dish_id: str) -> dict:
+    await menu_cache.ensure_loaded()
+    dish = menu_cache.dish(dish_id)
+    if dish is None:
+        # The dish may have been created on another worker since our last refresh
+        await menu_cache.poll()
+        dish = menu_cache.dish(dish_id)
+    if dish is None:
         raise HTTPException(status_code=404, detail="Dish not found")
+    return dish
+
+@api_router.post("/cart/add", response_model=CartItem)
+async def add_to_cart(item: CartItemCreate, branch: BranchState = Depends(current_branch)):
+    dish = await _lookup_dish(branch.menu_cache, item.dish_id)
+    cart_item = await branch.carts.add(item.session_id, dish)
+    return CartItem(**cart_item)
+
+@api_router.post("/cart/decrement")
+async def decrement_cart_item(item: CartItemCreate, branch: BranchState = Depends(current_branch)):
+    cart_item = await branch.carts.decrement(item.session_id, item.dish_id)
+    if cart_item is None:
+        raise HTTPException(status_code=404, detail="Cart item not found")
+    if cart_item["quantity"] > 0:
+        return CartItem(**cart_item)
     
-    cart_item = CartItem(
-        session_id=item.session_id,
-        dish_id=item.dish_id,
-        dish_name=dish["name"],
-        dish_price=dish["price"],
-        dish_image=dish["image_url"],
-        quantity=1
-    )
-    
-    await db.cart.insert_one(cart_item.model_dump())
-    return cart_item
+    return {"message": "Item removed from cart"}
 
 @api_router.put("/cart/update")
-async def update_cart_item(item: CartItemUpdate):
+async def update_cart_item(item: CartItemUpdate, branch: BranchState = Depends(current_branch)):
     if item.quantity <= 0:
-        await db.cart.delete_one({"session_id": item.session_id, "dish_id": item.dish_id})
+        await branch.carts.remove(item.session_id, item.dish_id)
         return {"message": "Item removed from cart"}
     
-    result = await db.cart.update_one(
-        {"session_id": item.session_id, "dish_id": item.dish_id},
-        {"$set": {"quantity": item.quantity}}
-    )
-    
-    if result.matched_count == 0:
-        raise HTTPException(status_code=404, detail="Cart item not found")
+    dish = await _lookup_dish(branch.menu_cache, item.dish_id)
+    await branch.carts.set_quantity(item.session_id, dish, item.quantity)
     
     return {"message": "Cart updated successfully"}
 
+@api_router.put("/cart/{session_id}", response_model=CartSummary)
+async def sync_cart(session_id: str, cart: CartSync, branch: BranchState = Depends(current_branch)):
+    desired = {}
+    for item in cart.items:
+        desired[item.dish_id] = desired.get(item.dish_id, 0) + item.quantity
+    desired = {dish_id: quantity for dish_id, quantity in desired.items() if quantity > 0}
+    dishes = {dish_id: await _lookup_dish(branch.menu_cache, dish_id) for dish_id in desired}
+    
+    items = [CartItem(**item) for item in await branch.carts.sync(session_id, desired, dishes)]
+    
+    return CartSummary(
+        session_id=session_id,
+        items=items,
+        item_count=sum(item.quantity for item in items),
+        total=round(sum(item.dish_price * item.quantity for item in items), 2),
+    )
+
 @api_router.delete("/cart/remove/{session_id}/{dish_id}")
-async def remove_from_cart(session_id: str, dish_id: str):
-    result = await db.cart.delete_one({"session_id": session_id, "dish_id": dish_id})
+async def remove_from_cart(session_id: str, dish_id: str, branch: BranchState = Depends(current_branch)):
+    removed = await branch.carts.remove(session_id, dish_id)
     
-    if result.deleted_count == 0:
+    if not removed:
         raise HTTPException(status_code=404, detail="Cart item not found")
     
     return {"message": "Item removed from cart"}
 
 @api_router.delete("/cart/clear/{session_id}")
-async def clear_cart(session_id: str):
-    await db.cart.delete_many({"session_id": session_id})
+async def clear_cart(session_id: str, branch: BranchState = Depends(current_branch)):
+    await branch.carts.clear(session_id)
     return {"message": "Cart cleared"}
 
 
 # ==================== ORDER ROUTES ====================
 
-@api_router.post("/orders", response_model=Order)
-async def create_order(order: OrderCreate):
-    # Generate order number
-    order_count = await db.orders.count_documents({})
-    order_number = f"ORD{order_count + 1:05d}"
+async def _price_order_items(menu_cache: MenuCache, lines: List[dict]) -> List[OrderItem]:
+    quantities = {}
+    for line in lines:
+        if line["quantity"] > 0:
+            quantities[line["dish_id"]] = quantities.get(line["dish_id"], 0) + line["quantity"]
+    
+    if any(menu_cache.dish(dish_id) is None for dish_id in quantities):
+        # A dish may have been created on another worker since our last refresh
+        await menu_cache.poll()
+    
+    items = []
+    for dish_id, quantity in quantities.items():
+        dish = menu_cache.dish(dish_id)
+        if dish is None:
+            raise HTTPException(status_code=409, detail=f"Dish {dish_id} is no longer available")
+        items.append(OrderItem(dish_id=dish_id, dish_name=dish["name"], dish_price=dish["price"], quantity=quantity))
+    return items
+
+def _order_notification(order: dict) -> Notification:
+    return Notification(
+        branch_id=order["branch_id"],
+        order_id=order["id"],
+        order_number=order["order_number"],
+        table_number=order["table_number"],
+        message=f"An order is placed from table {order['table_number']}."
+    )
+
+async def _notify_order(notif_doc: dict):
+    # Keyed on order_id so that replays from recovery never duplicate alerts
+    result = await db.notifications.update_one({"order_id": notif_doc["order_id"]}, {"$setOnInsert": notif_doc}, upsert=True)
+    if result.upserted_id is not None:
+        await unread_counter.add(notif_doc["branch_id"], 1)
+
+async def _clear_checked_out_cart(branch_id: str, session_id: str, cart_ids: List[str]):
+    if cart_ids:
+        await db.cart.delete_many({"branch_id": branch_id, "session_id": session_id, "id": {"$in": cart_ids}})
+
+async def _commit_checkout(order_doc: dict, notif_doc: dict, cart_ids: List[str]):
+    if order_ingest is not None:
+        try:
+            await order_ingest.submit(order_doc, notif_doc, cart_ids)
+        except QueueFull:
+            raise _order_queue_full()
+        return
+    
+    if use_transactions:
+        async def write(session):
+            await db.orders.insert_one(order_doc, session=session)
+            await db.notifications.insert_one(notif_doc, session=session)
+            if cart_ids:
+                await db.cart.delete_many(
+                    {"branch_id": order_doc["branch_id"], "session_id": order_doc["session_id"], "id": {"$in": cart_ids}},
+                    session=session,
+                )
+        
+        async with await db.client.start_session() as session:
+            await session.with_transaction(write)
+        # Outside the transaction: every checkout in the branch writes this one
+        # document, and inside they would serialize on write conflicts. If the
+        # worker dies before this, the periodic reconcile repairs the count.
+        await unread_counter.add(order_doc["branch_id"], 1)
+        return
+    
+    # Without transactions the order insert is the commit point. It carries a
+    # marker with the remaining steps, which recover_pending_checkouts replays
+    # if the follow-up writes do not complete.
+    await db.orders.insert_one({**order_doc, "checkout_pending": {"cart_ids": cart_ids}})
+    await asyncio.gather(
+        _notify_order(notif_doc),
+        _clear_checked_out_cart(order_doc["branch_id"], order_doc["session_id"], cart_ids),
+    )
+    _spawn(db.orders.update_one({"id": order_doc["id"]}, {"$unset": {"checkout_pending": ""}}))
+
+async def recover_pending_checkouts() -> int:
+    recovered = 0
+    async for doc in db.orders.find({"checkout_pending": {"$exists": True}}, {"_id": 0}):
+        doc.setdefault("branch_id", DEFAULT_BRANCH_ID)
+        await _notify_order(_order_notification(doc).model_dump())
+        await _clear_checked_out_cart(doc["branch_id"], doc["session_id"], doc["checkout_pending"].get("cart_ids", []))
+        await db.orders.update_one({"id": doc["id"]}, {"$unset": {"checkout_pending": ""}})
+        recovered += 1
+    return recovered
+
+async def _find_order(order_id: str) -> Optional[dict]:
+    return await db.orders.find_one({"id": order_id}, ORDER_PROJECTION)
+
+async def _place_order(order: OrderCreate, branch: BranchState, cart_items: Optional[List[dict]]) -> dict:
+    order_number = None
+    if cart_items is None:
+        # Reading the cart and reserving an order number are independent
+        cart_items, order_number = await asyncio.gather(
+            branch.carts.items(order.session_id),
+            order_numbers.next(branch.sequence),
+        )
+    
+    lines = cart_items or [item.model_dump() for item in order.items]
+    items = await _price_order_items(branch.menu_cache, lines)
+    if not items:
+        raise HTTPException(status_code=400, detail="Cart is empty")
+    if order_number is None:
+        order_number = await order_numbers.next(branch.sequence)
     
     order_obj = Order(
+        branch_id=branch.branch_id,
         order_number=order_number,
         session_id=order.session_id,
         table_number=order.table_number,
-        items=order.items,
-        total=order.total
+        items=items,
+        total=round(sum(item.dish_price * item.quantity for item in items), 2)
     )
     
     doc = order_obj.model_dump()
-    doc['timestamp'] = doc['timestamp'].isoformat()
-    await db.orders.insert_one(doc)
+    notification = _order_notification(doc)
+    cart_ids = [item["id"] for item in cart_items]
+    await _commit_checkout(doc, notification.model_dump(), cart_ids)
+    branch.carts.checked_out(order.session_id, cart_ids)
+    _spawn(branch.sales_rollups.record(doc))
+    branch.publish("notification", notification.model_dump_json())
+    branch.kitchen_update(doc)
     
-    # Create notification
-    notification = Notification(
-        order_id=order_obj.id,
-        order_number=order_number,
-        table_number=order.table_number,
-        message=f"An order is placed from table {order.table_number}."
-    )
+    return doc
+
+@api_router.post("/orders", response_model=Order)
+async def create_order(order: OrderCreate, request: Request, branch: BranchState = Depends(current_branch)):
+    if order_ingest is not None and order_ingest.full():
+        raise _order_queue_full()
+    await branch.menu_cache.ensure_loaded()
+    
+    idempotency_key = request.headers.get(IDEMPOTENCY_HEADER)
+    cart_items = None
+    aliases = []
+    if idempotency_key is not None:
+        if not 0 < len(idempotency_key) <= MAX_KEY_LENGTH:
+            raise HTTPException(status_code=400, detail=f"{IDEMPOTENCY_HEADER} must be 1 to {MAX_KEY_LENGTH} characters")
+        key = f"{branch.branch_id}:key:{idempotency_key}"
+        fingerprint = request_fingerprint(order.session_id, order.table_number)
+        ttl = IDEMPOTENCY_KEY_TTL
+    else:
+        # Without a key, the same session submitting the same cart rows again is a retry
+        cart_items = await branch.carts.items(order.session_id)
+        fingerprint = request_fingerprint(order.session_id)
+        if cart_items:
+            key = f"{branch.branch_id}:{cart_key(order.session_id, [item['id'] for item in cart_items])}"
+            ttl = IDEMPOTENCY_CART_TTL
+            # ... including once this checkout has emptied the cart, with or without the items in the body
+            aliases.append(f"{branch.branch_id}:{items_key(order.session_id, [])}")
+            aliases.append(f"{branch.branch_id}:{items_key(order.session_id, cart_items)}")
+        else:
+            key = f"{branch.branch_id}:{items_key(order.session_id, [item.model_dump() for item in order.items])}"
+            ttl = IDEMPOTENCY_ITEMS_TTL
     
-    notif_doc = notification.model_dump()
-    notif_doc['timestamp'] = notif_doc['timestamp'].isoformat()
-    await db.notifications.insert_one(notif_doc)
+    try:
+        if ttl > 0:
+            doc, replayed = await order_requests.run(
+                key, fingerprint, ttl, lambda: _place_order(order, branch, cart_items), aliases
+            )
+        else:
+            doc, replayed = await _place_order(order, branch, cart_items), False
+    except OutcomeUnknown:
+        # The key now points at the order, so the retry returns it if it was written
+        raise HTTPException(status_code=503, detail="The order could not be confirmed, please retry",
+                            headers={"Retry-After": "1"})
+    except RequestInProgress:
+        raise HTTPException(status_code=409, detail="This order is still being placed, please retry",
+                            headers={"Retry-After": "1"})
+    except KeyReused:
+        raise HTTPException(status_code=422, detail=f"{IDEMPOTENCY_HEADER} was already used for a different order")
     
-    # Clear cart
-    await db.cart.delete_many({"session_id": order.session_id})
+    return FastJSONResponse({**ORDER_DEFAULTS, **doc}, headers={REPLAYED_HEADER: "true"} if replayed else None)
+
+@api_router.put("/orders/{order_id}/status", response_model=Order)
+async def update_order_status(order_id: str, update: OrderStatusUpdate, branch: BranchState = Depends(current_branch)):
+    previous = {new: old for old, new in TRANSITIONS.items()}.get(update.status)
+    if previous is None:
+        raise HTTPException(status_code=400, detail=f"Invalid status: {update.status}")
+    
+    # Conditional on the current status so concurrent screens cannot skip or repeat a step
+    order = await db.orders.find_one_and_update(
+        {"id": order_id, "branch_id": branch.branch_id, "status": previous},
+        {"$set": {"status": update.status, "status_updated_at": datetime.now(timezone.utc)}},
+        projection=ORDER_PROJECTION,
+        return_document=ReturnDocument.AFTER,
+    )
+    if order is None:
+        current = await db.orders.find_one({"id": order_id, "branch_id": branch.branch_id}, {"_id": 0, "status": 1})
+        if current is None:
+            current = await _archived_order(branch.branch_id, order_id)
+        if current is None:
+            raise HTTPException(status_code=404, detail="Order not found")
+        raise HTTPException(status_code=409, detail=f"Order is {current['status']}, cannot move to {update.status}")
     
-    return order_obj
+    branch.kitchen_update(order)
+    return Order(**order)
 
 @api_router.get("/orders/history/{session_id}", response_model=List[Order])
-async def get_order_history(session_id: str):
-    orders = await db.orders.find({"session_id": session_id}, {"_id": 0}).sort("timestamp", -1).to_list(1000)
+async def get_order_history(
+    session_id: str,
+    limit: int = Query(PAGE_SIZE_DEFAULT, ge=1, le=PAGE_SIZE_MAX),
+    before: Optional[str] = None,
+    branch: BranchState = Depends(current_branch),
+):
+    query = keyset_query({"branch_id": branch.branch_id, "session_id": session_id}, before)
+    orders = await db.orders.find(query, ORDER_PROJECTION).sort(KEYSET_SORT).limit(limit).to_list(limit)
     
-    for order in orders:
-        if isinstance(order['timestamp'], str):
-            order['timestamp'] = datetime.fromisoformat(order['timestamp'])
+    headers = {NEXT_CURSOR_HEADER: encode_cursor(orders[-1])} if len(orders) == limit else None
+    return trusted_response(orders, ORDER_DEFAULTS, headers)
+
+async def _orders_between(branch_id: str, start: datetime, end: datetime):
+    async for order in order_archive.orders_between(branch_id, start, end):
+        yield order
+    query = {"branch_id": branch_id, "timestamp": {"$gte": start, "$lt": end}}
+    cursor = db.orders.find(query, ORDER_PROJECTION).sort([("timestamp", 1), ("id", 1)]).batch_size(EXPORT_BATCH_SIZE)
+    async for order in cursor:
+        yield order
+
+@api_router.get("/orders/export")
+async def export_orders(
+    start: date,
+    end: Optional[date] = None,
+    format: str = Query("ndjson", pattern=f"^({'|'.join(EXPORT_FORMATS)})$"),
+    gzip: bool = False,
+    branch: BranchState = Depends(current_branch),
+):
+    """Stream one row per order item for local days `start`..`end`, archived orders first."""
+    end = end or start
+    if start > end:
+        raise HTTPException(status_code=400, detail="start must not be after end")
+    tz = branch.sales_rollups.tz
+    lower = datetime.combine(start, time(), tz)
+    upper = datetime.combine(end + timedelta(days=1), time(), tz)
     
-    return orders
+    filename = f"orders-{start.isoformat()}-{end.isoformat()}.{format}" + (".gz" if gzip else "")
+    return StreamingResponse(
+        export_stream(_orders_between(branch.branch_id, lower, upper), format, compress=gzip),
+        media_type="application/gzip" if gzip else MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
+async def _archived_order(branch_id: str, order_id: str) -> Optional[dict]:
+    archived = await order_archive.find_order(order_id)
+    # Orders archived before branches existed have no branch_id
+    if archived is None or archived.get("branch_id", DEFAULT_BRANCH_ID) != branch_id:
+        return None
+    return archived
 
 @api_router.get("/orders/{order_id}", response_model=Order)
-async def get_order(order_id: str):
-    order = await db.orders.find_one({"id": order_id}, {"_id": 0})
+async def get_order(order_id: str, branch: BranchState = Depends(current_branch)):
+    order = await db.orders.find_one({"id": order_id, "branch_id": branch.branch_id}, ORDER_PROJECTION)
+    if not order:
+        archived = await _archived_order(branch.branch_id, order_id)
+        order = archived and {field: archived[field] for field in ORDER_PROJECTION if field in archived}
     
     if not order:
         raise HTTPException(status_code=404, detail="Order not found")
     
-    if isinstance(order['timestamp'], str):
-        order['timestamp'] = datetime.fromisoformat(order['timestamp'])
-    
-    return Order(**order)
+    return FastJSONResponse({**ORDER_DEFAULTS, **order})
 
 
 # ==================== NOTIFICATION ROUTES ====================
 
 @api_router.get("/notifications", response_model=List[Notification])
-async def get_notifications():
-    notifications = await db.notifications.find({}, {"_id": 0}).sort("timestamp", -1).to_list(1000)
+async def get_notifications(
+    limit: int = Query(PAGE_SIZE_DEFAULT, ge=1, le=PAGE_SIZE_MAX),
+    before: Optional[str] = None,
+    branch: BranchState = Depends(current_branch),
+):
+    query = keyset_query({"branch_id": branch.branch_id}, before)
+    notifications = await db.notifications.find(query, NOTIFICATION_PROJECTION).sort(KEYSET_SORT).limit(limit).to_list(limit)
+    
+    headers = {NEXT_CURSOR_HEADER: encode_cursor(notifications[-1])} if len(notifications) == limit else None
+    return trusted_response(notifications, NOTIFICATION_DEFAULTS, headers)
+
+@api_router.get("/notifications/stream")
+async def stream_notifications(
+    request: Request,
+    last_event_id: Optional[str] = None,
+    branch: BranchState = Depends(current_branch),
+):
+    last_event_id = request.headers.get("last-event-id") or last_event_id
     
-    for notif in notifications:
-        if isinstance(notif['timestamp'], str):
-            notif['timestamp'] = datetime.fromisoformat(notif['timestamp'])
+    async def events():
+        yield "retry: 3000\n\n"
+        async for event in branch.notification_bus.subscribe(last_event_id):
+            if await request.is_disconnected():
+                break
+            yield format_sse(event)
     
-    return notifications
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@api_router.websocket("/notifications/ws")
+async def notifications_socket(websocket: WebSocket, last_event_id: Optional[str] = None):
+    try:
+        branch = await branches.get(request_branch_id(websocket))
+    except KeyError:
+        raise WebSocketException(code=status.WS_1008_POLICY_VIOLATION, reason="Unknown branch")
+    await websocket.accept()
+    try:
+        async for event in branch.notification_bus.subscribe(last_event_id):
+            if event is None:
+                await websocket.send_text('{"event":"ping"}')
+                continue
+            event_id, event_type, data = event
+            await websocket.send_text(f'{{"id":"{event_id}","event":"{event_type}","data":{data}}}')
+    except WebSocketDisconnect:
+        pass
 
 @api_router.put("/notifications/{notification_id}/read")
-async def mark_notification_read(notification_id: str):
+async def mark_notification_read(notification_id: str, branch: BranchState = Depends(current_branch)):
     result = await db.notifications.update_one(
-        {"id": notification_id},
+        {"id": notification_id, "branch_id": branch.branch_id},
         {"$set": {"read": True}}
     )
     
     if result.matched_count == 0:
         raise HTTPException(status_code=404, detail="Notification not found")
     
+    if result.modified_count:
+        await unread_counter.add(branch.branch_id, -1)
+        branch.publish("read", {"ids": [notification_id]})
     return {"message": "Notification marked as read"}
 
+@api_router.put("/notifications/read")
+async def mark_notifications_read(criteria: NotificationReadBulk, branch: BranchState = Depends(current_branch)):
+    if criteria.ids is None and criteria.before is None and criteria.table_number is None:
+        raise HTTPException(status_code=400, detail="Specify ids, before or table_number")
+    
+    query = {"branch_id": branch.branch_id, "read": False}
+    if criteria.ids is not None:
+        query["id"] = {"$in": criteria.ids}
+    if criteria.before is not None:
+        query["timestamp"] = {"$lte": criteria.before}
+    if criteria.table_number is not None:
+        query["table_number"] = criteria.table_number
+    
+    result = await db.notifications.update_many(query, {"$set": {"read": True}})
+    
+    if result.modified_count:
+        await unread_counter.add(branch.branch_id, -result.modified_count)
+        branch.publish("read", criteria.model_dump(mode="json", exclude_none=True))
+    return {"message": "Notifications marked as read", "count": result.modified_count}
+
 @api_router.get("/notifications/unread/count")
-async def get_unread_count():
-    count = await db.notifications.count_documents({"read": False})
+async def get_unread_count(branch: BranchState = Depends(current_branch)):
+    count = await unread_counter.get(branch.branch_id)
     return {"count": count}
 
 
+# ==================== KITCHEN ROUTES ====================
+
+@api_router.get("/kitchen/stations")
+async def get_kitchen_stations(branch: BranchState = Depends(current_branch)):
+    return {"stations": branch.kitchen_queue.stations()}
+
+@api_router.get("/kitchen/queue")
+async def get_kitchen_queue(station: Optional[str] = None, branch: BranchState = Depends(current_branch)):
+    return FastJSONResponse(branch.kitchen_queue.snapshot(station))
+
+@api_router.get("/kitchen/stream")
+async def stream_kitchen_queue(
+    request: Request,
+    station: Optional[str] = None,
+    branch: BranchState = Depends(current_branch),
+):
+    kitchen_queue, kitchen_bus = branch.kitchen_queue, branch.kitchen_bus
+    key = station or ALL_STATIONS
+    
+    async def events():
+        yield "retry: 3000\n\n"
+        yield format_sse((f"{kitchen_bus.epoch}-0", "snapshot", kitchen_queue.snapshot(station).decode()))
+        async for event in kitchen_bus.subscribe():
+            if await request.is_disconnected():
+                break
+            if event is None:
+                yield format_sse(None)
+                continue
+            stations = json.loads(event[2])["stations"]
+            if key == ALL_STATIONS or key in stations or ALL_STATIONS in stations:
+                yield format_sse((event[0], "snapshot", kitchen_queue.snapshot(station).decode()))
+    
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+# ==================== ANALYTICS ROUTES ====================
+
+@api_router.get("/analytics/sales")
+async def get_sales_report(
+    group_by: str = Query("day", pattern=f"^({'|'.join(GROUP_BY)})$"),
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+    branch: BranchState = Depends(current_branch),
+):
+    end = end or datetime.now(branch.sales_rollups.tz).date()
+    start = start or end
+    if start > end:
+        raise HTTPException(status_code=400, detail="start must not be after end")
+    if end - start >= timedelta(days=ANALYTICS_MAX_DAYS):
+        raise HTTPException(status_code=400, detail=f"Reports cover at most {ANALYTICS_MAX_DAYS} days")
+    
+    return await branch.sales_rollups.report(start, end, group_by)
+
+
 # ==================== ROOT ROUTE ====================
 
 @api_router.get("/")
 async def root():
     return {"message": "Cafetaria API is running"}
 
+@api_router.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
 
-# Include the router in the main app
-app.include_router(api_router)
 
-app.add_middleware(
-    CORSMiddleware,
-    allow_credentials=True,
-    allow_origins=os.environ.get('CORS_ORIGINS', '*').split(','),
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
+# ==================== HEALTH ROUTES ====================
+
+# Set once warm-up has finished, cleared when shutdown begins
+ready = False
+READY_PING_TIMEOUT = float(os.environ.get('READY_PING_TIMEOUT_MS', '1000')) / 1000
+
+@api_router.get("/health/live")
+async def liveness():
+    """The process is up and serving; restart it only if this fails."""
+    return {"status": "ok"}
+
+@api_router.get("/health/ready")
+async def readiness():
+    """Send traffic here only once warm-up is done and while the database answers."""
+    if not ready:
+        return FastJSONResponse({"status": "starting"}, status_code=503)
+    try:
+        await asyncio.wait_for(db.command("ping"), READY_PING_TIMEOUT)
+    except Exception:
+        logger.warning("Readiness check could not ping the database", exc_info=True)
+        return FastJSONResponse({"status": "database unavailable"}, status_code=503)
+    return {"status": "ready"}
+
+
+# Gauges are summed over the branches loaded by this worker
+metrics.add_gauge("menu_cache_dishes", "Dishes held in the menu caches",
+                  lambda: sum(len(branch.menu_cache.dishes) for branch in branches.loaded()))
+metrics.add_gauge("kitchen_active_orders", "Orders in the kitchen queues",
+                  lambda: sum(len(branch.kitchen_queue) for branch in branches.loaded()))
+metrics.add_gauge("notification_stream_subscribers", "Open notification streams",
+                  lambda: sum(branch.notification_bus.subscriber_count for branch in branches.loaded()))
+if CART_CACHE:
+    metrics.add_gauge("cart_cache_sessions", "Session carts held in memory",
+                      lambda: sum(len(branch.carts) for branch in branches.loaded()))
+metrics.add_gauge("order_replays", "Checkouts answered with the order of an earlier request",
+                  lambda: order_requests.replayed if order_requests is not None else 0)
+if ORDER_GROUP_COMMIT:
+    metrics.add_gauge("order_ingest_queue_depth", "Orders waiting for group commit",
+                      lambda: order_ingest.depth() if order_ingest is not None else 0)
 
 # Configure logging
 logging.basicConfig(
@@ -339,6 +1025,89 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-@app.on_event("shutdown")
-async def shutdown_db_client():
-    client.close()
+async def warm_up():
+    """Everything a worker does before it reports ready."""
+    await db.command("ping")
+    # Workers only ensure and verify indexes. Data migrations (branch backfill,
+    # cart dedupe, timestamp conversion) scan whole collections, so they run
+    # once per deploy with `python indexes.py`, or here with RUN_MIGRATIONS=1;
+    # a worker started on data they have not run on fails here.
+    await bootstrap_database(
+        db,
+        migrate=os.environ.get('RUN_MIGRATIONS', '0') == '1',
+        cart_ttl_seconds=int(os.environ.get('CART_TTL_SECONDS', DEFAULT_CART_TTL_SECONDS)),
+    )
+    await order_numbers.init()
+    
+    global use_transactions
+    mode = os.environ.get('CHECKOUT_TRANSACTIONS', 'auto')
+    if mode == 'auto':
+        hello = await db.client.admin.command("hello")
+        use_transactions = "setName" in hello or hello.get("msg") == "isdbgrid"
+    else:
+        use_transactions = mode == 'on'
+    logger.info("Checkout transactions %s", "enabled" if use_transactions else "disabled")
+    
+    await unread_counter.init(BRANCHES)
+    unread_counter.start()
+    
+    recovered = await recover_pending_checkouts()
+    if recovered:
+        logger.warning("Recovered %d partially written checkouts", recovered)
+    
+    if order_ingest is not None:
+        order_ingest.start()
+    if notification_changes is not None:
+        notification_changes.start()
+    
+    # Prefetch the menu and kitchen queue; other branches load on their first request
+    await branches.get(BRANCHES[0])
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    global ready
+    started = perf_counter()
+    connect_database()
+    try:
+        await warm_up()
+        ready = True
+        logger.info("Ready in %.0f ms", (perf_counter() - started) * 1000)
+        yield
+    finally:
+        ready = False
+        await close_database()
+
+
+def create_app() -> FastAPI:
+    """The ASGI app, for `uvicorn server:create_app --factory`.
+
+    Building it only creates the image store's directory; the lifespan
+    connects to the database and warms up before the server accepts requests.
+    """
+    app = FastAPI(default_response_class=FastJSONResponse, lifespan=lifespan)
+    app.include_router(api_router)
+    # Local content-addressed images and their size variants, served under /images
+    app.state.image_store = store_from_env(ROOT_DIR)
+    app.mount("/images", ImageFiles(directory=app.state.image_store.root), name="images")
+    app.add_middleware(
+        CORSMiddleware,
+        allow_credentials=True,
+        allow_origins=os.environ.get('CORS_ORIGINS', '*').split(','),
+        allow_methods=["*"],
+        allow_headers=["*"],
+        expose_headers=["ETag", NEXT_CURSOR_HEADER, BRANCH_HEADER, REPLAYED_HEADER],
+    )
+    app.add_middleware(MetricsMiddleware, metrics=metrics)
+    return app
+
+
+_app: Optional[FastAPI] = None
+
+def __getattr__(name: str):
+    # `uvicorn server:app` keeps working; the app is built on first access rather than at import
+    global _app
+    if name != "app":
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    if _app is None:
+        _app = create_app()
+    return _app
@@ -0,0 +1,44 @@
+import os
+
+
+# STORAGE_ENGINE=mongo (default) talks to MONGO_URL through Motor;
+# STORAGE_ENGINE=memory keeps everything in this process, for local runs and
+# load tests without any services.
+ENGINES = ("mongo", "memory")
+
+# Connection pool settings read from the environment (milliseconds for
+# timeouts); unset ones keep the driver defaults
+POOL_SETTINGS = {
+    "MONGO_MAX_POOL_SIZE": "maxPoolSize",
+    "MONGO_MIN_POOL_SIZE": "minPoolSize",
+    "MONGO_MAX_IDLE_MS": "maxIdleTimeMS",
+    "MONGO_CONNECT_TIMEOUT_MS": "connectTimeoutMS",
+    "MONGO_SERVER_SELECTION_TIMEOUT_MS": "serverSelectionTimeoutMS",
+    "MONGO_WAIT_QUEUE_TIMEOUT_MS": "waitQueueTimeoutMS",
+}
+
+
+def pool_options() -> dict:
+    return {option: int(os.environ[name]) for name, option in POOL_SETTINGS.items() if os.environ.get(name)}
+
+
+def connect(engine: str = None, event_listeners=()):
+    """Return `(client, db)` for the configured storage engine.
+
+    Engines are imported here rather than at module level, so importing the
+    API does not pay for the driver it is not going to use.
+    """
+    engine = engine or os.environ.get('STORAGE_ENGINE', 'mongo')
+    if engine == "memory":
+        from memory_engine import MemoryClient
+
+        client = MemoryClient(event_listeners=event_listeners)
+    elif engine == "mongo":
+        from motor.motor_asyncio import AsyncIOMotorClient
+
+        client = AsyncIOMotorClient(
+            os.environ['MONGO_URL'], tz_aware=True, event_listeners=list(event_listeners), **pool_options()
+        )
+    else:
+        raise ValueError(f"Unknown STORAGE_ENGINE {engine!r}, expected one of {', '.join(ENGINES)}")
+    return client, client[os.environ.get('DB_NAME', 'cafetaria')]
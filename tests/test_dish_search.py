@@ -0,0 +1,85 @@
+from dish_search import DishIndex
+
+
+def dish(dish_id, name, description="", category="Coffee", price=50.0, is_popular=False):
+    return {"id": dish_id, "name": name, "description": description, "category": category,
+            "price": price, "is_popular": is_popular}
+
+
+DISHES = [
+    dish("espresso", "Espresso", "Strong black coffee"),
+    dish("cappuccino", "Cappuccino", "Espresso with steamed milk foam", is_popular=True),
+    dish("iced", "Iced Coffee", "Chilled coffee with milk", price=60.0),
+    dish("cookie", "Chocolate Cookie", "Baked with dark chocolate chips", category="Cookies", price=30.0),
+    dish("pizza", "Margherita Pizza", "Tomato, mozzarella and basil", category="Pizza", price=100.0,
+         is_popular=True),
+    dish("creme", "Crème Brûlée", "Vanilla custard", category="Dessert", price=80.0),
+]
+
+
+def make_index(dishes=DISHES):
+    index = DishIndex()
+    index.sync(dishes)
+    return index
+
+
+def names(results):
+    return [result["id"] for result in results]
+
+
+def test_name_matches_rank_above_description_matches():
+    # "espresso" is the name of one dish and in the description of another
+    assert names(make_index().search("espresso")) == ["espresso", "cappuccino"]
+
+
+def test_tiers_count_matching_name_terms():
+    index = make_index()
+    # Both terms in the name beat one in the name and one in the description
+    assert names(index.search("iced coffee")) == ["iced"]
+    assert names(index.search("coffee")) == ["iced", "espresso"]
+    assert names(index.search("chocolate")) == ["cookie"]
+
+
+def test_popular_first_within_a_tier():
+    assert names(make_index().search("milk")) == ["cappuccino", "iced"]
+
+
+def test_prefix_matches():
+    assert names(make_index().search("capp")) == ["cappuccino"]
+    assert names(make_index().search("choc coo")) == ["cookie"]
+
+
+def test_typos_within_one_edit():
+    index = make_index()
+    assert names(index.search("cappucino")) == ["cappuccino"]
+    assert names(index.search("margerita")) == ["pizza"]
+    assert names(index.search("chocolatte")) == ["cookie"]
+
+
+def test_short_terms_need_an_exact_or_prefix_match():
+    assert names(make_index().search("piz")) == ["pizza"]
+    assert make_index().search("pza") == []
+
+
+def test_accents_and_case_are_folded():
+    assert names(make_index().search("CREME brulee")) == ["creme"]
+
+
+def test_filters_and_sorts():
+    index = make_index()
+    assert names(index.search(category="Coffee", sort="price_desc")) == ["iced", "cappuccino", "espresso"]
+    assert names(index.search(min_price=60, max_price=100, sort="price_asc")) == ["iced", "creme", "pizza"]
+    assert names(index.search(popular=True, sort="name")) == ["cappuccino", "pizza"]
+    assert names(index.search(sort="name", limit=2, offset=1)) == ["cookie", "creme"]
+
+
+def test_sync_applies_changes():
+    index = make_index()
+    index.search("cookie")
+    renamed = [d for d in DISHES if d["id"] != "espresso"] + [dish("cookie", "Oatmeal Biscuit", category="Cookies")]
+    index.sync([d for d in renamed if d is not DISHES[3]])
+    assert len(index) == 5
+    assert index.search("espresso", sort="name") == index.search("espresso")
+    assert names(index.search("espresso")) == ["cappuccino"]
+    assert index.search("chocolate") == []
+    assert names(index.search("biscuit")) == ["cookie"]
@@ -0,0 +1,136 @@
+import asyncio
+import uuid
+
+import pytest
+
+from idempotency import (IdempotencyStore, KeyReused, OutcomeUnknown, RequestInProgress, cart_key, items_key,
+                         request_fingerprint)
+from memory_engine import MemoryClient
+
+
+class Orders:
+    """A store over an in-memory database whose `create()` counts the orders it places."""
+
+    def __init__(self, **kwargs):
+        self.db = MemoryClient()["test"]
+        self.placed = {}
+        self.store = IdempotencyStore(self.db, self.fetch, **kwargs)
+
+    async def fetch(self, order_id):
+        return self.placed.get(order_id)
+
+    def create(self, fail=None, delay=0.0):
+        async def create():
+            await asyncio.sleep(delay)
+            order = {"id": str(uuid.uuid4())}
+            if fail is OutcomeUnknown:
+                raise OutcomeUnknown(order["id"], TimeoutError("timed out"))
+            if fail is not None:
+                raise fail
+            self.placed[order["id"]] = order
+            return order
+        return create
+
+    async def run(self, key, fingerprint="f", ttl=60.0, **kwargs):
+        return await self.store.run(key, fingerprint, ttl, self.create(**kwargs))
+
+
+def test_retry_replays_the_first_order():
+    async def check():
+        orders = Orders()
+        first, replayed = await orders.run("k")
+        assert not replayed
+        # A fresh store (another worker) finds it in the database
+        other = IdempotencyStore(orders.db, orders.fetch)
+        again, replayed = await other.run("k", "f", 60.0, orders.create())
+        assert replayed and again == first
+        assert len(orders.placed) == 1
+    asyncio.run(check())
+
+
+def test_concurrent_duplicates_place_one_order():
+    async def check():
+        orders = Orders()
+        results = await asyncio.gather(*[orders.run("k", delay=0.01) for _ in range(5)])
+        assert len(orders.placed) == 1
+        assert {order["id"] for order, _ in results} == set(orders.placed)
+        assert sorted(replayed for _, replayed in results) == [False, True, True, True, True]
+        assert orders.store.replayed == 4
+    asyncio.run(check())
+
+
+def test_failure_releases_the_key():
+    async def check():
+        orders = Orders()
+        with pytest.raises(ValueError):
+            await orders.run("k", fail=ValueError("menu changed"))
+        assert await orders.db.idempotency_keys.count_documents({}) == 0
+        order, replayed = await orders.run("k")
+        assert not replayed and list(orders.placed) == [order["id"]]
+    asyncio.run(check())
+
+
+def test_unknown_outcome_keeps_the_key_on_the_order():
+    async def check():
+        orders = Orders()
+        with pytest.raises(OutcomeUnknown) as error:
+            await orders.run("k", fail=OutcomeUnknown)
+        record = await orders.db.idempotency_keys.find_one({"_id": "k"})
+        assert record["order_id"] == error.value.order_id
+
+        # The write did land after all: the retry gets that order
+        orders.placed[error.value.order_id] = {"id": error.value.order_id}
+        other = IdempotencyStore(orders.db, orders.fetch)
+        order, replayed = await other.run("k", "f", 60.0, orders.create())
+        assert replayed and order["id"] == error.value.order_id
+
+        # It did not: the retry places the order
+        with pytest.raises(OutcomeUnknown):
+            await orders.run("lost", fail=OutcomeUnknown)
+        order, replayed = await IdempotencyStore(orders.db, orders.fetch).run("lost", "f", 60.0, orders.create())
+        assert not replayed and order["id"] in orders.placed
+    asyncio.run(check())
+
+
+def test_key_reused_for_a_different_request():
+    async def check():
+        orders = Orders()
+        await orders.run("k", fingerprint="table 3")
+        with pytest.raises(KeyReused):
+            await orders.run("k", fingerprint="table 4")
+        with pytest.raises(KeyReused):
+            await IdempotencyStore(orders.db, orders.fetch).run("k", "table 4", 60.0, orders.create())
+    asyncio.run(check())
+
+
+def test_open_claim_is_in_progress_until_its_lease_ends():
+    async def check():
+        orders = Orders(lease=0.05)
+        other = IdempotencyStore(orders.db, orders.fetch, lease=0.05)
+        slow = asyncio.create_task(orders.run("k", delay=0.2))
+        await asyncio.sleep(0.01)
+        with pytest.raises(RequestInProgress):
+            await other.run("k", "f", 60.0, orders.create())
+        await asyncio.sleep(0.06)
+        # The first claim looks abandoned now, so the key is taken over
+        order, replayed = await other.run("k", "f", 60.0, orders.create())
+        assert not replayed
+        await slow
+    asyncio.run(check())
+
+
+def test_aliases_replay_the_same_order():
+    async def check():
+        orders = Orders()
+        order, _ = await orders.store.run("k", "f", 60.0, orders.create(), aliases=["alias"])
+        again, replayed = await IdempotencyStore(orders.db, orders.fetch).run("alias", "f", 60.0, orders.create())
+        assert replayed and again == order
+    asyncio.run(check())
+
+
+def test_keys():
+    assert cart_key("s", ["b", "a"]) == cart_key("s", ["a", "b"]) != cart_key("s", ["a"])
+    lines = [{"dish_id": "tea", "quantity": 1}, {"dish_id": "tea", "quantity": 1}, {"dish_id": "cake", "quantity": 0}]
+    assert items_key("s", lines) == items_key("s", [{"dish_id": "tea", "quantity": 2}])
+    assert items_key("s", lines) != items_key("t", lines)
+    assert request_fingerprint("s", 3) != request_fingerprint("s", 4)
@@ -0,0 +1,113 @@
+import asyncio
+import random
+
+from pymongo import ASCENDING, IndexModel
+
+from memory_engine import MemoryClient, matches
+
+
+def make_collection(docs, indexes=()):
+    collection = MemoryClient()["test"]["items"]
+
+    async def load():
+        if indexes:
+            await collection.create_indexes(list(indexes))
+        if docs:
+            await collection.insert_many(docs)
+
+    asyncio.run(load())
+    return collection
+
+
+def ids(docs):
+    return sorted(doc["_id"] for doc in docs)
+
+
+def test_plan_uses_id():
+    collection = make_collection([{"_id": i, "n": i} for i in range(100)])
+    assert list(collection._plan({"_id": 7})) == [7]
+    assert sorted(collection._plan({"_id": {"$in": [3, 5, 500]}})) == [3, 5]
+
+
+def test_plan_uses_longest_equality_prefix():
+    docs = [{"_id": i, "branch_id": f"b{i % 2}", "session_id": f"s{i % 10}", "dish_id": f"d{i % 3}"}
+            for i in range(300)]
+    index = IndexModel([("branch_id", ASCENDING), ("session_id", ASCENDING), ("dish_id", ASCENDING)], name="bsd")
+    collection = make_collection(docs, [index])
+
+    # Only the leading field pinned: half the collection
+    assert len(collection._plan({"branch_id": "b1"})) == 150
+    # Two fields pinned, the third a range: the two-field prefix answers
+    query = {"branch_id": "b1", "session_id": "s3", "dish_id": {"$gt": "d0"}}
+    assert len(collection._plan(query)) == 30
+    # A gap in the prefix stops it
+    assert len(collection._plan({"branch_id": "b0", "dish_id": "d1"})) == 150
+    # Leading field not pinned: no index applies
+    assert collection._plan({"session_id": "s3"}) is None
+
+
+def test_plan_expands_in():
+    docs = [{"_id": i, "branch_id": f"b{i % 4}", "status": ["pending", "served"][i % 2]} for i in range(100)]
+    index = IndexModel([("branch_id", ASCENDING), ("status", ASCENDING)], name="branch_status")
+    collection = make_collection(docs, [index])
+    query = {"branch_id": {"$in": ["b0", "b1"]}, "status": "pending"}
+    assert ids(collection._scan(query)) == [i for i in range(100) if i % 4 == 0]
+    # b0 only holds pending orders and b1 only served ones, so the index narrows to b0's 25
+    assert len(collection._plan(query)) == 25
+
+
+def test_plan_picks_fewest_candidates():
+    docs = [{"_id": i, "kind": "a" if i < 90 else "b", "day": i % 50} for i in range(100)]
+    collection = make_collection(docs, [
+        IndexModel([("kind", ASCENDING)], name="kind"),
+        IndexModel([("day", ASCENDING)], name="day"),
+    ])
+    assert sorted(collection._plan({"kind": "a", "day": 3})) == [3, 53]
+
+
+def test_plan_skips_multikey_and_sparse_indexes():
+    docs = [{"_id": 1, "tags": ["a", "b"]}, {"_id": 2, "tags": "a"}, {"_id": 3, "flag": True}]
+    collection = make_collection(docs, [
+        IndexModel([("tags", ASCENDING)], name="tags"),
+        IndexModel([("flag", ASCENDING)], name="flag", sparse=True),
+    ])
+    assert collection._plan({"tags": "a"}) is None
+    assert ids(collection._scan({"tags": "a"})) == [1, 2]
+    assert collection._plan({"flag": True}) is None
+
+
+def test_indexed_results_match_a_full_scan():
+    rng = random.Random(3)
+    docs = [
+        {"_id": i, "branch_id": rng.choice("xyz"), "session_id": rng.choice("abcdef"),
+         "timestamp": rng.randrange(1000), "status": rng.choice(["pending", "ready", "served"])}
+        for i in range(2000)
+    ]
+    collection = make_collection(docs, [
+        IndexModel([("branch_id", ASCENDING), ("session_id", ASCENDING), ("timestamp", ASCENDING)], name="bst"),
+        IndexModel([("branch_id", ASCENDING), ("status", ASCENDING)], name="bs"),
+    ])
+    queries = [
+        {"branch_id": "x"},
+        {"branch_id": "y", "session_id": "c"},
+        {"branch_id": "z", "session_id": {"$in": ["a", "f"]}, "timestamp": {"$lt": 500}},
+        {"branch_id": {"$in": ["x", "y"]}, "status": "pending"},
+        {"branch_id": "x", "status": {"$in": ["ready", "served"]}, "session_id": "b"},
+        {"_id": {"$in": [5, 10, 4000]}, "branch_id": "x"},
+        {"session_id": "a", "timestamp": {"$gte": 900}},
+    ]
+    for query in queries:
+        assert ids(collection._scan(query)) == ids(doc for doc in docs if matches(doc, query)), query
+
+
+def test_index_follows_updates_and_deletes():
+    index = IndexModel([("branch_id", ASCENDING), ("session_id", ASCENDING)], name="bs")
+    collection = make_collection([{"_id": i, "branch_id": "b", "session_id": f"s{i}"} for i in range(10)], [index])
+
+    async def change():
+        await collection.update_one({"_id": 1}, {"$set": {"session_id": "s2"}})
+        await collection.delete_one({"_id": 2})
+        return await collection.find({"branch_id": "b", "session_id": "s2"}).to_list(None)
+
+    assert ids(asyncio.run(change())) == [1]
+    assert collection._plan({"branch_id": "b", "session_id": "s1"}) == {}
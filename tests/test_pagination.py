@@ -0,0 +1,38 @@
+from datetime import datetime, timezone
+
+import pytest
+from fastapi import HTTPException
+
+from pagination import decode_cursor, encode_cursor, keyset_query
+
+
+def test_cursor_round_trip():
+    timestamp = datetime(2026, 3, 14, 12, 30, 5, 250000, tzinfo=timezone.utc)
+    cursor = encode_cursor({"timestamp": timestamp, "id": "order|1"})
+    assert "=" not in cursor
+    assert decode_cursor(cursor) == (timestamp, "order|1")
+
+
+def test_cursor_from_legacy_string_timestamp():
+    cursor = encode_cursor({"timestamp": "2025-11-02T08:15:00.123456", "id": "legacy"})
+    assert decode_cursor(cursor) == (datetime(2025, 11, 2, 8, 15, 0, 123456), "legacy")
+
+    cursor = encode_cursor({"timestamp": "2025-11-02T08:15:00+00:00", "id": "legacy"})
+    assert decode_cursor(cursor) == (datetime(2025, 11, 2, 8, 15, tzinfo=timezone.utc), "legacy")
+
+
+@pytest.mark.parametrize("cursor", ["not base64!", "bm8gc2VwYXJhdG9y", "bm90LWEtZGF0ZXxpZA"])
+def test_invalid_cursor_is_a_400(cursor):
+    with pytest.raises(HTTPException) as error:
+        decode_cursor(cursor)
+    assert error.value.status_code == 400
+
+
+def test_keyset_query():
+    timestamp = datetime(2026, 1, 1, tzinfo=timezone.utc)
+    query = {"branch_id": "main"}
+    assert keyset_query(query, None) is query
+    assert keyset_query(query, encode_cursor({"timestamp": timestamp, "id": "b"})) == {
+        "branch_id": "main",
+        "$or": [{"timestamp": {"$lt": timestamp}}, {"timestamp": timestamp, "id": {"$lt": "b"}}],
+    }
@@ -0,0 +1,125 @@
+import asyncio
+import logging
+import time
+from typing import Dict, Iterable, Optional
+
+
+logger = logging.getLogger(__name__)
+
+UNREAD_COUNTER_ID = "notifications_unread"
+
+
+def _counter_id(branch_id: str) -> str:
+    return f"{UNREAD_COUNTER_ID}:{branch_id}"
+
+
+class UnreadCounter:
+    """Unread-notification counts per branch, kept in `db.counters` instead of counted.
+
+    Writers adjust the branch's shared document with `$inc` as notifications
+    are inserted or marked read. Reads come from memory and re-read the single
+    counter document at most every `refresh_interval` seconds, so changes made
+    by other workers show up quickly. A periodic `reconcile()` recounts the
+    collection to correct drift from writes that failed halfway.
+    """
+
+    def __init__(self, db, refresh_interval: float = 1.0, reconcile_interval: float = 300.0):
+        self.db = db
+        self.refresh_interval = refresh_interval
+        self.reconcile_interval = reconcile_interval
+        self._values: Dict[str, int] = {}
+        self._fetched_at: Dict[str, float] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    async def init(self, branch_ids: Iterable[str]):
+        branch_ids = list(branch_ids)
+        ids = [_counter_id(branch_id) for branch_id in branch_ids]
+        if await self.db.counters.count_documents({"_id": {"$in": ids}}) < len(ids):
+            await self.reconcile(branch_ids)
+
+    async def add(self, branch_id: str, delta: int):
+        if not delta:
+            return
+        await self.db.counters.update_one({"_id": _counter_id(branch_id)}, {"$inc": {"value": delta}}, upsert=True)
+        self._values[branch_id] = max(0, self._values.get(branch_id, 0) + delta)
+
+    async def get(self, branch_id: str) -> int:
+        if time.monotonic() - self._fetched_at.get(branch_id, float("-inf")) > self.refresh_interval:
+            doc = await self.db.counters.find_one({"_id": _counter_id(branch_id)})
+            self._values[branch_id] = max(0, doc["value"]) if doc else 0
+            self._fetched_at[branch_id] = time.monotonic()
+        return self._values[branch_id]
+
+    async def _recount(self, branch_ids) -> Dict[str, int]:
+        counts: Dict[str, int] = dict.fromkeys(branch_ids, 0)
+        pipeline = [{"$match": {"read": False}}, {"$group": {"_id": "$branch_id", "count": {"$sum": 1}}}]
+        async for row in self.db.notifications.aggregate(pipeline):
+            if row["_id"] is not None and (not branch_ids or row["_id"] in counts):
+                counts[row["_id"]] = row["count"]
+        return counts
+
+    async def reconcile(self, branch_ids: Iterable[str] = (), attempts: int = 3) -> Dict[str, int]:
+        """Recount every branch with notifications or a counter, plus `branch_ids`.
+
+        A recount is only written if the counter still holds the value read
+        before counting; a branch whose counter moved meanwhile (an `$inc`
+        that the recount may or may not include) is counted again, up to
+        `attempts` times, and otherwise left to the next run. Checkouts add to
+        the counter after their commit, so one landing just after the write is
+        counted twice until the next reconcile.
+        """
+        branch_ids = set(branch_ids)
+        counts: Dict[str, int] = {}
+        retry = None
+        for _ in range(attempts):
+            existing = self.db.counters.find({"_id": {"$regex": f"^{UNREAD_COUNTER_ID}:"}})
+            before = {doc["_id"].split(":", 1)[1]: doc["value"] async for doc in existing}
+            if retry is None:
+                # Branches whose unread notifications are all gone drop to zero
+                wanted = branch_ids | set(before)
+                recount = await self._recount(())
+                wanted |= set(recount)
+                recount = {branch_id: recount.get(branch_id, 0) for branch_id in wanted}
+            else:
+                recount = await self._recount(retry)
+            retry = []
+            now = time.monotonic()
+            for branch_id, count in recount.items():
+                if branch_id in before:
+                    result = await self.db.counters.update_one(
+                        {"_id": _counter_id(branch_id), "value": before[branch_id]}, {"$set": {"value": count}}
+                    )
+                    written = result.matched_count > 0
+                else:
+                    result = await self.db.counters.update_one(
+                        {"_id": _counter_id(branch_id)}, {"$setOnInsert": {"value": count}}, upsert=True
+                    )
+                    written = result.upserted_id is not None
+                if not written:
+                    retry.append(branch_id)
+                    continue
+                counts[branch_id] = count
+                self._values[branch_id] = count
+                self._fetched_at[branch_id] = now
+            if not retry:
+                break
+        if retry:
+            logger.info("Unread counters kept changing during reconcile: %s", ", ".join(retry))
+        return counts
+
+    async def _reconcile_forever(self):
+        while True:
+            await asyncio.sleep(self.reconcile_interval)
+            try:
+                await self.reconcile()
+            except Exception:
+                logger.exception("Unread counter reconciliation failed")
+
+    def start(self):
+        if self.reconcile_interval > 0 and self._task is None:
+            self._task = asyncio.create_task(self._reconcile_forever())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None